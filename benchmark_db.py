@@ -0,0 +1,555 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+数据库性能基准测试
+用法:
+    python benchmark_db.py              # 运行全部基准
+    python benchmark_db.py connection   # 只运行指定基准
+"""
+
+import sys
+import os
+import time
+import sqlite3
+import shutil
+import asyncio
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database.db_manager import BloodReservationDB, PERFORMANCE_PROFILES
+from database.column_store import ReservationColumnStore, HAS_NUMPY
+from database.async_db import AsyncBloodReservationDB
+from database import data_generator
+
+
+SAMPLE_ROWS = [
+    ("光谷院区", "红细胞", "悬浮红细胞", "A型", 2.0),
+    ("中法院区", "血小板", "单采血小板", "B型", 1.0),
+    ("军山院区", "新鲜冰冻血浆", "", "O型", 200.0),
+    ("光谷院区", "红细胞", "辐照红细胞", "AB型", 1.5),
+]
+
+
+def make_rows(count, start=None):
+    """生成count条测试记录（时间按分钟递增）"""
+    start = start or datetime(2024, 1, 1, 8, 0, 0)
+    rows = []
+    for i in range(count):
+        campus, product_type, subtype, blood_type, quantity = SAMPLE_ROWS[i % len(SAMPLE_ROWS)]
+        reservation_time = (start + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S")
+        rows.append((campus, product_type, subtype, blood_type, quantity, reservation_time))
+    return rows
+
+
+def report(name, seconds, calls):
+    """输出单项结果（每次调用的平均耗时）"""
+    per_call_us = seconds / calls * 1e6 if calls else 0.0
+    print(f"  {name:<36} {calls:>8} 次  总计 {seconds * 1000:>9.1f} ms  平均 {per_call_us:>9.1f} µs/次")
+    return per_call_us
+
+
+class UncachedDB(BloodReservationDB):
+    """不使用查询结果缓存，重复调用时测量的是查询本身"""
+    RESULT_CACHE_SIZE = 0
+
+
+def bench_connection(workdir, calls=2000):
+    """连接复用：每次调用新建连接 vs 长连接"""
+    print(f"\n[connection] 每次调用耗时对比 ({calls} 次)")
+    db_path = os.path.join(workdir, "bench_connection.db")
+
+    with BloodReservationDB(db_path) as db:
+        for row in make_rows(100):
+            db.add_reservation(*row)
+
+        # 旧实现：每次调用 sqlite3.connect -> 查询 -> close
+        start = time.perf_counter()
+        for i in range(calls):
+            conn = sqlite3.connect(db_path)
+            conn.execute(
+                "SELECT id, hospital_campus, blood_product_type, blood_product_subtype, "
+                "blood_type, quantity, reservation_time FROM reservations WHERE id = ?",
+                (i % 100 + 1,)
+            ).fetchone()
+            conn.close()
+        before = report("get_reservation_by_id (每次新建连接)", time.perf_counter() - start, calls)
+
+        # 新实现：线程本地长连接
+        start = time.perf_counter()
+        for i in range(calls):
+            db.get_reservation_by_id(i % 100 + 1)
+        after = report("get_reservation_by_id (长连接)", time.perf_counter() - start, calls)
+
+    if after:
+        print(f"  => 加速 {before / after:.1f}x")
+
+
+def bench_bulk_insert(workdir, rows=100000, per_row_sample=10000):
+    """批量写入：逐行 add_reservation vs add_reservations"""
+    print(f"\n[bulk_insert] 写入 {rows} 条记录")
+    data = make_rows(rows)
+
+    # 逐行提交每行一次 fsync，完整跑 10 万行太慢，按样本推算
+    sample = data[:min(rows, per_row_sample)]
+    with BloodReservationDB(os.path.join(workdir, "bench_per_row.db")) as db:
+        start = time.perf_counter()
+        for row in sample:
+            db.add_reservation(*row)
+        per_row = report("add_reservation (逐行提交)", time.perf_counter() - start, len(sample))
+
+    with BloodReservationDB(os.path.join(workdir, "bench_bulk.db")) as db:
+        start = time.perf_counter()
+        ids = db.add_reservations(data)
+        elapsed = time.perf_counter() - start
+        bulk = report("add_reservations (单事务批量)", elapsed, len(ids))
+
+    print(f"  逐行写入 {rows} 条预计 {per_row * rows / 1e6:.1f} s，批量写入实际 {elapsed:.2f} s")
+    if bulk:
+        print(f"  => 加速 {per_row / bulk:.1f}x")
+
+
+def bench_streaming(workdir, rows=200000):
+    """读取峰值内存：get_all_reservations vs iter_reservations"""
+    print(f"\n[streaming] 遍历 {rows} 条记录的峰值内存")
+
+    with BloodReservationDB(os.path.join(workdir, "bench_streaming.db")) as db:
+        db.add_reservations(make_rows(rows))
+
+        tracemalloc.start()
+        count = sum(1 for _ in db.get_all_reservations())
+        _, peak_all = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"  {'get_all_reservations':<36} {count:>8} 行  峰值 {peak_all / 1024 / 1024:>8.1f} MB")
+
+        tracemalloc.start()
+        count = sum(1 for _ in db.iter_reservations(batch_size=1000))
+        _, peak_iter = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"  {'iter_reservations':<36} {count:>8} 行  峰值 {peak_iter / 1024 / 1024:>8.1f} MB")
+
+
+def bench_pagination(workdir, rows=500000, page_size=100, calls=200):
+    """分页：OFFSET 翻到深页 vs 键集分页"""
+    print(f"\n[pagination] {rows} 条记录，每页 {page_size} 条")
+
+    with UncachedDB(os.path.join(workdir, "bench_pagination.db")) as db:
+        db.add_reservations(make_rows(rows))
+        deep_offset = rows - page_size * 2
+
+        for label, offset in (("第1页", 0), ("深页", deep_offset)):
+            start = time.perf_counter()
+            for _ in range(calls):
+                db.query_reservations(limit=page_size, offset=offset)
+            report(f"OFFSET 分页 ({label})", time.perf_counter() - start, calls)
+
+        # 键集分页：先取得深页位置的令牌，再测量从该令牌读取一页的耗时
+        _, first_token = db.get_reservations_page(page_size)
+        deep_id = db.query_reservations(limit=1, offset=deep_offset - 1)[0][0]
+        deep_token = db._encode_page_token("id", (deep_id,))
+
+        for label, token in (("第2页", first_token), ("深页", deep_token)):
+            start = time.perf_counter()
+            for _ in range(calls):
+                db.get_reservations_page(page_size, token)
+            report(f"键集分页 ({label})", time.perf_counter() - start, calls)
+
+
+def bench_aggregate(workdir, rows=500000, calls=5):
+    """统计：拉取全表后在 Python 中计数 vs SQL GROUP BY"""
+    print(f"\n[aggregate] {rows} 条记录按院区统计")
+
+    with UncachedDB(os.path.join(workdir, "bench_aggregate.db")) as db:
+        db.add_reservations(make_rows(rows))
+
+        start = time.perf_counter()
+        for _ in range(calls):
+            counts = {}
+            for record in db.get_all_reservations():
+                counts[record[1]] = counts.get(record[1], 0) + 1
+        report("Python 计数 (get_all_reservations)", time.perf_counter() - start, calls)
+
+        for use_rollup, label in ((False, "原始表"), (True, "按日汇总表")):
+            start = time.perf_counter()
+            for _ in range(calls):
+                db.aggregate(["campus"], measures=["count"], use_rollup=use_rollup)
+            report(f"aggregate(campus, count) {label}", time.perf_counter() - start, calls)
+
+            start = time.perf_counter()
+            for _ in range(calls):
+                db.aggregate(["day"], filters={"start": "2024-01-01", "end": "2024-03-31"},
+                             use_rollup=use_rollup)
+            report(f"aggregate(day, 一季度) {label}", time.perf_counter() - start, calls)
+
+
+def bench_profiles(workdir, rows=200000, writes=300):
+    """性能配置：后台线程持续读全表时，逐条提交的写入延迟"""
+    print(f"\n[profiles] {rows} 条记录，读线程持续遍历全表时逐条提交 {writes} 条")
+
+    for name in PERFORMANCE_PROFILES:
+        with BloodReservationDB(os.path.join(workdir, f"bench_profile_{name}.db"), profile=name) as db:
+            db.add_reservations(make_rows(rows))
+            new_rows = make_rows(writes, start=datetime(2025, 1, 1, 8, 0, 0))
+
+            stop = threading.Event()
+            scans = []
+
+            def read_loop():
+                while not stop.is_set():
+                    scans.append(sum(1 for _ in db.iter_reservations(batch_size=1000)))
+
+            reader = threading.Thread(target=read_loop)
+            reader.start()
+            latencies = []
+            try:
+                for row in new_rows:
+                    start = time.perf_counter()
+                    db.add_reservation(*row)
+                    latencies.append(time.perf_counter() - start)
+            finally:
+                stop.set()
+                reader.join()
+
+            latencies.sort()
+            total = sum(latencies)
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print(f"  {name:<10} ({db.journal_mode}) 写入 {writes / total:>7.0f} 次/s  "
+                  f"平均 {total / writes * 1000:>6.2f} ms  P99 {p99 * 1000:>7.2f} ms  "
+                  f"最大 {latencies[-1] * 1000:>7.2f} ms  同期全表读取 {len(scans)} 次")
+
+
+def bench_group_commit(workdir, clerks=8, per_clerk=50):
+    """组提交：多个线程同时逐条提交，add_reservation vs 写入线程组提交（durable 配置）"""
+    print(f"\n[group_commit] {clerks} 个线程各提交 {per_clerk} 条")
+    rows = make_rows(per_clerk)
+
+    def run(db, submit):
+        latencies = []
+        lock = threading.Lock()
+
+        def clerk():
+            for row in rows:
+                start = time.perf_counter()
+                submit(db, row)
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=clerk) for _ in range(clerks)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        return elapsed, latencies
+
+    cases = (
+        ("add_reservation (每条一个事务)", lambda db, row: db.add_reservation(*row), False),
+        ("submit_reservation (组提交)", lambda db, row: db.submit_reservation(*row).result(), True),
+    )
+    for index, (label, submit, use_writer) in enumerate(cases):
+        with BloodReservationDB(os.path.join(workdir, f"bench_group_{index}.db"), profile="durable") as db:
+            if use_writer:
+                db.start_writer()
+            elapsed, latencies = run(db, submit)
+            total = clerks * per_clerk
+            groups = f"  共 {db.writer_stats['groups']} 个事务" if use_writer else ""
+            print(f"  {label:<32} {total / elapsed:>7.0f} 条/s  "
+                  f"平均等待 {sum(latencies) / total * 1000:>6.2f} ms  最大 {latencies[-1] * 1000:>7.2f} ms{groups}")
+
+
+def bench_encoding(workdir, rows=1000000, calls=3):
+    """字典编码：同样的数据在编码前（v4，字符串列）和编码后的文件大小与扫描耗时"""
+    print(f"\n[encoding] {rows} 条记录，字典编码前后对比")
+
+    class V4DB(BloodReservationDB):
+        """只执行到字典编码之前的迁移"""
+        MIGRATIONS = BloodReservationDB.MIGRATIONS[:4]
+        SCHEMA_VERSION = 4
+
+    plain_path = os.path.join(workdir, "bench_plain.db")
+    encoded_path = os.path.join(workdir, "bench_encoded.db")
+
+    V4DB(plain_path, profile="compat").close()
+    conn = sqlite3.connect(plain_path)
+    conn.executemany(
+        "INSERT INTO reservations (hospital_campus, blood_product_type, blood_product_subtype, "
+        "blood_type, quantity, reservation_time) VALUES (?, ?, ?, ?, ?, ?)",
+        make_rows(rows)
+    )
+    conn.commit()
+    conn.close()
+
+    shutil.copy(plain_path, encoded_path)
+    BloodReservationDB(encoded_path, profile="compat", progress_callback=lambda *args: None).close()
+
+    # (说明, 编码前执行的SQL, 编码后的执行方式)；编码前的 SQL 与编码前的
+    # get_all_reservations / aggregate（原始记录，不用按日汇总表）生成的语句相同
+    unit = "CASE WHEN blood_product_type = '新鲜冰冻血浆' THEN 'ml' ELSE '单位' END"
+    cases = (
+        ("全表读取",
+         "SELECT id, hospital_campus, blood_product_type, blood_product_subtype, "
+         "blood_type, quantity, reservation_time FROM reservations ORDER BY id DESC",
+         lambda db: db.get_all_reservations()),
+        ("按血型统计（无索引）",
+         f"SELECT {unit} AS g_unit, COUNT(*), TOTAL(quantity) FROM reservations "
+         "WHERE blood_type = 'O型' GROUP BY g_unit ORDER BY g_unit",
+         lambda db: db.aggregate(filters={"blood_type": "O型"}, use_rollup=False)),
+        ("按院区、血型分组",
+         "SELECT hospital_campus, blood_type, COUNT(*) FROM reservations GROUP BY 1, 2 ORDER BY 1, 2",
+         lambda db: db.aggregate(["campus", "blood_type"], measures=["count"], use_rollup=False)),
+    )
+
+    sizes = {}
+    for label, path in (("编码前", plain_path), ("编码后", encoded_path)):
+        conn = sqlite3.connect(path)
+        conn.execute("VACUUM")
+        conn.close()
+        sizes[label] = os.path.getsize(path)
+        print(f"  {label} 文件大小 {sizes[label] / 1024 / 1024:>8.1f} MB")
+    print(f"  => 文件缩小 {(1 - sizes['编码后'] / sizes['编码前']) * 100:.0f}%")
+
+    conn = sqlite3.connect(plain_path)
+    with UncachedDB(encoded_path, profile="compat") as db:
+        for name, sql, encoded in cases:
+            conn.execute(sql).fetchall()  # 预热页缓存
+            start = time.perf_counter()
+            for _ in range(calls):
+                conn.execute(sql).fetchall()
+            before = report(f"编码前 {name}", time.perf_counter() - start, calls)
+
+            encoded(db)
+            start = time.perf_counter()
+            for _ in range(calls):
+                encoded(db)
+            after = report(f"编码后 {name}", time.perf_counter() - start, calls)
+            print(f"  => {before / after:.2f}x")
+    conn.close()
+
+
+def bench_result_cache(workdir, rows=200000, calls=50):
+    """查询结果缓存：列表窗口反复应用相同筛选（院区+日期范围及数量合计）"""
+    print(f"\n[result_cache] {rows} 条记录，重复相同筛选 {calls} 次")
+    path = os.path.join(workdir, "bench_result_cache.db")
+    filters = {"campus": "光谷院区", "start": "2024-01-01", "end": "2024-01-07"}
+
+    def apply_filter(db):
+        db.query_reservations(**filters)
+        db.aggregate(filters=filters, measures=["sum_quantity"])
+
+    with BloodReservationDB(path) as db:
+        db.add_reservations(make_rows(rows))
+
+    timings = {}
+    for label, db_class in (("不缓存", UncachedDB), ("缓存", BloodReservationDB)):
+        with db_class(path) as db:
+            start = time.perf_counter()
+            for _ in range(calls):
+                apply_filter(db)
+            timings[label] = report(f"筛选+合计 ({label})", time.perf_counter() - start, calls)
+            if label == "缓存":
+                print(f"  命中 {db.result_cache_stats['hits']} 次，未命中 {db.result_cache_stats['misses']} 次")
+    print(f"  => {timings['不缓存'] / timings['缓存']:.1f}x")
+
+
+def bench_column_store(workdir, rows=500000, calls=5):
+    """列式内存快照：内存占用，以及筛选/排序/汇总与 SQL 查询的耗时对比"""
+    print(f"\n[column_store] {rows} 条记录，NumPy {'可用' if HAS_NUMPY else '不可用（纯 Python）'}")
+
+    with UncachedDB(os.path.join(workdir, "bench_column_store.db")) as db:
+        db.add_reservations(make_rows(rows))
+
+        tracemalloc.start()
+        records = db.get_all_reservations()
+        tuples_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del records
+
+        start = time.perf_counter()
+        store = ReservationColumnStore(db)
+        print(f"  建立快照 {(time.perf_counter() - start) * 1000:.0f} ms")
+        print(f"  记录元组列表 {tuples_bytes / 1024 / 1024:>8.1f} MB  列式快照 {store.nbytes() / 1024 / 1024:>8.1f} MB")
+
+        filters = {"campus": "光谷院区", "start": "2024-03-01", "end": "2024-03-31"}
+        cases = (
+            ("院区+日期筛选",
+             lambda: db.query_reservations(**filters),
+             lambda: store.filter(**filters)),
+            ("院区+日期筛选后按数量排序",
+             lambda: sorted(db.query_reservations(**filters), key=lambda row: row[5], reverse=True),
+             lambda: store.sort(store.filter(**filters), by="quantity")),
+            ("按院区、血型汇总（全表）",
+             lambda: db.aggregate(["campus", "blood_type"], use_rollup=False),
+             lambda: store.aggregate(["campus", "blood_type"])),
+        )
+        for name, sql, columnar in cases:
+            start = time.perf_counter()
+            for _ in range(calls):
+                sql()
+            before = report(f"SQL {name}", time.perf_counter() - start, calls)
+            start = time.perf_counter()
+            for _ in range(calls):
+                columnar()
+            after = report(f"列式 {name}", time.perf_counter() - start, calls)
+            print(f"  => {before / after:.1f}x")
+
+        db.add_reservations(make_rows(100, start=datetime(2025, 1, 1)))
+        start = time.perf_counter()
+        store.refresh()
+        report("增量更新 100 条新增", time.perf_counter() - start, 1)
+
+
+def bench_async(workdir, requests=1000, interval=0.001):
+    """asyncio 接口：1000 个协程同时提交时的事件循环延迟，在循环中直接调用 vs AsyncBloodReservationDB"""
+    print(f"\n[async] {requests} 个协程同时逐条提交（durable 配置），每 {interval * 1000:.0f} ms 检查一次事件循环延迟")
+    rows = make_rows(requests)
+
+    async def measure_lag(stop, lags):
+        loop = asyncio.get_running_loop()
+        while not stop.is_set():
+            start = loop.time()
+            await asyncio.sleep(interval)
+            lags.append(loop.time() - start - interval)
+
+    async def run(submit):
+        stop = asyncio.Event()
+        lags = []
+        ticker = asyncio.create_task(measure_lag(stop, lags))
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        await asyncio.gather(*(submit(row) for row in rows))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await ticker
+        lags.sort()
+        return elapsed, lags
+
+    async def blocking():
+        with BloodReservationDB(os.path.join(workdir, "bench_async_0.db"), profile="durable") as db:
+            async def submit(row):
+                db.add_reservation(*row)
+            return await run(submit)
+
+    async def facade():
+        async with AsyncBloodReservationDB(os.path.join(workdir, "bench_async_1.db"), profile="durable") as db:
+            return await run(lambda row: db.add_reservation(*row))
+
+    for label, case in (("循环中直接调用 add_reservation", blocking), ("AsyncBloodReservationDB", facade)):
+        elapsed, lags = asyncio.run(case())
+        p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))] if lags else 0.0
+        worst = lags[-1] if lags else 0.0
+        print(f"  {label:<32} {requests / elapsed:>7.0f} 条/s  "
+              f"循环延迟 P99 {p99 * 1000:>7.2f} ms  最大 {worst * 1000:>7.2f} ms  采样 {len(lags)} 次")
+
+
+def bench_search(workdir, rows=1000000, calls=20):
+    """全文检索：逐行 LIKE 扫描 vs FTS5 索引；以及索引对批量写入耗时和文件大小的影响"""
+    print(f"\n[search] {rows} 条记录，每项检索 {calls} 次（最多取 100 条）")
+    data = make_rows(rows)
+
+    class NoSearchDB(UncachedDB):
+        """不建立检索索引（v6）"""
+        MIGRATIONS = BloodReservationDB.MIGRATIONS[:6]
+        SCHEMA_VERSION = 6
+
+    paths = {}
+    for label, db_class in (("无检索索引", NoSearchDB), ("FTS5 索引", UncachedDB)):
+        paths[label] = os.path.join(workdir, f"bench_search_{len(paths)}.db")
+        with db_class(paths[label]) as db:
+            start = time.perf_counter()
+            db.add_reservations(data)
+            elapsed = time.perf_counter() - start
+        size = os.path.getsize(paths[label]) / 1024 / 1024
+        print(f"  {label:<12} 批量写入 {elapsed:>6.2f} s  文件 {size:>7.1f} MB")
+
+    fields = "hospital_campus || ' ' || blood_product_type || ' ' || COALESCE(blood_product_subtype, '') " \
+             "|| ' ' || blood_type || ' ' || reservation_time"
+    with UncachedDB(paths["FTS5 索引"]) as db:
+        conn = db._get_connection()
+        for text in ("辐照 AB 光谷", "辐照 AB 光谷 2024-03-15", "东院"):
+            terms = text.split()
+            like_sql = (f"SELECT * FROM reservations WHERE "
+                        + " AND ".join(f"({fields}) LIKE ?" for _ in terms)
+                        + " ORDER BY id DESC LIMIT 100")
+            like_params = [f"%{term}%" for term in terms]
+            start = time.perf_counter()
+            for _ in range(calls):
+                expected = conn.execute(like_sql, like_params).fetchall()
+            before = report(f"LIKE 扫描 \"{text}\"", time.perf_counter() - start, calls)
+
+            start = time.perf_counter()
+            for _ in range(calls):
+                found = db.search(text)
+            after = report(f"search \"{text}\"", time.perf_counter() - start, calls)
+            assert [row[0] for row in found] == [row[0] for row in expected]
+            print(f"  => {len(found)} 条，{before / after:.0f}x")
+
+
+def bench_generate(workdir, rows=200000, generated=1000000):
+    """测试数据生成：同样的生成数据用 add_reservations vs bulk_load 写入，以及生成器整体速度"""
+    print(f"\n[generate] {rows} 条生成数据的写入耗时；生成 {generated} 条的总耗时")
+    data = list(data_generator.generate_rows(rows, seed=1))
+    for label, load in (("add_reservations", lambda db: db.add_reservations(data)),
+                        ("bulk_load", lambda db: db.bulk_load(data)),
+                        ("bulk_load 不建检索索引", lambda db: db.bulk_load(data, build_search_index=False))):
+        with BloodReservationDB(os.path.join(workdir, f"bench_generate_{label}.db"),
+                                profile=data_generator.LOAD_PROFILE) as db:
+            start = time.perf_counter()
+            load(db)
+            report(label, time.perf_counter() - start, rows)
+
+    path = os.path.join(workdir, "bench_generate.db")
+    start = time.perf_counter()
+    data_generator.fill_database(path, generated, seed=1)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(path) / 1024 / 1024
+    print(f"  fill_database {generated} 条: {elapsed:.1f} s，文件 {size:.0f} MB")
+    with BloodReservationDB(path, profile=data_generator.LOAD_PROFILE) as db:
+        start = time.perf_counter()
+        db.rebuild_search_index()
+    print(f"  之后建立检索索引: {time.perf_counter() - start:.1f} s")
+
+
+BENCHMARKS = {
+    "connection": bench_connection,
+    "bulk_insert": bench_bulk_insert,
+    "streaming": bench_streaming,
+    "pagination": bench_pagination,
+    "aggregate": bench_aggregate,
+    "profiles": bench_profiles,
+    "group_commit": bench_group_commit,
+    "encoding": bench_encoding,
+    "result_cache": bench_result_cache,
+    "column_store": bench_column_store,
+    "async": bench_async,
+    "search": bench_search,
+    "generate": bench_generate,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="血制品预约数据库性能基准测试")
+    parser.add_argument("names", nargs="*", help=f"要运行的基准（可选: {', '.join(BENCHMARKS)}）")
+    args = parser.parse_args()
+
+    names = args.names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"未知基准: {', '.join(unknown)}")
+
+    print("=" * 60)
+    print("血制品预约系统 - 数据库性能基准测试")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in names:
+            BENCHMARKS[name](workdir)
+
+
+if __name__ == "__main__":
+    main()
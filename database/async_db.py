@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+数据库的 asyncio 接口
+所有数据库操作在一个专用线程中执行，事件循环只等待结果，不会被提交时的 fsync 阻塞。
+请求队列有上限：排队的请求达到上限时，新的调用在事件循环中等待（背压），
+而不是无限堆积。连续排队的单条提交合并为一个事务（组提交）。
+"""
+
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future
+
+from database.db_manager import BloodReservationDB
+
+
+class AsyncBloodReservationDB:
+    """BloodReservationDB 的 asyncio 接口
+
+    用法:
+        async with AsyncBloodReservationDB("records.db") as db:
+            record_id = await db.add_reservation(...)
+            rows = await db.query_reservations(campus="光谷院区")
+    """
+
+    def __init__(self, db_path="records.db", max_pending=1000, max_group=100, **db_options):
+        """打开数据库并启动数据库线程
+
+        Args:
+            db_path: 数据库文件路径
+            max_pending: 最多排队的请求数，超过时调用方等待
+            max_group: 一个事务最多合并的单条提交数
+            db_options: 传给 BloodReservationDB 的其他参数（如 profile）
+        """
+        if max_pending < 1:
+            raise ValueError("max_pending 必须大于0")
+        self.db = BloodReservationDB(db_path, **db_options)
+        self.max_pending = max_pending
+        self.max_group = max_group
+        # 排队的请求数由 _slots 限制（被取消的请求释放名额后仍留在队列中，
+        # 队列本身不设上限，避免 put_nowait 失败）
+        self._queue = queue.Queue()
+        self._slots = asyncio.Semaphore(max_pending)
+        self._closed = False
+        self.stats = {"requests": 0, "max_queued": 0}
+        self._thread = threading.Thread(target=self._run, name="db-async", daemon=True)
+        self._thread.start()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    # ---------- 数据库线程 ----------
+
+    def _run(self):
+        """数据库线程：依次执行请求，连续的单条提交合并为一个事务"""
+        # 与 start_writer 相同：结果返回时记录已落盘
+        self.db._get_connection().execute("PRAGMA synchronous = FULL")
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            # 一并取出已经排队的请求
+            while len(batch) < self.max_group:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    # 关闭前已排队的请求照常执行
+                    stopping = True
+                    break
+                batch.append(item)
+            self._execute(batch)
+
+    def _execute(self, batch):
+        """按顺序执行一批请求；相邻的单条提交用 commit_group 在一个事务中写入"""
+        group = []
+        for method, args, kwargs, future in batch:
+            if method is None:
+                group.append((args, future))
+                continue
+            if group:
+                self._commit_group(group)
+                group = []
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(getattr(self.db, method)(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+        if group:
+            self._commit_group(group)
+
+    def _commit_group(self, group):
+        """组提交一批单条提交；意外异常只让这一组的请求失败，数据库线程继续运行"""
+        try:
+            self.db.commit_group(group)
+        except Exception as e:
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+
+    # ---------- 事件循环一侧 ----------
+
+    async def _call(self, method, *args, **kwargs):
+        """把请求交给数据库线程并等待结果；method 为 None 表示参与组提交的单条提交"""
+        if self._closed:
+            raise RuntimeError("数据库已关闭")
+        # 排队的请求达到上限时在这里等待，事件循环不阻塞
+        async with self._slots:
+            if self._closed:
+                raise RuntimeError("数据库已关闭")
+            future = Future()
+            self._queue.put_nowait((method, args, kwargs, future))
+            self.stats["requests"] += 1
+            self.stats["max_queued"] = max(self.stats["max_queued"], self._queue.qsize())
+            return await asyncio.wrap_future(future)
+
+    async def add_reservation(self, campus, product_type, subtype, blood_type, quantity, reservation_time):
+        """提交一条预约记录，返回记录ID（与其他并发提交合并为一个事务）"""
+        return await self._call(None, campus, product_type, subtype, blood_type, quantity, reservation_time)
+
+    async def add_reservations(self, rows, chunk_size=5000):
+        """批量写入预约记录（单个事务），见 BloodReservationDB.add_reservations"""
+        # 先在调用方取出全部行，生成器不会在数据库线程中被消费
+        return await self._call("add_reservations", list(rows), chunk_size)
+
+    async def query_reservations(self, **filters):
+        """按条件查询预约记录，参数见 BloodReservationDB.query_reservations"""
+        return await self._call("query_reservations", **filters)
+
+    async def search(self, text, filters=None, limit=100):
+        """全文检索预约记录，见 BloodReservationDB.search"""
+        return await self._call("search", text, filters, limit)
+
+    async def get_reservation_by_id(self, res_id):
+        """根据ID获取预约记录"""
+        return await self._call("get_reservation_by_id", res_id)
+
+    async def get_reservations_page(self, page_size=100, token=None, filters=None, order_by="id"):
+        """按键集分页读取预约记录，见 BloodReservationDB.get_reservations_page"""
+        return await self._call("get_reservations_page", page_size, token, filters, order_by)
+
+    async def aggregate(self, group_by=(), filters=None, measures=("count", "sum_quantity"),
+                        use_rollup=True):
+        """在数据库中分组汇总，见 BloodReservationDB.aggregate"""
+        return await self._call("aggregate", group_by, filters, measures, use_rollup)
+
+    async def delete_reservation(self, res_id):
+        """删除指定ID的预约记录"""
+        return await self._call("delete_reservation", res_id)
+
+    async def delete_reservations(self, ids, chunk_size=500):
+        """在一个事务中删除多条预约记录，见 BloodReservationDB.delete_reservations"""
+        return await self._call("delete_reservations", list(ids), chunk_size)
+
+    async def delete_range(self, filters):
+        """删除符合筛选条件的全部预约记录，见 BloodReservationDB.delete_range"""
+        return await self._call("delete_range", filters)
+
+    async def clear_all_reservations(self, truncate=False):
+        """清空所有预约记录，见 BloodReservationDB.clear_all_reservations"""
+        return await self._call("clear_all_reservations", truncate)
+
+    async def close(self):
+        """执行完已排队的请求后停止数据库线程并关闭数据库"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put_nowait(None)
+        await asyncio.to_thread(self._thread.join)
+        self.db.close()
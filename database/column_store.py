@@ -0,0 +1,437 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+预约记录的列式内存快照
+院区、血制品、血型以字典编号、预约时间以整数时间戳、数量以浮点数分别存放在
+array 缓冲区中（每条记录约 40 字节，而不是一个约 100+ 字节的 Python 元组），
+在内存中完成筛选、排序和分组汇总；安装了 NumPy 时这些操作按列向量化执行。
+通过变更日志（get_changes_since）增量保持与数据库一致。
+"""
+
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from datetime import date, datetime, timedelta
+from itertools import compress
+
+from database.db_manager import BloodReservationDB, PLASMA_PRODUCT_TYPE
+
+try:
+    import numpy
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+
+class ReservationColumnStore:
+    """全部预约记录（reservation_records 及各归档库）的列式内存快照
+
+    行按 id 升序存放；删除只做标记，删除标记超过 1/4 时整体压缩。
+    筛选返回行位置数组，排序、汇总和取出记录都以行位置数组为输入。
+    """
+
+    # 分组/排序维度 -> 编码列属性名及字典表位置（与 BloodReservationDB._LOOKUP_COLUMNS 顺序一致）
+    _CATEGORIES = {
+        "campus": ("campus", 0),
+        "product_type": ("product_type", 1),
+        "subtype": ("subtype", 2),
+        "blood_type": ("blood_type", 3),
+    }
+
+    # 排序维度 -> 数值列属性名
+    _NUMERIC_KEYS = {
+        "id": "ids",
+        "time": "epoch",
+        "quantity": "quantity",
+    }
+
+    # 读取 reservation_records 的列（亚类为空时编号记为 0）
+    _SELECT_SQL = '''
+        SELECT id, campus_id, product_type_id, COALESCE(subtype_id, 0), blood_type_id,
+               quantity, reservation_epoch
+        FROM reservation_records'''
+
+    # 读取一个归档库的列：归档库按名称存放，按字典表换回编号（字典值只增不删）；
+    # 与合并查询相同，主库中仍有的记录（归档中断）以主库为准
+    _SELECT_ARCHIVE_SQL = '''
+        SELECT archived.id, campuses.id, product_types.id, COALESCE(product_subtypes.id, 0),
+               blood_types.id, archived.quantity, archived.reservation_epoch
+        FROM {schema}.reservations AS archived
+        JOIN main.campuses ON campuses.name = archived.hospital_campus
+        JOIN main.product_types ON product_types.name = archived.blood_product_type
+        LEFT JOIN main.product_subtypes ON product_subtypes.name = archived.blood_product_subtype
+        JOIN main.blood_types ON blood_types.name = archived.blood_type
+        WHERE NOT EXISTS (SELECT 1 FROM main.reservation_records AS current
+                          WHERE current.id = archived.id)'''
+
+    def __init__(self, db, batch_size=10000):
+        """从数据库一次性建立快照
+
+        Args:
+            db: BloodReservationDB 实例
+            batch_size: 建立快照时每次 fetchmany 的行数
+        """
+        self.db = db
+        self.batch_size = batch_size
+        self.build()
+
+    def _reset(self):
+        """清空所有列"""
+        self.ids = array("q")
+        self.campus = array("i")
+        self.product_type = array("i")
+        self.subtype = array("i")
+        self.blood_type = array("i")
+        self.epoch = array("q")
+        self.quantity = array("d")
+        self.alive = bytearray()
+        self.deleted = 0
+
+    def build(self):
+        """从只读快照重新读取全部记录（包括已归档的记录，与 get_all_reservations 相同）
+
+        变更序号与记录在同一个读事务中取得。
+        """
+        self._reset()
+        with self.db.snapshot() as conn:
+            row = conn.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = 'reservation_changes'"
+            ).fetchone()
+            self.seq = row[0] if row else 0
+            self._load_names(conn)
+
+            columns = (self.ids, self.campus, self.product_type, self.subtype,
+                       self.blood_type, self.quantity, self.epoch)
+            # snapshot() 已附加全部归档库
+            selects = [self._SELECT_SQL] + [self._SELECT_ARCHIVE_SQL.format(schema=schema)
+                                            for _, schema in self.db._attach_archives(conn)]
+            cursor = conn.execute(" UNION ALL ".join(selects) + " ORDER BY id")
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                # 按列批量追加，避免逐个元素调用 append
+                for column, values in zip(columns, zip(*rows)):
+                    column.extend(values)
+                self.alive.extend(b"\x01" * len(rows))
+
+    def _load_names(self, conn):
+        """读取字典表：编号 -> 名称，以及反向的 名称 -> 编号"""
+        self.names = self.db._lookup_names(conn, refresh=True)
+        self.codes = tuple({name: code for code, name in names.items()} for names in self.names)
+
+    def refresh(self, limit=10000):
+        """应用上次建立/刷新之后的变更
+
+        Args:
+            limit: 变更超过该条数时直接重新建立快照
+
+        Returns:
+            int: 应用的变更条数；重新建立快照时为 -1
+        """
+        changes, seq = self.db.get_changes_since(self.seq, limit=limit)
+        if changes is None:
+            self.build()
+            return -1
+
+        for op, res_id, record in changes:
+            if op == "clear":
+                self._reset()
+                continue
+            index = self._position(res_id)
+            if record is None:
+                if index is not None and self.alive[index]:
+                    self.alive[index] = 0
+                    self.deleted += 1
+            elif index is not None:
+                self._store(index, record)
+            else:
+                self._insert(record)
+        self.seq = seq
+
+        if self.deleted > len(self.ids) // 4:
+            self._compact()
+        return len(changes)
+
+    def _position(self, res_id):
+        """记录ID对应的行位置（id 升序，二分查找），不存在时返回 None"""
+        index = bisect_left(self.ids, res_id)
+        if index < len(self.ids) and self.ids[index] == res_id:
+            return index
+        return None
+
+    def _code(self, category, name):
+        """字典名称 -> 编号；遇到快照之后登记的新名称时重新读取字典表"""
+        if name is None:
+            return 0
+        code = self.codes[category].get(name)
+        if code is None:
+            self._load_names(self.db._get_connection())
+            code = self.codes[category][name]
+        return code
+
+    def _encode(self, record):
+        """get_changes_since 返回的记录 -> 各列的值"""
+        res_id, campus, product_type, subtype, blood_type, quantity, reservation_time = record
+        epoch = BloodReservationDB._to_epoch(datetime.strptime(reservation_time, "%Y-%m-%d %H:%M:%S"))
+        return (res_id, self._code(0, campus), self._code(1, product_type), self._code(2, subtype),
+                self._code(3, blood_type), float(quantity), epoch)
+
+    def _columns(self):
+        return (self.ids, self.campus, self.product_type, self.subtype,
+                self.blood_type, self.quantity, self.epoch)
+
+    def _store(self, index, record):
+        """修改已有行（包括曾被标记删除的行）"""
+        for column, value in zip(self._columns(), self._encode(record)):
+            column[index] = value
+        if not self.alive[index]:
+            self.alive[index] = 1
+            self.deleted -= 1
+
+    def _insert(self, record):
+        """新增行：新 id 总是最大，通常直接追加到末尾"""
+        values = self._encode(record)
+        if not self.ids or values[0] > self.ids[-1]:
+            for column, value in zip(self._columns(), values):
+                column.append(value)
+            self.alive.append(1)
+        else:
+            index = bisect_left(self.ids, values[0])
+            for column, value in zip(self._columns(), values):
+                column.insert(index, value)
+            self.alive.insert(index, 1)
+
+    def _compact(self):
+        """去掉标记删除的行"""
+        alive = self.alive
+        for name in ("ids", "campus", "product_type", "subtype", "blood_type", "epoch", "quantity"):
+            column = getattr(self, name)
+            setattr(self, name, array(column.typecode, compress(column, alive)))
+        self.alive = bytearray(b"\x01" * len(self.ids))
+        self.deleted = 0
+
+    def __len__(self):
+        return len(self.ids) - self.deleted
+
+    def nbytes(self):
+        """各列缓冲区占用的字节数"""
+        return sum(column.itemsize * len(column) for column in self._columns()) + len(self.alive)
+
+    # ---------- 筛选 ----------
+
+    @staticmethod
+    def _epoch_range(start, end):
+        """日期/时间边界 -> 闭区间 (最小时间戳, 最大时间戳)，语义与 query_reservations 相同"""
+        def to_datetime(value):
+            if isinstance(value, datetime):
+                return value, False
+            if isinstance(value, date):
+                return datetime(value.year, value.month, value.day), True
+            value = str(value).strip()
+            if len(value) == 10:
+                return datetime.strptime(value, "%Y-%m-%d"), True
+            return datetime.strptime(value, "%Y-%m-%d %H:%M:%S"), False
+
+        low = high = None
+        if start:
+            low = BloodReservationDB._to_epoch(to_datetime(start)[0])
+        if end:
+            moment, whole_day = to_datetime(end)
+            if whole_day:
+                # 纯日期作为结束边界时包含当天全部记录
+                high = BloodReservationDB._to_epoch(moment + timedelta(days=1)) - 1
+            else:
+                high = BloodReservationDB._to_epoch(moment)
+        return low, high
+
+    def filter(self, campus=None, start=None, end=None, product_type=None, blood_type=None):
+        """按条件筛选，返回符合条件的行位置（按 id 升序）
+
+        参数与 BloodReservationDB.query_reservations 的筛选参数相同。
+        """
+        conditions = []
+        for name, value in (("campus", campus), ("product_type", product_type), ("blood_type", blood_type)):
+            if value:
+                attr, category = self._CATEGORIES[name]
+                code = self.codes[category].get(value)
+                if code is None:
+                    return array("q")
+                conditions.append((getattr(self, attr), code))
+        low, high = self._epoch_range(start, end)
+
+        if HAS_NUMPY:
+            mask = numpy.frombuffer(self.alive, dtype=numpy.uint8).astype(bool)
+            for column, code in conditions:
+                mask &= self._vector(column) == code
+            if low is not None:
+                mask &= self._vector(self.epoch) >= low
+            if high is not None:
+                mask &= self._vector(self.epoch) <= high
+            return numpy.flatnonzero(mask)
+
+        # 时间范围通常最能缩小结果，先在一次遍历中比较两个边界，再按字典编号筛选
+        positions = compress(range(len(self.ids)), self.alive)
+        epoch = self.epoch
+        if low is not None or high is not None:
+            low = -(1 << 62) if low is None else low
+            high = 1 << 62 if high is None else high
+            positions = [i for i in positions if low <= epoch[i] <= high]
+        for column, code in conditions:
+            positions = [i for i in positions if column[i] == code]
+        return array("q", positions)
+
+    @staticmethod
+    def _vector(column):
+        """列缓冲区的 NumPy 视图（不复制；只在单次操作内使用，不能跨越列的增删）"""
+        return numpy.frombuffer(column, dtype=column.typecode)
+
+    def _category_ranks(self, category):
+        """字典编号 -> 按名称排序后的名次（亚类编号 0 表示空，排在最前）"""
+        ordered = sorted(self.names[category], key=self.names[category].get)
+        ranks = {code: rank + 1 for rank, code in enumerate(ordered)}
+        ranks[0] = 0
+        return ranks
+
+    def sort(self, positions, by="id", descending=True):
+        """对行位置排序；排序键相同时按 id 同方向排列
+
+        Args:
+            positions: filter 返回的行位置
+            by: id、time、quantity，或 campus/product_type/subtype/blood_type（按名称）
+            descending: 是否倒序
+        """
+        if by in self._NUMERIC_KEYS:
+            column = getattr(self, self._NUMERIC_KEYS[by])
+            ranks = None
+        elif by in self._CATEGORIES:
+            name, category = self._CATEGORIES[by]
+            column = getattr(self, name)
+            ranks = self._category_ranks(category)
+        else:
+            raise ValueError(f"不支持的排序方式: {by}")
+
+        if HAS_NUMPY:
+            positions = numpy.asarray(positions, dtype=numpy.int64)
+            if descending:
+                positions = positions[::-1]
+            keys = self._vector(column)[positions]
+            if ranks is not None:
+                table = numpy.zeros(max(ranks) + 1, dtype=numpy.int64)
+                table[list(ranks)] = list(ranks.values())
+                keys = table[keys]
+            order = numpy.argsort(-keys if descending else keys, kind="stable")
+            return positions[order]
+
+        # 输入按 id 升序；倒序时先反转，稳定排序后相同键保持 id 倒序
+        if descending:
+            positions = reversed(positions)
+        if ranks is None:
+            key = column.__getitem__
+        else:
+            key = lambda i: ranks[column[i]]
+        return array("q", sorted(positions, key=key, reverse=descending))
+
+    # ---------- 汇总与取出记录 ----------
+
+    def aggregate(self, group_by=(), positions=None):
+        """分组统计记录数和数量合计，结果格式与 BloodReservationDB.aggregate 相同
+
+        Args:
+            group_by: 分组维度，可选 campus/product_type/subtype/blood_type/unit；
+                      与数据库汇总一样自动按 unit 分组，ml 和“单位”不会相加
+            positions: 参与统计的行位置，None 表示全部记录
+        """
+        group_by = list(group_by)
+        for name in group_by:
+            if name != "unit" and name not in self._CATEGORIES:
+                raise ValueError(f"不支持的分组维度: {name}")
+        if "unit" not in group_by:
+            group_by.append("unit")
+        plasma = self.codes[1].get(PLASMA_PRODUCT_TYPE)
+        units = ("单位", "ml")
+
+        def label(name, code):
+            if name == "unit":
+                return units[code]
+            category = self._CATEGORIES[name][1]
+            # 亚类为空（NULL）与空字符串显示相同
+            return self.names[category].get(code, "") if code else ""
+
+        # 先按编号组合分组，再换成名称合并
+        totals = {}
+        if HAS_NUMPY:
+            positions = numpy.asarray(self.filter() if positions is None else positions, dtype=numpy.int64)
+            key_columns = []
+            for name in group_by:
+                if name == "unit":
+                    key_columns.append((self._vector(self.product_type)[positions] == plasma).astype(numpy.int64))
+                else:
+                    key_columns.append(self._vector(getattr(self, self._CATEGORIES[name][0]))[positions]
+                                       .astype(numpy.int64))
+            # 字典编号都很小，把各维度编号按混合进制合成一个整数后用 bincount 计数，不需要排序
+            radices = [int(keys.max()) + 1 if len(keys) else 1 for keys in key_columns]
+            combined = numpy.zeros(len(positions), dtype=numpy.int64)
+            for keys, radix in zip(key_columns, radices):
+                combined = combined * radix + keys
+            counts = numpy.bincount(combined)
+            sums = numpy.bincount(combined, weights=self._vector(self.quantity)[positions])
+            for group in numpy.flatnonzero(counts):
+                value, codes = int(group), []
+                for radix in reversed(radices):
+                    value, code = divmod(value, radix)
+                    codes.append(code)
+                totals[tuple(reversed(codes))] = (int(counts[group]), float(sums[group]))
+        else:
+            # 取值和计数都由 map/zip/Counter 在 C 层完成：按 (各维度编号, 数量) 计数，
+            # 数量的取值很少（单位数、ml 数），合计时再乘以出现次数。
+            # unit 先按血制品大类编号分组，之后再换算成单位
+            columns = [self.product_type if name == "unit" else getattr(self, self._CATEGORIES[name][0])
+                       for name in group_by]
+            columns.append(self.quantity)
+            unit_index = group_by.index("unit")
+            if positions is None:
+                values = [compress(column, self.alive) for column in columns]
+            else:
+                values = [map(column.__getitem__, positions) for column in columns]
+            for key, count in Counter(zip(*values)).items():
+                codes = list(key[:-1])
+                codes[unit_index] = int(codes[unit_index] == plasma)
+                codes = tuple(codes)
+                merged_count, merged_total = totals.get(codes, (0, 0.0))
+                totals[codes] = (merged_count + count, merged_total + key[-1] * count)
+
+        merged = {}
+        for codes, (count, total) in totals.items():
+            key = tuple(label(name, code) for name, code in zip(group_by, codes))
+            merged_count, merged_total = merged.get(key, (0, 0.0))
+            merged[key] = (merged_count + count, merged_total + total)
+
+        result = []
+        for key in sorted(merged):
+            row = dict(zip(group_by, key))
+            row["count"], row["sum_quantity"] = merged[key]
+            result.append(row)
+        return result
+
+    def rows(self, positions):
+        """取出指定行，格式与 BloodReservationDB.get_all_reservations 相同
+
+        只为需要显示的行生成元组；预约时间由整数时间戳还原。
+        """
+        campuses, product_types, subtypes, blood_types = self.names
+        result = []
+        for i in positions:
+            i = int(i)
+            subtype = self.subtype[i]
+            result.append((
+                self.ids[i],
+                campuses[self.campus[i]],
+                product_types[self.product_type[i]],
+                subtypes[subtype] if subtype else None,
+                blood_types[self.blood_type[i]],
+                self.quantity[i],
+                time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(self.epoch[i])),
+            ))
+        return result
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试数据生成器
+按真实的院区、血制品、血型目录生成大量预约记录（用于压力测试、性能测试），
+院区/血制品/血型的分布偏斜程度、每天各时段的预约量可以配置。
+记录通过 BloodReservationDB.bulk_load 写入；检索索引默认不在导入时建立，
+由第一次检索自动重建（或加 --search-index 在导入后建立）。
+
+用法:
+    python -m database.data_generator records_test.db --rows 5000000
+"""
+
+import os
+import random
+import time
+from datetime import date, timedelta
+from itertools import islice
+
+from database.db_manager import BloodReservationDB, PERFORMANCE_PROFILES
+
+
+# 院区及预约量权重（选项与主界面一致）
+CAMPUS_WEIGHTS = {"光谷院区": 5, "中法院区": 3, "军山院区": 2}
+
+# 血制品大类 -> (权重, {亚类: 权重}, {数量: 权重})；
+# 红细胞、血小板的数量单位为“单位”，新鲜冰冻血浆为 ml（没有亚类）
+PRODUCT_CATALOG = {
+    "红细胞": (60,
+            {"悬浮红细胞": 60, "少白红细胞": 20, "辐照红细胞": 10, "洗涤红细胞": 8, "稀有血型红细胞": 2},
+            {1.0: 25, 1.5: 10, 2.0: 45, 3.0: 10, 4.0: 10}),
+    "血小板": (15,
+            {"单采血小板": 60, "辐照血小板": 25, "少白血小板": 15},
+            {1.0: 90, 2.0: 10}),
+    "新鲜冰冻血浆": (25,
+               {"": 1},
+               {100.0: 5, 200.0: 35, 300.0: 10, 400.0: 35, 600.0: 10, 800.0: 5}),
+}
+
+# ABO 血型在人群中的大致比例
+BLOOD_TYPE_WEIGHTS = {"O型": 34, "B型": 29, "A型": 28, "AB型": 9}
+
+# 0-23 点各小时的预约量权重：上午、下午上班时间集中，夜间只有急诊
+HOUR_WEIGHTS = (1, 1, 1, 1, 1, 1, 2, 5, 12, 14, 13, 10, 5, 6, 11, 12, 10, 7, 4, 3, 2, 2, 1, 1)
+
+# 周一至周日的预约量权重
+WEEKDAY_WEIGHTS = (1.0, 1.0, 1.0, 1.0, 0.95, 0.55, 0.45)
+
+# 每天的预约量在按星期、增长率计算的基础上随机浮动的范围
+DAILY_VARIATION = 0.2
+
+# 生成数据时使用的连接参数：回滚日志（单个大事务不必先写入 WAL 再检查点）、较大的页缓存
+LOAD_PROFILE = dict(PERFORMANCE_PROFILES["compat"], cache_size=-262144, temp_store="MEMORY")
+
+
+def _skewed(weights, skew):
+    """按偏斜程度调整权重：0 为均匀分布，1 为原始权重，大于 1 时更加集中"""
+    return [weight ** skew for weight in weights]
+
+
+def build_catalog(skew=1.0):
+    """列出所有 (院区, 大类, 亚类, 血型, 数量) 组合，返回 (组合列表, 累积权重)"""
+    combos = []
+    weights = []
+    campuses = list(CAMPUS_WEIGHTS)
+    blood_types = list(BLOOD_TYPE_WEIGHTS)
+    campus_weights = _skewed(CAMPUS_WEIGHTS.values(), skew)
+    blood_type_weights = _skewed(BLOOD_TYPE_WEIGHTS.values(), skew)
+    product_weights = _skewed([weight for weight, _, _ in PRODUCT_CATALOG.values()], skew)
+
+    for (product_type, (_, subtypes, quantities)), product_weight in zip(PRODUCT_CATALOG.items(), product_weights):
+        subtype_weights = _skewed(subtypes.values(), skew)
+        quantity_weights = _skewed(quantities.values(), skew)
+        # 大类内的亚类、数量权重归一化，大类之间的比例只由大类权重决定
+        subtype_total = sum(subtype_weights)
+        quantity_total = sum(quantity_weights)
+        for campus, campus_weight in zip(campuses, campus_weights):
+            for subtype, subtype_weight in zip(subtypes, subtype_weights):
+                for quantity, quantity_weight in zip(quantities, quantity_weights):
+                    for blood_type, blood_type_weight in zip(blood_types, blood_type_weights):
+                        combos.append((campus, product_type, subtype, blood_type, quantity))
+                        weights.append(campus_weight * product_weight * blood_type_weight
+                                       * subtype_weight / subtype_total * quantity_weight / quantity_total)
+
+    cum_weights = []
+    total = 0.0
+    for weight in weights:
+        total += weight
+        cum_weights.append(total)
+    return combos, cum_weights
+
+
+def generate_rows(count, start=None, days=730, skew=1.0, hour_weights=HOUR_WEIGHTS,
+                  weekday_weights=WEEKDAY_WEIGHTS, growth=0.1, seed=None):
+    """按时间顺序生成 count 条预约记录（行格式与 add_reservations 相同）
+
+    总量先按 天 x 小时 分配（星期、年增长率、每天随机浮动决定每天的量，hour_weights
+    决定一天内各小时的量），每小时内的时间均匀分布；院区、血制品、血型、数量
+    按 build_catalog(skew) 的权重抽取。
+
+    Args:
+        count: 记录数
+        start: 第一天（date），默认从今天往前 days 天
+        days: 覆盖的天数
+        skew: 分布偏斜程度，见 _skewed
+        hour_weights: 0-23 点各小时的权重（24 个数）
+        weekday_weights: 周一至周日的权重（7 个数）
+        growth: 预约量的年增长率
+        seed: 随机种子（相同参数和种子生成相同的数据）
+    """
+    if count < 0 or days < 1:
+        raise ValueError("count 不能为负数，days 必须大于0")
+    if len(hour_weights) != 24 or len(weekday_weights) != 7:
+        raise ValueError("hour_weights 应为 24 个数，weekday_weights 应为 7 个数")
+    if sum(hour_weights) <= 0:
+        raise ValueError("hour_weights 不能全为0")
+
+    rnd = random.Random(seed)
+    start = start or date.today() - timedelta(days=days)
+    combos, cum_weights = build_catalog(skew)
+    hour_times = [[f"{hour:02d}:{second // 60:02d}:{second % 60:02d}" for second in range(3600)]
+                  for hour in range(24)]
+
+    cells = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        day_weight = (weekday_weights[day.weekday()] * (1 + growth) ** (offset / 365)
+                      * rnd.uniform(1 - DAILY_VARIATION, 1 + DAILY_VARIATION))
+        prefix = day.isoformat() + " "
+        cells.extend((prefix, hour, day_weight * hour_weight)
+                     for hour, hour_weight in enumerate(hour_weights) if hour_weight > 0)
+    total = sum(weight for _, _, weight in cells)
+    if total <= 0:
+        raise ValueError("weekday_weights 不能全为0")
+
+    # 系统抽样：累计期望值取整后逐格相减，各格的数量等于期望值取整，总数正好为 count
+    offset = rnd.random()
+    expected = 0.0
+    allocated = 0
+    for index, (prefix, hour, weight) in enumerate(cells):
+        expected += weight * count / total
+        n = count - allocated if index == len(cells) - 1 else int(expected + offset) - allocated
+        if n <= 0:
+            continue
+        allocated += n
+        times = sorted(rnd.choices(hour_times[hour], k=n))
+        for combo, time_text in zip(rnd.choices(combos, cum_weights=cum_weights, k=n), times):
+            yield combo + (prefix + time_text,)
+
+
+def fill_database(db_path, count, chunk_size=50000, progress=None, build_search_index=False, **options):
+    """生成 count 条记录写入 db_path（文件不存在时新建），返回写入的记录数
+
+    options 传给 generate_rows。progress(已生成条数) 每生成 chunk_size 条调用一次。
+    检索索引约占导入时间的一半：build_search_index 为 False 时导入时不建立，
+    多次追加后由第一次 search 自动重建一次（见 BloodReservationDB.bulk_load）。
+    """
+    rows = generate_rows(count, **options)
+    if progress is not None:
+        rows = _report_every(rows, chunk_size, progress)
+    with BloodReservationDB(db_path, profile=LOAD_PROFILE) as db:
+        # 生成的数据已知有效，不逐行校验
+        return db.bulk_load(rows, chunk_size=chunk_size, validate=False, build_search_index=build_search_index)
+
+
+def _report_every(rows, step, progress):
+    """透传 rows，每 step 条调用一次 progress(已生成条数)"""
+    # 按 step 条分段透传，不逐行计数
+    rows = iter(rows)
+    done = 0
+    while True:
+        chunk = list(islice(rows, step))
+        yield from chunk
+        if len(chunk) < step:
+            return
+        done += step
+        progress(done)
+
+
+def main(argv=None):
+    """命令行入口"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="生成血制品预约测试数据")
+    parser.add_argument("db_path", help="数据库文件路径（已有记录时追加）")
+    parser.add_argument("--rows", type=int, default=1000000, help="记录数（默认 %(default)s）")
+    parser.add_argument("--days", type=int, default=730, help="覆盖的天数（默认 %(default)s）")
+    parser.add_argument("--start", type=date.fromisoformat, help="第一天 yyyy-mm-dd（默认从今天往前 --days 天）")
+    parser.add_argument("--skew", type=float, default=1.0,
+                        help="分布偏斜程度：0 为均匀，1 为实际比例，更大时更集中（默认 %(default)s）")
+    parser.add_argument("--hour-weights", type=lambda text: [float(value) for value in text.split(",")],
+                        default=HOUR_WEIGHTS, help="0-23 点各小时的权重，逗号分隔的 24 个数")
+    parser.add_argument("--growth", type=float, default=0.1, help="预约量的年增长率（默认 %(default)s）")
+    parser.add_argument("--seed", type=int, help="随机种子")
+    parser.add_argument("--search-index", action="store_true",
+                        help="导入后立即建立检索索引（默认在第一次检索时建立）")
+    args = parser.parse_args(argv)
+
+    start_time = time.perf_counter()
+
+    def progress(done):
+        print(f"  已生成 {done}/{args.rows} 条（{time.perf_counter() - start_time:.1f} 秒）")
+
+    count = fill_database(args.db_path, args.rows, chunk_size=max(50000, args.rows // 20), progress=progress,
+                          start=args.start, days=args.days, skew=args.skew, hour_weights=args.hour_weights,
+                          growth=args.growth, seed=args.seed)
+    size = os.path.getsize(args.db_path) / 1024 / 1024
+    print(f"[OK] 已写入 {count} 条记录到 {args.db_path}（{size:.0f} MB，{time.perf_counter() - start_time:.1f} 秒）")
+
+    if args.search_index:
+        start_time = time.perf_counter()
+        with BloodReservationDB(args.db_path, profile=LOAD_PROFILE) as db:
+            db.rebuild_search_index()
+        print(f"[OK] 检索索引已建立（{time.perf_counter() - start_time:.1f} 秒）")
+
+
+if __name__ == "__main__":
+    main()
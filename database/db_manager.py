@@ -1,70 +1,554 @@
 import sqlite3
 import os
-from datetime import datetime
+import json
+import base64
+import re
+import calendar
+import contextlib
+import queue
+import random
+import threading
+import time
+import urllib.parse
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta
+
+# 以 ml 计量的血制品大类（其他大类以“单位”计量）
+PLASMA_PRODUCT_TYPE = "新鲜冰冻血浆"
+
+# 预约时间格式：yyyy-MM-dd hh:mm:ss
+_TIME_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$")
+
+# 性能配置：连接参数（PRAGMA）及 WAL 检查点策略
+PERFORMANCE_PROFILES = {
+    # 早期版本的行为：回滚日志，读报表时会阻塞提交，每次提交完整 fsync
+    "compat": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+        "write_retries": 3,
+        "retry_backoff": 0.05,
+        "retry_backoff_max": 1.0,
+    },
+    # WAL：读写互不阻塞；synchronous=NORMAL 时只在检查点 fsync，
+    # 断电可能丢失最近几次提交，但不会损坏数据库
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,                   # 负数单位为 KiB，即 16 MB
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,                   # 等待其他连接释放写锁的时间（毫秒）
+        "write_retries": 3,                     # 超过 busy_timeout 后整个写事务的重试次数
+        "retry_backoff": 0.05,                  # 重试退避的初始上限（秒），每次加倍
+        "retry_backoff_max": 1.0,
+        "wal_autocheckpoint": 1000,             # 页数
+        "journal_size_limit": 64 * 1024 * 1024,  # 检查点后 WAL 文件截断到该大小
+        "checkpoint_interval": 30.0,            # 后台检查点线程的检查间隔（秒）
+        "checkpoint_wal_bytes": 16 * 1024 * 1024,
+    },
+    # WAL + 每次提交 fsync：读写互不阻塞，断电不丢已提交的记录
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -16000,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+        "write_retries": 3,
+        "retry_backoff": 0.05,
+        "retry_backoff_max": 1.0,
+        "wal_autocheckpoint": 1000,
+        "journal_size_limit": 64 * 1024 * 1024,
+        "checkpoint_interval": 30.0,
+        "checkpoint_wal_bytes": 16 * 1024 * 1024,
+    },
+}
+
+# 默认使用回滚日志：记录库通常放在多台工作站共用的网络共享上，WAL 依赖的共享内存
+# 在网络文件系统上不可靠；只在本机文件上需要读写互不阻塞时才选用 balanced/durable
+DEFAULT_PROFILE = "compat"
+
+# 工作站选择性能配置的环境变量（见 configured_profile）
+PROFILE_ENV_VAR = "BLOOD_DB_PROFILE"
+
+# 网络文件系统类型（/proc/mounts 中的名称），这类文件不切换为 WAL
+_NETWORK_FS_TYPES = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "ncpfs", "afs", "9p", "fuse.sshfs"}
+
+# 每个连接建立后设置的 PRAGMA（journal_mode 记录在数据库文件中，只需设置一次）
+_CONNECTION_PRAGMAS = (
+    "busy_timeout", "synchronous", "cache_size", "mmap_size",
+    "temp_store", "wal_autocheckpoint", "journal_size_limit",
+)
+
+def configured_profile():
+    """返回本工作站配置的性能配置名称
+
+    由环境变量 BLOOD_DB_PROFILE 指定（如记录库在本机时设为 balanced），未设置时为 DEFAULT_PROFILE。
+    """
+    name = os.environ.get(PROFILE_ENV_VAR, "").strip().lower()
+    if not name:
+        return DEFAULT_PROFILE
+    if name not in PERFORMANCE_PROFILES:
+        raise ValueError(f"环境变量 {PROFILE_ENV_VAR} 的值无效: {name}（可选: {', '.join(PERFORMANCE_PROFILES)}）")
+    return name
+
+
+def is_network_path(path):
+    """判断 path 是否位于网络共享上（UNC 路径、映射的网络驱动器、NFS/SMB 等挂载点）"""
+    path = os.path.abspath(path)
+    if path.startswith(("\\\\", "//")):
+        return True
+    if os.name == "nt":
+        import ctypes
+        drive = os.path.splitdrive(path)[0]
+        # GetDriveTypeW 返回 4（DRIVE_REMOTE）表示网络驱动器
+        return bool(drive) and ctypes.windll.kernel32.GetDriveTypeW(drive + "\\") == 4
+
+    try:
+        with open("/proc/mounts", encoding="utf-8") as mounts:
+            entries = [line.split()[1:3] for line in mounts]
+    except OSError:
+        return False
+    # 取包含 path 的最长挂载点（挂载点中的空格记为 \040）
+    path = os.path.realpath(path)
+    mount_point, fs_type = "", None
+    for point, point_type in entries:
+        point = point.replace("\\040", " ")
+        if (path == point or path.startswith(point.rstrip("/") + "/")) and len(point) > len(mount_point):
+            mount_point, fs_type = point, point_type
+    return fs_type in _NETWORK_FS_TYPES
+
+
+# PRAGMA 不支持参数绑定，配置值只允许整数或关键字
+_PRAGMA_VALUE_PATTERN = re.compile(r"^-?\w+$")
+
+# SQLITE_BUSY / SQLITE_LOCKED（扩展错误码的低8位）
+_BUSY_ERROR_CODES = (5, 6)
+
+
+class DatabaseBusyError(sqlite3.OperationalError):
+    """数据库一直被其他连接（其他工作站）占用，重试后仍未能完成写入"""
+
+
+class _BackupRestarted(Exception):
+    """分步备份重新开始的次数过多（用于从进度回调中止分步备份）"""
+
+
+class _ThreadConnection:
+    """线程本地连接的持有者，线程结束、线程本地数据被回收时触发关闭连接（见 _get_connection）"""
+    __slots__ = ("conn", "__weakref__")
+
+    def __init__(self, conn):
+        self.conn = conn
+
 
 class BloodReservationDB:
-    """血制品预约数据库管理类"""
+    """血制品预约数据库管理类
+
+    每个线程持有一个长连接（线程本地连接池），避免每次调用都重新建立连接、
+    丢弃页缓存和语句缓存。使用完毕后调用 close()，或以上下文管理器方式使用：
+
+        with BloodReservationDB("records.db") as db:
+            db.add_reservation(...)
+    """
+
+    # 结构迁移：(目标版本, 说明, 方法名)，按版本升序执行，新增迁移追加到末尾
+    MIGRATIONS = (
+        (1, "升级旧版表结构并创建查询索引", "_migrate_v1"),
+        (2, "创建按日汇总表", "_migrate_v2"),
+        (3, "增加整数时间戳列", "_migrate_v3"),
+        (4, "创建归档库登记表", "_migrate_v4"),
+        (5, "院区、血制品、血型改为字典编码", "_migrate_v5"),
+        (6, "创建记录变更日志", "_migrate_v6"),
+        (7, "创建全文检索索引", "_migrate_v7"),
+        (8, "按日汇总触发器只清理变动的分组", "_migrate_v8"),
+        (9, "登记归档记录的日期", "_migrate_v9"),
+    )
 
-    def __init__(self, db_path="records.db"):
-        """初始化数据库连接"""
+    # 数据库结构版本，记录在 PRAGMA user_version 中
+    SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+    # 迁移中分批搬移/回填数据时，每个事务处理的记录数
+    MIGRATION_BATCH_ROWS = 10000
+
+    def __init__(self, db_path="records.db", progress_callback=None, profile=DEFAULT_PROFILE):
+        """初始化数据库连接
+
+        progress_callback(说明, 已处理数, 总数) 用于报告结构迁移进度，默认输出到控制台。
+        profile 为 PERFORMANCE_PROFILES 中的名称，或包含相同键的字典。
+        """
         self.db_path = db_path
-        self.init_database()
+        self._progress_callback = progress_callback
+        self.profile = self._resolve_profile(profile)
+        self.journal_mode = None
+        self._checkpoint_thread = None
+        self._checkpoint_stop = threading.Event()
+        # 定时备份线程（start_backup_schedule 启动）及备份统计
+        self._backup_thread = None
+        self._backup_stop = threading.Event()
+        self.backup_stats = {"backups": 0, "failures": 0, "last_path": None, "last_pages": 0,
+                             "last_restarts": 0, "last_seconds": 0.0, "last_error": None}
+        # 组提交写入线程（start_writer 启动）
+        self._writer_thread = None
+        self._writer_queue = None
+        self._writer_lock = threading.Lock()
+        self.writer_stats = {"groups": 0, "rows": 0}
+        # 写锁等待统计（见 _write_transaction/_retry_write）
+        self.lock_stats = {"transactions": 0, "contended": 0, "wait_total": 0.0, "wait_max": 0.0,
+                           "retries": 0, "failures": 0}
+        self._stats_lock = threading.Lock()
+        # 字典值 -> 编号缓存：(字典表, 名称) -> id
+        self._lookup_cache = {}
+        self._names_cache = None
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._closed = False
+        # 查询结果缓存（每个线程的连接一份，见 _cached_rows）的命中统计
+        self._cache_lock = threading.Lock()
+        self.result_cache_stats = {"hits": 0, "misses": 0}
+        try:
+            self._set_journal_mode()
+            self.init_database()
+        except BaseException:
+            self.close()
+            raise
+        self._start_checkpointer()
 
-    def init_database(self):
-        """创建数据库和表结构"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def __enter__(self):
+        return self
 
-        # 创建预约记录表（包含数量字段）
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS reservations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                hospital_campus TEXT NOT NULL,
-                blood_product_type TEXT NOT NULL,
-                blood_product_subtype TEXT,
-                blood_type TEXT NOT NULL,
-                quantity REAL NOT NULL DEFAULT 1.0,
-                reservation_time TEXT NOT NULL
-            )
-        ''')
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
 
-        # 自动升级表结构（v1.0 -> v1.1+）
-        self._upgrade_table_structure(cursor)
+    @staticmethod
+    def _resolve_profile(profile):
+        """把性能配置名称或字典解析为配置字典"""
+        if isinstance(profile, str):
+            if profile not in PERFORMANCE_PROFILES:
+                raise ValueError(f"未知的性能配置: {profile}（可选: {', '.join(PERFORMANCE_PROFILES)}）")
+            return dict(PERFORMANCE_PROFILES[profile])
 
-        conn.commit()
-        conn.close()
+        resolved = dict(profile)
+        for name in _CONNECTION_PRAGMAS + ("journal_mode",):
+            value = resolved.get(name)
+            if value is not None and not _PRAGMA_VALUE_PATTERN.match(str(value)):
+                raise ValueError(f"性能配置 {name} 的值无效: {value!r}")
+        return resolved
+
+    def _connect(self):
+        """创建一个新的数据库连接，并按性能配置设置连接参数"""
+        # 连接只在创建它的线程中使用；关闭时可能由其他线程统一关闭
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        for name in _CONNECTION_PRAGMAS:
+            value = self.profile.get(name)
+            if value is not None:
+                conn.execute(f"PRAGMA {name} = {value}")
+        return conn
 
-    def _upgrade_table_structure(self, cursor):
-        """自动升级表结构到最新版本"""
+    def _set_journal_mode(self):
+        """按性能配置设置日志模式（WAL 模式记录在数据库文件中，对所有连接生效）
+
+        新建的数据库同时启用增量 auto_vacuum（见 reclaim_space），
+        它只能在写入文件头之前设置，因此先于日志模式。
+        网络共享上的文件不切换为 WAL（其他工作站无法通过共享内存协调读写），保持当前模式。
+        """
+        conn = self._get_connection()
+        if conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        mode = self.profile.get("journal_mode")
+        if mode and mode.upper() == "WAL" and is_network_path(self.db_path):
+            print(f"[提示] {self.db_path} 位于网络共享上，不切换为 WAL，沿用当前日志模式")
+            mode = None
         try:
-            cursor.execute("PRAGMA table_info(reservations)")
-            columns_info = cursor.fetchall()
-            columns = [row[1] for row in columns_info]
-
-            # 检查quantity字段的类型
-            quantity_type = None
-            for col in columns_info:
-                if col[1] == 'quantity':
-                    quantity_type = col[2]  # 列类型
-                    break
+            if mode:
+                conn.execute(f"PRAGMA journal_mode = {mode}")
+        except sqlite3.OperationalError:
+            # 其他连接正在使用数据库时无法切换，沿用当前模式
+            pass
+        self.journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0].lower()
+
+    @contextlib.contextmanager
+    def snapshot(self, filters=None):
+        """只读快照连接（上下文管理器），用于导出、打印等长时间读取
+
+        单独打开一个 mode=ro 连接。WAL 模式下立即开启读事务，期间看到的是同一时刻的数据，
+        读取不会阻塞 add_reservation 等写入，写入也不会影响正在进行的导出。
+        回滚日志模式下读事务持有的共享锁会阻塞所有提交，因此不固定读事务，
+        每条语句读完即释放锁（不是同一时刻的快照）。
+        filters 的时间范围涉及已归档年份时，先附加对应的归档库。
+        """
+        if self._closed:
+            raise sqlite3.ProgrammingError("数据库已关闭")
+
+        uri = "file:" + urllib.parse.quote(os.path.abspath(self.db_path)) + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        try:
+            for name in ("busy_timeout", "cache_size", "mmap_size", "temp_store"):
+                value = self.profile.get(name)
+                if value is not None:
+                    conn.execute(f"PRAGMA {name} = {value}")
+            # ATTACH 不能在事务中执行
+            self._reservation_source(conn, filters)
+            if self.journal_mode == "wal":
+                # 读事务在第一次读取时才固定快照，这里立即读取一次
+                conn.execute("BEGIN")
+                conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            yield conn
+        finally:
+            conn.close()
+
+    def checkpoint(self, mode="PASSIVE"):
+        """执行 WAL 检查点，返回 (是否被阻塞, WAL 中的页数, 已写回数据库的页数)
+
+        PASSIVE 不等待读写连接；FULL/RESTART/TRUNCATE 会等待读连接结束，期间阻塞写入。
+        """
+        mode = mode.upper()
+        if mode not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+            raise ValueError(f"未知的检查点模式: {mode}")
+        return tuple(self._get_connection().execute(f"PRAGMA wal_checkpoint({mode})").fetchone())
 
-            # 检查是否存在created_at字段
-            has_created_at = 'created_at' in columns
+    def wal_size(self):
+        """返回 WAL 文件当前大小（字节），不存在时为0"""
+        try:
+            return os.path.getsize(self.db_path + "-wal")
+        except OSError:
+            return 0
+
+    def _start_checkpointer(self):
+        """WAL 模式下启动后台检查点线程"""
+        interval = self.profile.get("checkpoint_interval")
+        if self.journal_mode != "wal" or not interval:
+            return
+        self._checkpoint_thread = threading.Thread(
+            target=self._checkpoint_loop, args=(interval,), name="db-checkpoint", daemon=True
+        )
+        self._checkpoint_thread.start()
+
+    def _checkpoint_loop(self, interval):
+        """检查点策略：WAL 超过阈值时执行不阻塞的 PASSIVE 检查点，写回完成后由
+        journal_size_limit 截断文件；长时间有读连接占住旧快照、连续多次无法写回时，
+        改用 TRUNCATE 强制回收，避免 WAL 无限增长"""
+        threshold = self.profile.get("checkpoint_wal_bytes", 0)
+        incomplete = 0
+        while not self._checkpoint_stop.wait(interval):
+            try:
+                if self.wal_size() <= threshold:
+                    incomplete = 0
+                    continue
+                busy, log_pages, done_pages = self.checkpoint("PASSIVE")
+                incomplete = incomplete + 1 if done_pages < log_pages else 0
+                if incomplete >= 3:
+                    self.checkpoint("TRUNCATE")
+                    incomplete = 0
+            except sqlite3.Error:
+                # 数据库被锁或已关闭，下个周期再试
+                pass
+
+    def _get_connection(self):
+        """获取当前线程的长连接（不存在时创建）
 
-            # 如果quantity是INTEGER类型或存在created_at，需要重建表
-            if quantity_type == 'INTEGER' or has_created_at:
-                print("正在升级数据库表结构到最新版本...")
-                self._recreate_table(cursor)
-                print("[OK] 数据库升级成功 - 已更新表结构")
-        except sqlite3.OperationalError as e:
-            # 如果表已存在或字段已存在，忽略错误
+        线程结束时连接随线程本地数据一起关闭，短时工作线程不会一直占用连接和文件句柄。
+        """
+        if self._closed:
+            raise sqlite3.ProgrammingError("数据库已关闭")
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            holder = _ThreadConnection(conn)
+            with self._connections_lock:
+                self._connections.append(conn)
+            # 只持有本对象的弱引用，不影响数据库对象被回收
+            weakref.finalize(holder, self._release_connection, weakref.ref(self), conn)
+            self._local.conn = conn
+            self._local.holder = holder
+        return conn
+
+    @staticmethod
+    def _release_connection(db_ref, conn):
+        """关闭已结束线程的连接（已由 close() 统一关闭时跳过）"""
+        db = db_ref()
+        if db is not None:
+            with db._connections_lock:
+                try:
+                    db._connections.remove(conn)
+                except ValueError:
+                    return
+        try:
+            conn.close()
+        except sqlite3.Error:
             pass
 
-    def _recreate_table(self, cursor):
-        """重建表结构（删除created_at字段，将quantity改为REAL）"""
-        # 创建新表
-        cursor.execute('''
-            CREATE TABLE reservations_new (
+    def close(self):
+        """关闭所有线程持有的数据库连接"""
+        self._stop_writer()
+        self.stop_backup_schedule()
+        self._checkpoint_stop.set()
+        if self._checkpoint_thread is not None and self._checkpoint_thread is not threading.current_thread():
+            self._checkpoint_thread.join()
+
+        with self._connections_lock:
+            connections = self._connections
+            self._connections = []
+            self._closed = True
+
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+    def init_database(self):
+        """创建数据库和表结构（按 PRAGMA user_version 执行尚未完成的迁移）"""
+        conn = self._get_connection()
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= self.SCHEMA_VERSION:
+            # 已是最新结构：启动时只读取一次 user_version
+            return
+        self._apply_migrations(conn, version)
+
+    def _apply_migrations(self, conn, version):
+        """按版本顺序执行高于当前 user_version 的迁移（每个迁移只执行一次）
+
+        每个迁移的最后一步与写入 user_version 在同一个事务中完成；需要搬移大量数据的迁移
+        先分批处理（每批一个事务），中途崩溃或被终止后，下次打开数据库时从断点继续。
+        """
+        for target, description, method_name in self.MIGRATIONS:
+            if version < target:
+                getattr(self, method_name)(conn, description)
+                version = target
+
+    @contextlib.contextmanager
+    def _write_transaction(self, conn):
+        """以 BEGIN IMMEDIATE 开启写事务（开始时即取得写锁），正常结束提交、异常时回滚
+
+        其他连接持有写锁时最多等待 busy_timeout，等待时间计入 lock_stats。
+        事务中取得的字典编号提交后才放入缓存（见 _lookup_id）。
+        """
+        cursor = conn.cursor()
+        start = time.perf_counter()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+        finally:
+            self._record_lock_wait(time.perf_counter() - start)
+        local = self._local
+        local.pending_lookups = {}
+        try:
+            yield cursor
+            # 回滚日志模式下提交时还要等待读连接，失败时同样回滚
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            self._lookup_cache.update(local.pending_lookups)
+        finally:
+            local.pending_lookups = None
+
+    def _record_lock_wait(self, seconds):
+        """记录一次取得写锁的等待时间（超过1毫秒视为与其他连接发生了争用）"""
+        with self._stats_lock:
+            stats = self.lock_stats
+            stats["transactions"] += 1
+            stats["wait_total"] += seconds
+            stats["wait_max"] = max(stats["wait_max"], seconds)
+            if seconds >= 0.001:
+                stats["contended"] += 1
+
+    @staticmethod
+    def _is_busy(error):
+        """是否为数据库被其他连接锁住导致的错误"""
+        code = getattr(error, "sqlite_errorcode", None)
+        if code is not None:
+            return code & 0xFF in _BUSY_ERROR_CODES
+        message = str(error)
+        return "locked" in message or "busy" in message
+
+    def _retry_write(self, work, replayable=True):
+        """在 BEGIN IMMEDIATE 写事务中执行 work(conn) 并提交，返回 work 的结果
+
+        多个工作站共用数据库时，等待写锁超过 busy_timeout 或提交时被锁会失败；这时回滚，
+        按带随机抖动的指数退避等待后重新执行整个事务，最多 write_retries 次，仍失败时
+        抛出 DatabaseBusyError。work 已开始执行后失败时，只有 replayable 为 True 才重试。
+        """
+        conn = self._get_connection()
+        retries = int(self.profile.get("write_retries", 0))
+        backoff = float(self.profile.get("retry_backoff", 0.05))
+        backoff_max = float(self.profile.get("retry_backoff_max", 1.0))
+        attempt = 0
+        while True:
+            started = False
+            try:
+                with self._write_transaction(conn):
+                    started = True
+                    return work(conn)
+            except sqlite3.OperationalError as e:
+                if isinstance(e, DatabaseBusyError) or not self._is_busy(e):
+                    raise
+                if attempt >= retries or (started and not replayable):
+                    with self._stats_lock:
+                        self.lock_stats["failures"] += 1
+                    raise DatabaseBusyError(
+                        f"数据库正被其他工作站占用，重试 {attempt} 次后仍未能保存，请稍后再试（{e}）"
+                    ) from e
+            attempt += 1
+            with self._stats_lock:
+                self.lock_stats["retries"] += 1
+            # 在 [0, 上限] 内随机等待，避免多个工作站同时重试再次冲突
+            time.sleep(random.uniform(0, min(backoff_max, backoff * 2 ** attempt)))
+
+    def _finish_migration(self, conn, target, step):
+        """在一个事务中执行迁移的最后一步并写入版本号
+
+        多个进程同时打开旧数据库时，拿到写锁后会再检查一次版本号，已完成的迁移不会重复执行。
+        """
+        with self._write_transaction(conn) as cursor:
+            cursor.execute("PRAGMA user_version")
+            if cursor.fetchone()[0] < target:
+                step(cursor)
+                # PRAGMA 不支持参数绑定，这里只会是整数常量
+                cursor.execute(f"PRAGMA user_version = {int(target)}")
+
+    def _run_id_batches(self, conn, description, table, batch):
+        """按 id 区间分批处理 table 中的记录，每批一个事务，并报告进度
+
+        batch(cursor, lower, upper) 处理 lower < id <= upper 的记录。
+        """
+        total = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        done = 0
+        lower = 0
+        self._report_progress(description, done, total)
+        while True:
+            with self._write_transaction(conn) as cursor:
+                cursor.execute(f'''
+                    SELECT COUNT(*), MAX(id) FROM (
+                        SELECT id FROM {table} WHERE id > ? ORDER BY id LIMIT ?
+                    )
+                ''', (lower, self.MIGRATION_BATCH_ROWS))
+                count, upper = cursor.fetchone()
+                if not count:
+                    break
+                batch(cursor, lower, upper)
+            lower = upper
+            done += count
+            self._report_progress(description, min(done, total), total)
+
+    def _report_progress(self, description, done, total):
+        """报告迁移进度（未指定回调时输出到控制台，空表不输出）"""
+        if self._progress_callback is not None:
+            self._progress_callback(description, done, total)
+        elif total:
+            print(f"{description}: {done}/{total}")
+
+    # 预约记录表结构（{name} 为表名，重建表时先建为 reservations_new）
+    _TABLE_SQL = '''
+            CREATE TABLE IF NOT EXISTS {name} (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 hospital_campus TEXT NOT NULL,
                 blood_product_type TEXT NOT NULL,
@@ -72,11 +556,38 @@ class BloodReservationDB:
                 blood_type TEXT NOT NULL,
                 quantity REAL NOT NULL DEFAULT 1.0,
                 reservation_time TEXT NOT NULL
-            )
-        ''')
+            )'''
 
-        # 复制数据（不包括created_at）
-        cursor.execute('''
+    def _migrate_v1(self, conn, description):
+        """v1：升级旧版表结构（quantity 改为 REAL、删除 created_at），创建查询索引"""
+        if self._needs_table_rebuild(conn):
+            self._move_rows_to_new_table(conn, description)
+
+        def finish(cursor):
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reservations_new'")
+            if cursor.fetchone():
+                # 搬移最后一批之后可能又有旧版程序写入，一并搬入后再替换旧表
+                cursor.execute(self._MOVE_ROWS_SQL, (0, -1))
+                seq = self._read_sequence(cursor, "reservations")
+                cursor.execute("DROP TABLE reservations")
+                cursor.execute("ALTER TABLE reservations_new RENAME TO reservations")
+                self._restore_sequence(cursor, "reservations", seq)
+            cursor.execute(self._TABLE_SQL.format(name="reservations"))
+            self._create_indexes(cursor)
+
+        self._finish_migration(conn, 1, finish)
+
+    def _needs_table_rebuild(self, conn):
+        """旧版表结构（quantity 为 INTEGER 或存在 created_at）或上次重建未完成时需要重建"""
+        if conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reservations_new'"
+        ).fetchone():
+            return True
+        columns = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(reservations)")}
+        return columns.get("quantity") == "INTEGER" or "created_at" in columns
+
+    # 把 lower < id <= upper（upper 为 -1 表示不限）的记录从旧表搬入新表
+    _MOVE_ROWS_SQL = '''
             INSERT INTO reservations_new (
                 id, hospital_campus, blood_product_type, blood_product_subtype,
                 blood_type, quantity, reservation_time
@@ -85,49 +596,1603 @@ class BloodReservationDB:
                 id, hospital_campus, blood_product_type, blood_product_subtype,
                 blood_type, CAST(quantity AS REAL), reservation_time
             FROM reservations
-        ''')
+            WHERE id > ?1 AND (?2 < 0 OR id <= ?2)'''
 
-        # 删除旧表
-        cursor.execute('DROP TABLE reservations')
+    def _move_rows_to_new_table(self, conn, description):
+        """分批把记录从旧表搬到新表 reservations_new
 
-        # 重命名新表
-        cursor.execute('ALTER TABLE reservations_new RENAME TO reservations')
+        每批在同一事务中插入新表并从旧表删除，旧表释放的页面被新表复用，
+        数据库文件不会膨胀到两倍；每批提交后锁即释放，其他连接可以继续读写。
+        """
+        with self._write_transaction(conn) as cursor:
+            cursor.execute(self._TABLE_SQL.format(name="reservations_new"))
 
-    def add_reservation(self, campus, product_type, subtype, blood_type, quantity, reservation_time):
-        """添加预约记录"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        def move(cursor, lower, upper):
+            cursor.execute(self._MOVE_ROWS_SQL, (lower, upper))
+            cursor.execute("DELETE FROM reservations WHERE id > ? AND id <= ?", (lower, upper))
 
-        cursor.execute('''
-            INSERT INTO reservations (
-                hospital_campus, blood_product_type, blood_product_subtype,
-                blood_type, quantity, reservation_time
-            ) VALUES (?, ?, ?, ?, ?, ?)
-        ''', (campus, product_type, subtype, blood_type, quantity, reservation_time))
+        self._run_id_batches(conn, description, "reservations", move)
 
-        conn.commit()
-        conn.close()
-        return True
+    def _migrate_v2(self, conn, description):
+        """v2：创建按日汇总表（汇总行数远小于记录数，一次完成）"""
+        self._finish_migration(conn, 2, self._create_daily_rollup)
 
-    def get_all_reservations(self):
-        """获取所有预约记录"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def _migrate_v3(self, conn, description):
+        """v3：增加整数时间戳列 reservation_epoch，分批回填后创建索引"""
+        with self._write_transaction(conn) as cursor:
+            self._add_epoch_column(cursor)
+
+        def backfill(cursor, lower, upper):
+            cursor.execute(f'''
+                UPDATE reservations SET reservation_epoch = {self._EPOCH_SQL.format(time="reservation_time")}
+                WHERE id > ? AND id <= ? AND reservation_epoch IS NULL
+            ''', (lower, upper))
+
+        self._run_id_batches(conn, description, "reservations", backfill)
+
+        def finish(cursor):
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_reservations_epoch
+                ON reservations (reservation_epoch)
+            ''')
+
+        self._finish_migration(conn, 3, finish)
+
+    def _migrate_v4(self, conn, description):
+        """v4：登记按年份归档的数据库文件（见 archive_reservations）"""
+        def create(cursor):
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS reservation_archives (
+                    year TEXT PRIMARY KEY,
+                    file_name TEXT NOT NULL,
+                    archived_before TEXT NOT NULL,
+                    row_count INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+
+        self._finish_migration(conn, 4, create)
+
+    @staticmethod
+    def _read_sequence(cursor, table):
+        """读取 table 的自增序号；重建表时带到新表，避免已删除记录的 id 被重新使用"""
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,))
+        row = cursor.fetchone()
+        return row[0] if row else None
 
+    @staticmethod
+    def _restore_sequence(cursor, table, seq):
+        """把 table 的自增序号提高到至少 seq"""
+        if seq is None:
+            return
+        cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (seq, table))
+        if not cursor.rowcount:
+            cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, seq))
+
+    # 字典编码的列：(视图中的列, 编码列, 字典表)
+    _LOOKUP_COLUMNS = (
+        ("hospital_campus", "campus_id", "campuses"),
+        ("blood_product_type", "product_type_id", "product_types"),
+        ("blood_product_subtype", "subtype_id", "product_subtypes"),
+        ("blood_type", "blood_type_id", "blood_types"),
+    )
+
+    # 字典编码后的记录表：院区、血制品大类/亚类、血型只存字典表中的整数编号
+    _RECORDS_TABLE_SQL = '''
+            CREATE TABLE IF NOT EXISTS reservation_records (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                campus_id INTEGER NOT NULL REFERENCES campuses (id),
+                product_type_id INTEGER NOT NULL REFERENCES product_types (id),
+                subtype_id INTEGER REFERENCES product_subtypes (id),
+                blood_type_id INTEGER NOT NULL REFERENCES blood_types (id),
+                quantity REAL NOT NULL DEFAULT 1.0,
+                reservation_time TEXT NOT NULL,
+                reservation_epoch INTEGER
+            )'''
+
+    # 与字典编码前的 reservations 表列完全相同的视图
+    _RESERVATIONS_VIEW_SQL = '''
+            CREATE VIEW IF NOT EXISTS reservations AS
+            SELECT reservation_records.id AS id,
+                   campuses.name AS hospital_campus,
+                   product_types.name AS blood_product_type,
+                   product_subtypes.name AS blood_product_subtype,
+                   blood_types.name AS blood_type,
+                   reservation_records.quantity AS quantity,
+                   reservation_records.reservation_time AS reservation_time,
+                   reservation_records.reservation_epoch AS reservation_epoch
+            FROM reservation_records
+            JOIN campuses ON campuses.id = reservation_records.campus_id
+            JOIN product_types ON product_types.id = reservation_records.product_type_id
+            LEFT JOIN product_subtypes ON product_subtypes.id = reservation_records.subtype_id
+            JOIN blood_types ON blood_types.id = reservation_records.blood_type_id'''
+
+    # 触发器中登记 NEW 行用到的字典值，并取得各列编码的表达式
+    _LOOKUP_INSERT_SQL = '''
+                INSERT OR IGNORE INTO campuses (name) VALUES (NEW.hospital_campus);
+                INSERT OR IGNORE INTO product_types (name) VALUES (NEW.blood_product_type);
+                INSERT OR IGNORE INTO product_subtypes (name)
+                    SELECT NEW.blood_product_subtype WHERE NEW.blood_product_subtype IS NOT NULL;
+                INSERT OR IGNORE INTO blood_types (name) VALUES (NEW.blood_type);'''
+    _LOOKUP_ID_SQL = {
+        "campus_id": "(SELECT id FROM campuses WHERE name = NEW.hospital_campus)",
+        "product_type_id": "(SELECT id FROM product_types WHERE name = NEW.blood_product_type)",
+        "subtype_id": "(SELECT id FROM product_subtypes WHERE name = NEW.blood_product_subtype)",
+        "blood_type_id": "(SELECT id FROM blood_types WHERE name = NEW.blood_type)",
+    }
+
+    def _migrate_v5(self, conn, description):
+        """v5：院区、血制品大类/亚类、血型改为字典编码
+
+        记录分批搬入只存整数编码的 reservation_records，完成后 reservations 改为关联
+        字典表的视图，列与之前完全相同；通过视图写入时由 INSTEAD OF 触发器转换为编码。
+        """
+        row = conn.execute("SELECT type FROM sqlite_master WHERE name = 'reservations'").fetchone()
+        if row and row[0] == "table":
+            with self._write_transaction(conn) as cursor:
+                for _, _, table in self._LOOKUP_COLUMNS:
+                    cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} "
+                                   f"(id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+                cursor.execute(self._RECORDS_TABLE_SQL)
+                # 搬移时从旧表删除会被汇总触发器计为减少，先删除触发器，完成后重建汇总
+                for action in ("insert", "delete", "update"):
+                    cursor.execute(f"DROP TRIGGER IF EXISTS trg_reservations_rollup_{action}")
+
+            self._run_id_batches(conn, description, "reservations", self._encode_rows)
+
+        self._finish_migration(conn, 5, self._finish_encoding)
+
+    def _encode_rows(self, cursor, lower, upper):
+        """把旧表中 lower < id <= upper 的记录编码后搬入 reservation_records"""
+        for column, _, table in self._LOOKUP_COLUMNS:
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO {table} (name)
+                SELECT DISTINCT {column} FROM reservations
+                WHERE id > ? AND id <= ? AND {column} IS NOT NULL
+            ''', (lower, upper))
         cursor.execute('''
+            INSERT INTO reservation_records (
+                id, campus_id, product_type_id, subtype_id, blood_type_id,
+                quantity, reservation_time, reservation_epoch
+            )
+            SELECT r.id, c.id, p.id, s.id, b.id, r.quantity, r.reservation_time, r.reservation_epoch
+            FROM reservations r
+            JOIN campuses c ON c.name = r.hospital_campus
+            JOIN product_types p ON p.name = r.blood_product_type
+            LEFT JOIN product_subtypes s ON s.name = r.blood_product_subtype
+            JOIN blood_types b ON b.name = r.blood_type
+            WHERE r.id > ? AND r.id <= ?
+        ''', (lower, upper))
+        cursor.execute("DELETE FROM reservations WHERE id > ? AND id <= ?", (lower, upper))
+
+    def _finish_encoding(self, cursor):
+        """字典编码迁移的最后一步：用视图替换旧表，并在新表上重建索引、触发器和汇总"""
+        cursor.execute("SELECT type FROM sqlite_master WHERE name = 'reservations'")
+        if cursor.fetchone()[0] == "table":
+            # 搬移最后一批之后可能又有旧版程序写入，一并搬入后再删除旧表
+            self._encode_rows(cursor, 0, 2 ** 63 - 1)
+            seq = self._read_sequence(cursor, "reservations")
+            cursor.execute("DROP TABLE reservations")
+            self._restore_sequence(cursor, "reservation_records", seq)
+
+        cursor.execute(self._RESERVATIONS_VIEW_SQL)
+        lookup_ids = self._LOOKUP_ID_SQL
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_reservations_view_insert
+            INSTEAD OF INSERT ON reservations
+            BEGIN
+                {self._LOOKUP_INSERT_SQL}
+                INSERT INTO reservation_records (
+                    id, campus_id, product_type_id, subtype_id, blood_type_id,
+                    quantity, reservation_time, reservation_epoch
+                ) VALUES (
+                    NEW.id, {lookup_ids["campus_id"]}, {lookup_ids["product_type_id"]},
+                    {lookup_ids["subtype_id"]}, {lookup_ids["blood_type_id"]},
+                    COALESCE(NEW.quantity, 1.0), NEW.reservation_time, NEW.reservation_epoch
+                );
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_reservations_view_update
+            INSTEAD OF UPDATE ON reservations
+            BEGIN
+                {self._LOOKUP_INSERT_SQL}
+                UPDATE reservation_records SET
+                    id = NEW.id,
+                    campus_id = {lookup_ids["campus_id"]},
+                    product_type_id = {lookup_ids["product_type_id"]},
+                    subtype_id = {lookup_ids["subtype_id"]},
+                    blood_type_id = {lookup_ids["blood_type_id"]},
+                    quantity = NEW.quantity,
+                    reservation_time = NEW.reservation_time,
+                    reservation_epoch = NEW.reservation_epoch
+                WHERE id = OLD.id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_reservations_view_delete
+            INSTEAD OF DELETE ON reservations
+            BEGIN
+                DELETE FROM reservation_records WHERE id = OLD.id;
+            END
+        ''')
+
+        # 索引沿用原名称，院区、大类索引改为建在编码列上
+        for name, columns in (("time", "reservation_time"),
+                              ("campus_time", "campus_id, reservation_time"),
+                              ("product_time", "product_type_id, reservation_time"),
+                              ("epoch", "reservation_epoch")):
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_reservations_{name} "
+                           f"ON reservation_records ({columns})")
+
+        self._create_epoch_triggers(cursor, "reservation_records")
+        self._create_rollup_triggers(cursor, "reservation_records", encoded=True)
+        self._rebuild_daily_rollup(cursor)
+
+    # 变更日志保留的条数；更早的变更被清理后，落后的读取方需要全量重新加载
+    CHANGE_LOG_KEEP = 10000
+
+    def _migrate_v6(self, conn, description):
+        """v6：由触发器维护的记录变更日志（见 get_changes_since）"""
+        def create(cursor):
+            # AUTOINCREMENT 保证序号单调递增，日志被清理后也不会重复使用
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS reservation_changes (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    op TEXT NOT NULL,
+                    reservation_id INTEGER
+                )
+            ''')
+            for op, event, row in (
+                    ("insert", "INSERT", "NEW"),
+                    ("delete", "DELETE", "OLD"),
+                    # 只记录显示内容的修改（不含触发器补齐 reservation_epoch）
+                    ("update", "UPDATE OF campus_id, product_type_id, subtype_id, blood_type_id, "
+                               "quantity, reservation_time", "NEW")):
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS trg_reservations_changes_{op}
+                    AFTER {event} ON reservation_records
+                    BEGIN
+                        INSERT INTO reservation_changes (op, reservation_id) VALUES ('{op}', {row}.id);
+                    END
+                ''')
+            # 每登记100条变更清理一次，只保留最近 CHANGE_LOG_KEEP 条
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_reservation_changes_prune
+                AFTER INSERT ON reservation_changes
+                WHEN NEW.seq % 100 = 0
+                BEGIN
+                    DELETE FROM reservation_changes WHERE seq <= NEW.seq - {int(self.CHANGE_LOG_KEEP)};
+                END
+            ''')
+
+        self._finish_migration(conn, 6, create)
+
+    # 全文检索中字典值最多切分的字符数（院区、血制品名称都远短于此）
+    SEARCH_NAME_CHARS = 32
+
+    # 检索索引的列（与 reservation_search_source 视图的列相同）
+    _SEARCH_COLUMNS = ("hospital_campus, blood_product_type, blood_product_subtype, "
+                       "blood_type, reservation_day")
+
+    @staticmethod
+    def _spaced_sql(expr, length):
+        """把文本表达式的前 length 个字逐字用空格分隔的SQL表达式
+
+        FTS5 的 unicode61 分词器把连续的汉字当作一个词，逐字分隔后每个汉字是一个词，
+        检索时把输入的词转换为逐字的短语，即可匹配字段中的任意子串。
+        只用内置函数，不依赖自定义函数，其他程序写入时触发器同样可以执行。
+        """
+        return (f"format('{' '.join(['%s'] * length)}', "
+                + ", ".join(f"substr({expr}, {i}, 1)" for i in range(1, length + 1)) + ")")
+
+    def _search_select_sql(self, row, from_sql, day_sql=None):
+        """读取检索索引行（rowid 及逐字分隔的各列）的 SELECT 语句
+
+        row 为提供编码列的行（reservation_records、NEW 或 OLD），from_sql 为 FROM 子句中
+        连接 product_types 之前的部分。字典值逐字分隔的结果保存在字典表的 search_text 列，
+        每行只需切分日期；day_sql 为已切分好的日期列时直接使用（见 bulk_load）。
+        """
+        columns = [f"{row}.id"]
+        columns += [f"{table}.search_text" for _, _, table in self._LOOKUP_COLUMNS]
+        columns.append(day_sql or self._spaced_sql(f"{row}.reservation_time", 10))
+        return f'''
+            SELECT {", ".join(columns)}
+            {from_sql}
+            JOIN product_types ON product_types.id = {row}.product_type_id
+            LEFT JOIN product_subtypes ON product_subtypes.id = {row}.subtype_id
+            JOIN blood_types ON blood_types.id = {row}.blood_type_id'''
+
+    def _migrate_v7(self, conn, description):
+        """v7：FTS5 全文检索索引（见 search）
+
+        reservation_search 以 reservation_search_source 视图为外部内容，只保存索引；
+        现有记录分批建立索引，最后一步创建维护索引的触发器。
+        """
+        with self._write_transaction(conn) as cursor:
+            for _, _, table in self._LOOKUP_COLUMNS:
+                cursor.execute(f"PRAGMA table_info({table})")
+                if "search_text" not in [row[1] for row in cursor.fetchall()]:
+                    cursor.execute(f"ALTER TABLE {table} ADD COLUMN search_text TEXT")
+                cursor.execute(f"UPDATE {table} SET search_text = "
+                               f"{self._spaced_sql('name', self.SEARCH_NAME_CHARS)}")
+                # 新登记的字典值（包括通过视图写入时由触发器登记的）在这里切分一次
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS trg_{table}_search_text
+                    AFTER INSERT ON {table}
+                    BEGIN
+                        UPDATE {table} SET search_text = {self._spaced_sql("NEW.name", self.SEARCH_NAME_CHARS)}
+                        WHERE id = NEW.id;
+                    END
+                ''')
+
+            source = self._search_select_sql(
+                "reservation_records",
+                "FROM reservation_records JOIN campuses ON campuses.id = reservation_records.campus_id")
+            cursor.execute(f"CREATE VIEW IF NOT EXISTS reservation_search_source "
+                           f"(id, {self._SEARCH_COLUMNS}) AS {source}")
+            cursor.execute(f'''
+                CREATE VIRTUAL TABLE IF NOT EXISTS reservation_search USING fts5(
+                    {self._SEARCH_COLUMNS},
+                    content = 'reservation_search_source', content_rowid = 'id'
+                )
+            ''')
+
+        self._run_id_batches(conn, description, "reservation_records", self._index_search_rows)
+        self._finish_migration(conn, 7, self._finish_search_index)
+
+    def _index_search_rows(self, cursor, lower, upper):
+        """为 lower < id <= upper 中尚未建立索引的记录建立检索索引"""
+        # 中断后继续时跳过已建立索引的记录（索引按 id 顺序建立）
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM reservation_search_docsize")
+        lower = max(lower, cursor.fetchone()[0])
+        cursor.execute(f'''
+            INSERT INTO reservation_search (rowid, {self._SEARCH_COLUMNS})
+            SELECT id, {self._SEARCH_COLUMNS} FROM reservation_search_source
+            WHERE id > ? AND id <= ?
+        ''', (lower, upper))
+
+    def _finish_search_index(self, cursor):
+        """检索索引迁移的最后一步：补建索引后新写入的记录，并创建维护索引的触发器"""
+        self._index_search_rows(cursor, 0, 2 ** 63 - 1)
+        self._create_search_triggers(cursor)
+
+    def _create_search_triggers(self, cursor):
+        """创建维护检索索引的触发器（索引待重建时没有这些触发器，见 bulk_load）"""
+        def select(row):
+            return self._search_select_sql(row, "FROM campuses") + f" WHERE campuses.id = {row}.campus_id"
+
+        add = f"INSERT INTO reservation_search (rowid, {self._SEARCH_COLUMNS}) {select('NEW')};"
+        # 外部内容表删除索引时需要提供原来的内容，由 OLD 的编码列重新取得
+        remove = (f"INSERT INTO reservation_search (reservation_search, rowid, {self._SEARCH_COLUMNS}) "
+                  f"SELECT 'delete', * FROM ({select('OLD')});")
+        for action, event, body in (
+                ("insert", "INSERT", add),
+                ("delete", "DELETE", remove),
+                ("update", "UPDATE OF id, campus_id, product_type_id, subtype_id, blood_type_id, "
+                           "reservation_time", remove + add)):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_reservations_search_{action}
+                AFTER {event} ON reservation_records
+                BEGIN
+                    {body}
+                END
+            ''')
+
+    def _migrate_v8(self, conn, description):
+        """v8：重建按日汇总触发器（旧版本每删除一行都扫描整个汇总表清理计数为0的分组）"""
+        def recreate(cursor):
+            # CREATE TRIGGER IF NOT EXISTS 会保留旧触发器，需要先删除
+            for action in ("insert", "delete", "update"):
+                cursor.execute(f"DROP TRIGGER IF EXISTS trg_reservations_rollup_{action}")
+            self._create_rollup_triggers(cursor, "reservation_records", encoded=True)
+
+        self._finish_migration(conn, 8, recreate)
+
+    def _migrate_v9(self, conn, description):
+        """v9：登记归档库中有记录的日期及院区（见 get_distinct_dates），已有的归档库逐个补登"""
+        with self._write_transaction(conn) as cursor:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS reservation_archive_days (
+                    day TEXT NOT NULL,
+                    campus TEXT NOT NULL,
+                    PRIMARY KEY (day, campus)
+                ) WITHOUT ROWID
+            ''')
+
+        for year, file_name in self._archived_years(conn):
+            if not os.path.exists(self._archive_path(file_name)):
+                continue
+            # ATTACH/DETACH 不能在事务中执行
+            schema = self._attach_archive(conn, year, file_name)
+            try:
+                with self._write_transaction(conn) as cursor:
+                    self._record_archive_days(cursor, schema, f"{year}-01-01", f"{int(year) + 1:04d}-01-01")
+            finally:
+                conn.execute(f"DETACH DATABASE {schema}")
+
+        self._finish_migration(conn, 9, lambda cursor: None)
+
+    def _lookup_id(self, conn, table, name):
+        """取得字典值的编号（不存在时登记），已提交的编号缓存在内存中"""
+        if name is None:
+            return None
+        key = (table, name)
+        lookup_id = self._lookup_cache.get(key)
+        if lookup_id is not None:
+            return lookup_id
+
+        pending = getattr(self._local, "pending_lookups", None)
+        if pending and key in pending:
+            return pending[key]
+
+        row = conn.execute(f"SELECT id FROM {table} WHERE name = ?", (name,)).fetchone()
+        if row:
+            lookup_id = row[0]
+        else:
+            # 新值在当前事务中登记
+            conn.execute(f"INSERT INTO {table} (name) VALUES (?)", (name,))
+            lookup_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+
+        if not conn.in_transaction:
+            self._lookup_cache[key] = lookup_id
+        elif pending is not None:
+            # 事务中读到/登记的编号可能随事务回滚，由 _write_transaction 在提交后放入缓存
+            pending[key] = lookup_id
+        return lookup_id
+
+    def _encode_row(self, conn, row):
+        """把 (院区, 大类, 亚类, 血型, 数量, 预约时间) 转换为 _INSERT_SQL 的参数"""
+        campus, product_type, subtype, blood_type, quantity, reservation_time = row
+        return (
+            self._lookup_id(conn, "campuses", campus),
+            self._lookup_id(conn, "product_types", product_type),
+            self._lookup_id(conn, "product_subtypes", subtype),
+            self._lookup_id(conn, "blood_types", blood_type),
+            quantity,
+            reservation_time,
+        )
+
+    # reservation_records 中与 reservations 视图列一一对应的列
+    _RECORD_COLUMNS = ("id, campus_id, product_type_id, subtype_id, blood_type_id, "
+                       "quantity, reservation_time")
+
+    def _lookup_names(self, conn, refresh=False):
+        """读取各字典表的 编号 -> 名称 映射（按 _LOOKUP_COLUMNS 顺序）
+
+        字典值只增不删，映射缓存在内存中；遇到未知编号时调用方以 refresh=True 重新读取。
+        """
+        names = self._names_cache
+        if names is None or refresh:
+            names = tuple(dict(conn.execute(f"SELECT id, name FROM {table}"))
+                          for _, _, table in self._LOOKUP_COLUMNS)
+            # 与 _lookup_id 相同：事务中可能读到未提交的登记，不缓存
+            if not conn.in_transaction:
+                self._names_cache = names
+        return names
+
+    def _decoder(self, conn):
+        """返回把 reservation_records 的编码行换成视图格式记录的函数"""
+        names = self._lookup_names(conn)
+
+        def decode(rows):
+            nonlocal names
+            try:
+                return self._decode_rows(names, rows)
+            except KeyError:
+                # 其他连接登记了新的字典值
+                names = self._lookup_names(conn, refresh=True)
+                return self._decode_rows(names, rows)
+
+        return decode
+
+    @staticmethod
+    def _decode_rows(names, rows):
+        campuses, product_types, subtypes, blood_types = names
+        subtype = subtypes.get
+        return [(res_id, campuses[campus_id], product_types[product_type_id], subtype(subtype_id),
+                 blood_types[blood_type_id], quantity, reservation_time)
+                for (res_id, campus_id, product_type_id, subtype_id, blood_type_id,
+                     quantity, reservation_time) in rows]
+
+    def _select_reservations(self, conn, filters, seek=None):
+        """构造读取预约记录的语句，返回 (SELECT ... WHERE 语句, 参数, 解码函数)
+
+        只涉及主库时直接读取 reservation_records 的编号列，在 Python 中换成名称
+        （比逐行关联字典表的 reservations 视图快）；涉及归档年份时读取合并视图，
+        解码函数为 None。seek 为附加的 (条件, 参数)，用于键集分页。
+        """
+        filters = filters or {}
+        source = self._reservation_source(conn, filters)
+        encoded = source == "reservations"
+        where_sql, params = self._build_where(**filters, encoded=encoded)
+        if seek:
+            clause, seek_params = seek
+            where_sql += (" AND " if where_sql else " WHERE ") + clause
+            params.extend(seek_params)
+
+        if encoded:
+            sql = f"SELECT {self._RECORD_COLUMNS} FROM reservation_records" + where_sql
+            return sql, params, self._decoder(conn)
+        sql = f'''
             SELECT id, hospital_campus, blood_product_type, blood_product_subtype,
                    blood_type, quantity, reservation_time
+            FROM {source}''' + where_sql
+        return sql, params, None
+
+    def _create_indexes(self, cursor):
+        """创建与列表窗口筛选方式对应的索引"""
+        # 仅按日期筛选
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_reservations_time
+            ON reservations (reservation_time)
+        ''')
+        # 院区 + 日期筛选
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_reservations_campus_time
+            ON reservations (hospital_campus, reservation_time)
+        ''')
+        # 血制品大类 + 日期筛选
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_reservations_product_time
+            ON reservations (blood_product_type, reservation_time)
+        ''')
+
+    def _add_epoch_column(self, cursor):
+        """增加整数时间戳列 reservation_epoch 及维护它的触发器（回填由迁移分批完成）"""
+        cursor.execute("PRAGMA table_info(reservations)")
+        if "reservation_epoch" not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE reservations ADD COLUMN reservation_epoch INTEGER")
+
+        self._create_epoch_triggers(cursor, "reservations")
+
+    def _create_epoch_triggers(self, cursor, table):
+        """在 table 上创建维护 reservation_epoch 的触发器"""
+        # 本程序写入时会直接带上时间戳；其他程序（如旧版本）写入或修改时间时由触发器补齐
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_reservations_epoch_insert
+            AFTER INSERT ON {table}
+            WHEN NEW.reservation_epoch IS NULL
+            BEGIN
+                UPDATE {table} SET reservation_epoch = {self._EPOCH_SQL.format(time="NEW.reservation_time")}
+                WHERE id = NEW.id;
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_reservations_epoch_update
+            AFTER UPDATE OF reservation_time ON {table}
+            BEGIN
+                UPDATE {table} SET reservation_epoch = {self._EPOCH_SQL.format(time="NEW.reservation_time")}
+                WHERE id = NEW.id;
+            END
+        ''')
+
+    # 由 reservation_time 文本计算整数时间戳的SQL表达式
+    _EPOCH_SQL = "CAST(strftime('%s', {time}) AS INTEGER)"
+
+    def _create_daily_rollup(self, cursor):
+        """创建按日汇总表及维护它的触发器，并根据现有记录生成汇总"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS reservation_daily_rollup (
+                day TEXT NOT NULL,
+                campus TEXT NOT NULL,
+                product_type TEXT NOT NULL,
+                subtype TEXT NOT NULL,
+                blood_type TEXT NOT NULL,
+                record_count INTEGER NOT NULL,
+                quantity_sum REAL NOT NULL,
+                PRIMARY KEY (day, campus, product_type, subtype, blood_type)
+            ) WITHOUT ROWID
+        ''')
+
+        self._create_rollup_triggers(cursor, "reservations", encoded=False)
+        self._rebuild_daily_rollup(cursor)
+
+    def _create_rollup_triggers(self, cursor, table, encoded):
+        """在 table 上创建维护按日汇总表的触发器
+
+        encoded 为 True 时 table 为字典编码后的 reservation_records，分组值通过字典表取得。
+        """
+        new_row = self._rollup_row("NEW", encoded)
+        old_row = self._rollup_row("OLD", encoded)
+        if encoded:
+            update_columns = "campus_id, product_type_id, subtype_id, blood_type_id, quantity, reservation_time"
+        else:
+            update_columns = ("hospital_campus, blood_product_type, blood_product_subtype, "
+                              "blood_type, quantity, reservation_time")
+
+        # 新增记录：对应分组计数+1、数量累加
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_reservations_rollup_insert
+            AFTER INSERT ON {table}
+            BEGIN
+                {self._ROLLUP_ADD_SQL.format(**new_row)}
+            END
+        ''')
+
+        # 删除记录：对应分组计数-1、数量扣减，计数归零时删除该分组
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_reservations_rollup_delete
+            AFTER DELETE ON {table}
+            BEGIN
+                {self._ROLLUP_REMOVE_SQL.format(**old_row)}
+            END
+        ''')
+
+        # 修改分组相关字段：先从旧分组扣除，再计入新分组
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_reservations_rollup_update
+            AFTER UPDATE OF {update_columns} ON {table}
+            BEGIN
+                {self._ROLLUP_REMOVE_SQL.format(**old_row)}
+                {self._ROLLUP_ADD_SQL.format(**new_row)}
+            END
+        ''')
+
+    @staticmethod
+    def _rollup_row(row, encoded):
+        """触发器中一行记录（NEW 或 OLD）各分组值的SQL表达式"""
+        if not encoded:
+            return {
+                "row": row,
+                "campus": f"{row}.hospital_campus",
+                "product_type": f"{row}.blood_product_type",
+                "subtype": f"COALESCE({row}.blood_product_subtype, '')",
+                "blood_type": f"{row}.blood_type",
+            }
+        return {
+            "row": row,
+            "campus": f"(SELECT name FROM campuses WHERE id = {row}.campus_id)",
+            "product_type": f"(SELECT name FROM product_types WHERE id = {row}.product_type_id)",
+            "subtype": f"COALESCE((SELECT name FROM product_subtypes WHERE id = {row}.subtype_id), '')",
+            "blood_type": f"(SELECT name FROM blood_types WHERE id = {row}.blood_type_id)",
+        }
+
+    # 触发器中把一行记录计入按日汇总表（{row} 为 NEW 或 OLD，其余占位符见 _rollup_row）
+    _ROLLUP_ADD_SQL = '''
+                INSERT INTO reservation_daily_rollup (
+                    day, campus, product_type, subtype, blood_type, record_count, quantity_sum
+                ) VALUES (
+                    substr({row}.reservation_time, 1, 10), {campus},
+                    {product_type}, {subtype},
+                    {blood_type}, 1, {row}.quantity
+                )
+                ON CONFLICT (day, campus, product_type, subtype, blood_type) DO UPDATE SET
+                    record_count = record_count + 1,
+                    quantity_sum = quantity_sum + excluded.quantity_sum;'''
+
+    # 触发器中把一行记录从按日汇总表中扣除；计数归零时只删除刚扣减的分组，
+    # 不扫描整个汇总表（否则批量删除的耗时与汇总行数成正比）
+    _ROLLUP_REMOVE_SQL = '''
+                UPDATE reservation_daily_rollup
+                SET record_count = record_count - 1,
+                    quantity_sum = quantity_sum - {row}.quantity
+                WHERE day = substr({row}.reservation_time, 1, 10)
+                  AND campus = {campus}
+                  AND product_type = {product_type}
+                  AND subtype = {subtype}
+                  AND blood_type = {blood_type};
+                DELETE FROM reservation_daily_rollup
+                WHERE day = substr({row}.reservation_time, 1, 10)
+                  AND campus = {campus}
+                  AND product_type = {product_type}
+                  AND subtype = {subtype}
+                  AND blood_type = {blood_type}
+                  AND record_count <= 0;'''
+
+    def _rebuild_daily_rollup(self, cursor):
+        """根据 reservations 全量重建按日汇总表"""
+        cursor.execute("DELETE FROM reservation_daily_rollup")
+        cursor.execute('''
+            INSERT INTO reservation_daily_rollup (
+                day, campus, product_type, subtype, blood_type, record_count, quantity_sum
+            )
+            SELECT substr(reservation_time, 1, 10), hospital_campus, blood_product_type,
+                   COALESCE(blood_product_subtype, ''), blood_type, COUNT(*), TOTAL(quantity)
             FROM reservations
-            ORDER BY id DESC
+            GROUP BY 1, 2, 3, 4, 5
         ''')
 
-        results = cursor.fetchall()
-        conn.close()
-        return results
+    def rebuild_daily_rollup(self):
+        """重建按日汇总表（用于修复或校准已有数据库），返回汇总行数"""
+        def rebuild(conn):
+            # 清空与重建在同一个事务中原子完成
+            cursor = conn.cursor()
+            self._rebuild_daily_rollup(cursor)
+            cursor.execute("SELECT COUNT(*) FROM reservation_daily_rollup")
+            return cursor.fetchone()[0]
+
+        return self._retry_write(rebuild)
+
+    # 插入一条预约记录，参数顺序与 add_reservation 一致；时间戳由预约时间计算
+    _INSERT_SQL = '''
+        INSERT INTO reservation_records (
+            campus_id, product_type_id, subtype_id,
+            blood_type_id, quantity, reservation_time, reservation_epoch
+        ) VALUES (?1, ?2, ?3, ?4, ?5, ?6, CAST(strftime('%s', ?6) AS INTEGER))
+    '''
+
+    def add_reservation(self, campus, product_type, subtype, blood_type, quantity, reservation_time):
+        """添加预约记录"""
+        row = (campus, product_type, subtype, blood_type, quantity, reservation_time)
+        # 出错时 _retry_write 回滚，未完成的事务不会一直占着写锁
+        self._retry_write(lambda conn: conn.execute(self._INSERT_SQL, self._encode_row(conn, row)))
+
+        return True
+
+    @staticmethod
+    def _validate_row(index, row):
+        """校验批量导入的一行数据，返回规范化后的参数元组"""
+        if len(row) != 6:
+            raise ValueError(f"第 {index + 1} 行字段数应为 6，实际为 {len(row)}")
+
+        campus, product_type, subtype, blood_type, quantity, reservation_time = row
+
+        for name, value in (("院区", campus), ("血制品大类", product_type), ("血型", blood_type)):
+            if not value:
+                raise ValueError(f"第 {index + 1} 行缺少{name}")
+
+        try:
+            quantity = float(quantity)
+        except (TypeError, ValueError):
+            raise ValueError(f"第 {index + 1} 行数量无效: {quantity!r}")
+        if quantity <= 0:
+            raise ValueError(f"第 {index + 1} 行数量必须大于0: {quantity}")
+
+        if not isinstance(reservation_time, str) or not _TIME_PATTERN.match(reservation_time):
+            raise ValueError(f"第 {index + 1} 行预约时间格式应为 yyyy-MM-dd hh:mm:ss: {reservation_time!r}")
+
+        # 亚类按原值保存（None 存为 NULL），与 add_reservation 一致
+        return (campus, product_type, subtype, blood_type, quantity, reservation_time)
+
+    def add_reservations(self, rows, chunk_size=5000):
+        """批量添加预约记录（单个事务，executemany 分块写入）
+
+        Args:
+            rows: 可迭代对象，每行为 (院区, 大类, 亚类, 血型, 数量, 预约时间)，
+                  与 add_reservation 参数顺序一致
+            chunk_size: 每次 executemany 的行数
+
+        Returns:
+            list: 按输入顺序分配的记录ID
+
+        Raises:
+            ValueError: 任一行校验失败时整批回滚，不写入任何记录
+            DatabaseBusyError: 数据库一直被其他连接占用（rows 为迭代器且已开始读取时不重试）
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size 必须大于0")
+
+        def insert(conn):
+            ids = []
+            chunk = []
+
+            def flush():
+                conn.executemany(self._INSERT_SQL, chunk)
+                # 事务内持有写锁，同一条语句分配的自增ID是连续的
+                last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+                ids.extend(range(last_id - len(chunk) + 1, last_id + 1))
+                chunk.clear()
+
+            for index, row in enumerate(rows):
+                chunk.append(self._encode_row(conn, self._validate_row(index, row)))
+                if len(chunk) >= chunk_size:
+                    flush()
+            if chunk:
+                flush()
+            return ids
+
+        # 列表可以重新读取，整批重试；迭代器只在开始读取之前（等待写锁时）重试
+        ids = self._retry_write(insert, replayable=isinstance(rows, (list, tuple)))
+        return ids
+
+    # bulk_load 期间检索索引在内存中累积的数据上限（FTS5 默认 1 MB），越大写出的段越少
+    BULK_SEARCH_HASHSIZE = 64 * 1024 * 1024
+    FTS_DEFAULT_HASHSIZE = 1024 * 1024
+
+    def bulk_load(self, rows, chunk_size=50000, validate=True, build_search_index=True):
+        """大批量导入预约记录（生成测试数据、导入历史数据），返回导入的记录数
+
+        逐行执行的汇总、变更日志、检索索引触发器是批量写入的主要开销。这里在一个事务中
+        暂时删除 reservation_records 上的触发器（表为空时连同索引），executemany 写入后
+        按新记录一次性补齐按日汇总表和检索索引，再重建索引、恢复触发器。变更日志只登记
+        最后 CHANGE_LOG_KEEP 条，落后更多的读取方全量重新加载（与日志被清理时相同）。
+        导入期间其他连接无法写入；日常的批量提交用 add_reservations。
+
+        检索索引的写入约占导入时间的一半。build_search_index 为 False 时不写入检索索引，
+        也不恢复维护它的触发器，索引标记为待重建：多次导入后调用一次 rebuild_search_index，
+        或由第一次 search 自动重建。
+
+        Args:
+            rows: 可迭代对象，每行与 add_reservations 相同
+            chunk_size: 每次 executemany 的行数
+            validate: 是否逐行校验（数据由程序生成、已知有效时可以关闭）
+            build_search_index: 是否同时为新记录建立检索索引
+
+        Raises:
+            ValueError: 任一行校验失败时整批回滚，不写入任何记录
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size 必须大于0")
+
+        def load(conn):
+            cursor = conn.cursor()
+            seq = self._read_sequence(cursor, "reservation_changes") or 0
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM reservation_records)")
+            was_empty = not cursor.fetchone()[0]
+            # 空表写入后再建索引（排序建立）比逐行维护快；已有记录时保留索引
+            cursor.execute("SELECT type, name, sql FROM sqlite_master WHERE tbl_name = 'reservation_records' "
+                           "AND (type = 'trigger' OR (type = 'index' AND sql IS NOT NULL AND ?))",
+                           (was_empty,))
+            schema = cursor.fetchall()
+            for object_type, name, _ in schema:
+                cursor.execute(f"DROP {object_type.upper()} {name}")
+
+            insert_sql = self._INSERT_SQL
+            encoded = {}
+            # 按日汇总在读取时累计：(院区, 大类, 亚类, 血型) 的编号, 日期 -> [记录数, 数量合计]
+            # （以编号而不是名称为键，整数元组散列更快）
+            totals = {}
+            chunk = []
+            count = 0
+            for index, row in enumerate(rows):
+                if validate:
+                    row = self._validate_row(index, row)
+                # 同样的 (院区, 大类, 亚类, 血型) 只查一次编号
+                names = row[:4]
+                ids = encoded.get(names)
+                if ids is None:
+                    ids = encoded[names] = tuple(
+                        self._lookup_id(conn, table, name)
+                        for (_, _, table), name in zip(self._LOOKUP_COLUMNS, names))
+                quantity, reservation_time = row[4], row[5]
+                chunk.append((*ids, quantity, reservation_time))
+                key = (ids, reservation_time[:10])
+                total = totals.get(key)
+                if total is None:
+                    totals[key] = [1, quantity]
+                else:
+                    total[0] += 1
+                    total[1] += quantity
+                if len(chunk) >= chunk_size:
+                    cursor.executemany(insert_sql, chunk)
+                    count += len(chunk)
+                    chunk.clear()
+            if chunk:
+                cursor.executemany(insert_sql, chunk)
+                count += len(chunk)
+
+            # 事务中分配的 id 连续（自增序号可能跳过已删除记录的 id）
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM reservation_records")
+            first_id = cursor.fetchone()[0] - count + 1
+
+            names_by_ids = {ids: names for names, ids in encoded.items()}
+            cursor.executemany('''
+                INSERT INTO reservation_daily_rollup (
+                    day, campus, product_type, subtype, blood_type, record_count, quantity_sum
+                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (day, campus, product_type, subtype, blood_type) DO UPDATE SET
+                    record_count = record_count + excluded.record_count,
+                    quantity_sum = quantity_sum + excluded.quantity_sum
+            ''', ((day, campus, product_type, subtype or "", blood_type, record_count, quantity_sum)
+                  for (ids, day), (record_count, quantity_sum) in totals.items()
+                  for campus, product_type, subtype, blood_type in (names_by_ids[ids],)))
+
+            if build_search_index:
+                self._bulk_index_search(cursor, first_id, {day for _, day in totals})
+            else:
+                schema = [item for item in schema if not item[1].startswith("trg_reservations_search_")]
+
+            # 第 k 条新记录对应变更序号 seq + k；只登记最后 CHANGE_LOG_KEEP 条
+            cursor.execute('''
+                INSERT INTO reservation_changes (seq, op, reservation_id)
+                SELECT ? + id, 'insert', id FROM reservation_records WHERE id >= ?
+            ''', (seq - first_id + 1, max(first_id, first_id + count - self.CHANGE_LOG_KEEP)))
+
+            for _, _, sql in sorted(schema, key=lambda item: item[0] != "index"):
+                cursor.execute(sql)
+            return count
+
+        count = self._retry_write(load, replayable=isinstance(rows, (list, tuple)))
+        return count
+
+    def _bulk_index_search(self, cursor, first_id, days):
+        """为 id >= first_id 的新记录建立检索索引（bulk_load 中调用）"""
+        # 日期逐字切分每天只做一次，按日期关联（与触发器写入的内容相同）
+        cursor.execute("CREATE TEMP TABLE bulk_search_days (day TEXT PRIMARY KEY, spaced TEXT)")
+        cursor.executemany("INSERT OR IGNORE INTO bulk_search_days (day) VALUES (?)", ((day,) for day in days))
+        cursor.execute(f"UPDATE bulk_search_days SET spaced = {self._spaced_sql('day', 10)}")
+        cursor.execute("INSERT INTO reservation_search (reservation_search, rank) VALUES ('hashsize', ?)",
+                       (self.BULK_SEARCH_HASHSIZE,))
+        source = self._search_select_sql(
+            "reservation_records",
+            "FROM reservation_records JOIN campuses ON campuses.id = reservation_records.campus_id "
+            "JOIN bulk_search_days ON bulk_search_days.day = substr(reservation_records.reservation_time, 1, 10)",
+            day_sql="bulk_search_days.spaced")
+        cursor.execute(f"INSERT INTO reservation_search (rowid, {self._SEARCH_COLUMNS}) "
+                       f"{source} WHERE reservation_records.id >= ?", (first_id,))
+        cursor.execute("INSERT INTO reservation_search (reservation_search, rank) VALUES ('hashsize', ?)",
+                       (self.FTS_DEFAULT_HASHSIZE,))
+        cursor.execute("DROP TABLE bulk_search_days")
+
+    def search_index_ready(self):
+        """检索索引是否可用（bulk_load(build_search_index=False) 之后、重建之前为 False）"""
+        return self._get_connection().execute(
+            "SELECT EXISTS (SELECT 1 FROM sqlite_master WHERE type = 'trigger' "
+            "AND name = 'trg_reservations_search_insert')"
+        ).fetchone()[0] == 1
+
+    def rebuild_search_index(self):
+        """由全部记录重新建立检索索引，并恢复维护索引的触发器（一个事务）
+
+        效果与 FTS5 的 'rebuild' 命令相同，但日期按天切分一次（见 _bulk_index_search），
+        不经过逐行切分日期的 reservation_search_source 视图，快约 40%。
+        """
+        def rebuild(conn):
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO reservation_search (reservation_search) VALUES ('delete-all')")
+            cursor.execute("SELECT DISTINCT day FROM reservation_daily_rollup")
+            self._bulk_index_search(cursor, 0, [row[0] for row in cursor.fetchall()])
+            self._create_search_triggers(cursor)
+
+        self._retry_write(rebuild)
+
+    def start_writer(self, window=0.0, max_group=100):
+        """启动后台写入线程（组提交），之后 submit_reservation 提交的记录由它写入
+
+        写入线程把上一次提交期间排队的记录（最多 max_group 条）合并为一个事务，多条记录
+        共用一次 fsync；window 大于0时再额外等待 window 秒收集后续提交。
+        写入连接使用 synchronous=FULL，Future 完成时记录已落盘。
+        """
+        with self._writer_lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("数据库已关闭")
+            if self._writer_thread is not None:
+                return
+            self._writer_queue = queue.Queue()
+            self._writer_thread = threading.Thread(
+                target=self._writer_loop, args=(window, max_group), name="db-writer", daemon=True
+            )
+            self._writer_thread.start()
+
+    def submit_reservation(self, campus, product_type, subtype, blood_type, quantity, reservation_time):
+        """提交一条预约记录，返回 concurrent.futures.Future，结果为记录ID
+
+        未启动写入线程时在当前线程直接写入，返回的 Future 已完成。
+        """
+        future = Future()
+        row = (campus, product_type, subtype, blood_type, quantity, reservation_time)
+
+        with self._writer_lock:
+            if self._writer_thread is not None:
+                self._writer_queue.put((row, future))
+                return future
+
+        try:
+            future.set_result(self.add_reservations([row])[0])
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _writer_loop(self, window, max_group):
+        """写入线程：收集一组提交后在一个事务中写入"""
+        self._get_connection().execute("PRAGMA synchronous = FULL")
+        stopping = False
+        while not stopping:
+            item = self._writer_queue.get()
+            if item is None:
+                break
+            group = [item]
+            deadline = time.monotonic() + window
+            while len(group) < max_group:
+                try:
+                    item = self._writer_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    # 关闭前已排队的提交照常写入
+                    stopping = True
+                    break
+                group.append(item)
+            self.commit_group(group)
+
+    def commit_group(self, items):
+        """在一个事务中写入一组提交，并逐条完成对应的 Future（组提交）
+
+        供自行收集提交的调用方使用（写入线程、AsyncBloodReservationDB 的数据库线程）。
+        items 为 [(记录, Future)]，记录与 add_reservation 的参数相同；已取消的 Future 跳过。
+        出错时只让相关的 Future 得到异常，不向调用方抛出。
+        """
+        pending = []
+        for row, future in items:
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                pending.append((self._validate_row(0, row), future))
+            except ValueError as e:
+                # 校验失败只影响这一条提交
+                future.set_exception(e)
+        if not pending:
+            return
+
+        try:
+            self._insert_group(pending)
+        except Exception as e:
+            # 写入线程不能因任何一组失败而退出，否则之后排队的 Future 永远不会完成
+            if len(pending) == 1 or isinstance(e, DatabaseBusyError):
+                for _, future in pending:
+                    future.set_exception(e)
+                return
+            # 可能只是其中一条记录出错：逐条重新写入，只有出错的提交失败
+            for item in pending:
+                try:
+                    self._insert_group([item])
+                except Exception as row_error:
+                    item[1].set_exception(row_error)
+
+    def _insert_group(self, pending):
+        """在一个事务中写入 [(参数, Future)]，提交后逐条以记录ID完成 Future"""
+        ids = self._retry_write(lambda conn: [
+            conn.execute(self._INSERT_SQL, self._encode_row(conn, params)).lastrowid
+            for params, _ in pending])
+
+        self.writer_stats["groups"] += 1
+        self.writer_stats["rows"] += len(ids)
+        for record_id, (_, future) in zip(ids, pending):
+            future.set_result(record_id)
+
+    def _stop_writer(self):
+        """停止写入线程（先写完已排队的提交）"""
+        with self._writer_lock:
+            thread = self._writer_thread
+            if thread is None:
+                return
+            self._writer_thread = None
+            self._writer_queue.put(None)
+        thread.join()
+
+    def get_all_reservations(self):
+        """获取所有预约记录（按ID倒序）
+
+        与不带筛选条件的 query_reservations、iter_reservations 一样包括已归档年份的记录。
+        """
+        conn = self._get_connection()
+        sql, params, decode = self._select_reservations(conn, None)
+        rows = conn.execute(sql + " ORDER BY id DESC", params)
+        return decode(rows) if decode else rows.fetchall()
+
+    @staticmethod
+    def _to_epoch(value):
+        """将本地时间（datetime）换算为 reservation_epoch 使用的秒数"""
+        # 与 SQLite strftime('%s', reservation_time) 一致：墙上时间按 UTC 换算，不涉及时区
+        return calendar.timegm(value.timetuple())
+
+    @classmethod
+    def _time_bound(cls, value, is_end=False):
+        """将日期/时间边界转换为 (列, 比较运算符, 参数)
+
+        date/datetime 对象比较整数时间戳列 reservation_epoch，
+        字符串（'yyyy-MM-dd' 或 'yyyy-MM-dd hh:mm:ss'）比较 reservation_time 文本。
+        纯日期作为结束边界时包含当天全部记录。
+        """
+        if isinstance(value, datetime):
+            return "reservation_epoch", "<=" if is_end else ">=", cls._to_epoch(value)
+        if isinstance(value, date):
+            day_start = datetime(value.year, value.month, value.day)
+            if is_end:
+                # 结束日期取次日零点之前（开区间）
+                return "reservation_epoch", "<", cls._to_epoch(day_start + timedelta(days=1))
+            return "reservation_epoch", ">=", cls._to_epoch(day_start)
+
+        value = str(value).strip()
+        if is_end and len(value) == 10:
+            next_day = datetime.strptime(value, "%Y-%m-%d") + timedelta(days=1)
+            return "reservation_time", "<", next_day.strftime("%Y-%m-%d")
+        return "reservation_time", "<=" if is_end else ">=", value
+
+    def _build_where(self, campus=None, start=None, end=None,
+                     product_type=None, blood_type=None, encoded=False):
+        """根据筛选条件构造参数化的 WHERE 子句，返回 (sql, params)
+
+        encoded 为 True 时条件作用于 reservation_records 的编码列。
+        """
+        clauses = []
+        params = []
+
+        for column, code_column, table, value in (
+                ("hospital_campus", "campus_id", "campuses", campus),
+                ("blood_product_type", "product_type_id", "product_types", product_type),
+                ("blood_type", "blood_type_id", "blood_types", blood_type)):
+            if not value:
+                continue
+            if encoded:
+                clauses.append(f"{code_column} = (SELECT id FROM {table} WHERE name = ?)")
+            else:
+                clauses.append(f"{column} = ?")
+            params.append(value)
+        if start:
+            column, op, bound = self._time_bound(start)
+            clauses.append(f"{column} {op} ?")
+            params.append(bound)
+        if end:
+            column, op, bound = self._time_bound(end, is_end=True)
+            clauses.append(f"{column} {op} ?")
+            params.append(bound)
+
+        where_sql = " WHERE " + " AND ".join(clauses) if clauses else ""
+        return where_sql, params
+
+    # 查询结果缓存：每个连接最多缓存的查询数（0 表示不缓存）；行数超过上限的结果不缓存
+    RESULT_CACHE_SIZE = 64
+    RESULT_CACHE_MAX_ROWS = 10000
+
+    def _cached_rows(self, conn, sql, params, decode=None):
+        """执行只读查询，结果按 (SQL, 参数) 缓存在当前线程连接的 LRU 中
+
+        缓存以 PRAGMA data_version（其他连接或进程提交后变化）和 total_changes
+        （本连接写入后变化）校验，任一变化时整个缓存失效；校验只需一条 PRAGMA。
+        conn 必须是 _get_connection() 返回的当前线程连接。
+        """
+        version = (conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+        local = self._local
+        cache = getattr(local, "result_cache", None)
+        if cache is None or local.result_cache_version != version:
+            cache = local.result_cache = OrderedDict()
+            local.result_cache_version = version
+
+        key = (sql, tuple(params))
+        rows = cache.get(key)
+        with self._cache_lock:
+            self.result_cache_stats["hits" if rows is not None else "misses"] += 1
+        if rows is not None:
+            cache.move_to_end(key)
+            return list(rows)
+
+        rows = conn.execute(sql, params).fetchall()
+        if decode:
+            rows = decode(rows)
+        if 0 < self.RESULT_CACHE_SIZE and len(rows) <= self.RESULT_CACHE_MAX_ROWS:
+            cache[key] = tuple(rows)
+            if len(cache) > self.RESULT_CACHE_SIZE:
+                cache.popitem(last=False)
+        return rows
+
+    def query_reservations(self, campus=None, start=None, end=None, product_type=None,
+                           blood_type=None, limit=None, offset=None):
+        """按条件查询预约记录（所有筛选都在SQL中完成，结果缓存见 _cached_rows）
+
+        Args:
+            campus: 院区，None 表示全部
+            start: 开始日期/时间（包含），'yyyy-MM-dd'、'yyyy-MM-dd hh:mm:ss'、date 或 datetime
+            end: 结束日期/时间（包含；纯日期表示包含当天）
+            product_type: 血制品大类
+            blood_type: 血型
+            limit: 最多返回条数
+            offset: 跳过的条数
+
+        Returns:
+            list: 与 get_all_reservations 相同格式的记录列表（按ID倒序）
+        """
+        conn = self._get_connection()
+        sql, params, decode = self._select_reservations(conn, {
+            "campus": campus, "start": start, "end": end,
+            "product_type": product_type, "blood_type": blood_type,
+        })
+        sql += " ORDER BY id DESC"
+
+        if limit is not None or offset is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([-1 if limit is None else int(limit), int(offset or 0)])
+
+        return self._cached_rows(conn, sql, params, decode)
+
+    def search(self, text, filters=None, limit=100):
+        """全文检索预约记录：院区、血制品大类/亚类、血型、预约日期中包含所有输入词的记录
+
+        输入按空白分为多个词（如 "辐照 AB 光谷"），每个词可以是任一字段的任意部分，
+        不区分英文大小写。检索使用 FTS5 索引，只涉及主库中的记录（不含已归档年份）。
+
+        Args:
+            text: 检索文本，为空时等同于 query_reservations
+            filters: 筛选条件字典，键与 query_reservations 的筛选参数相同
+            limit: 最多返回条数，None 表示不限
+
+        Returns:
+            list: 与 get_all_reservations 相同格式的记录列表（按ID倒序）
+        """
+        query = self._search_query(text)
+        if not query:
+            return self.query_reservations(**(filters or {}), limit=limit)
+        if not self.search_index_ready():
+            # bulk_load 跳过了检索索引：第一次检索时重建
+            self.rebuild_search_index()
+
+        conn = self._get_connection()
+        where_sql, params = self._build_where(**(filters or {}), encoded=True)
+        # 由检索索引按 rowid 倒序驱动，取够 limit 条即停止
+        sql = f'''
+            SELECT {self._RECORD_COLUMNS} FROM reservation_search
+            CROSS JOIN reservation_records ON reservation_records.id = reservation_search.rowid
+            WHERE reservation_search MATCH ?''' + where_sql.replace(" WHERE ", " AND ", 1)
+        params.insert(0, query)
+        sql += " ORDER BY reservation_search.rowid DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return self._cached_rows(conn, sql, params, self._decoder(conn))
+
+    @staticmethod
+    def _search_query(text):
+        """把检索文本转换为 FTS5 查询：每个词转换为逐字的短语，词之间为 AND"""
+        phrases = []
+        # 空白和常用的中英文分隔符号分隔多个词
+        for term in re.split(r"[\s,，、;；]+", text or ""):
+            # 标点等非文字字符不是索引中的词，与分词器一样忽略
+            chars = [char for char in term if char.isalnum()]
+            if chars:
+                phrases.append('"' + " ".join(chars) + '"')
+        return " ".join(phrases)
+
+    def iter_reservations(self, filters=None, batch_size=1000, snapshot=False):
+        """逐批读取预约记录的生成器（fetchmany），内存占用与表大小无关
+
+        Args:
+            filters: 筛选条件字典，键与 query_reservations 的筛选参数相同
+                     （campus/start/end/product_type/blood_type）
+            batch_size: 每次 fetchmany 的行数
+            snapshot: 为 True 时通过只读快照连接读取（见 snapshot()），
+                      导出、打印等长时间遍历应使用
+
+        回滚日志模式下打开着的读语句会阻塞其他工作站提交，此时不论 snapshot 取值，
+        都按 id 分批读取，每批一条语句读完即释放锁（见 _iter_batches）。
+
+        Yields:
+            tuple: 与 get_all_reservations 相同格式的记录（按ID倒序）
+        """
+        if self.journal_mode != "wal":
+            yield from self._iter_batches(filters, batch_size)
+        elif snapshot:
+            with self.snapshot(filters) as conn:
+                yield from self._iter_rows(conn, filters, batch_size)
+        else:
+            yield from self._iter_rows(self._get_connection(), filters, batch_size)
+
+    def _iter_batches(self, filters, batch_size):
+        """按 id 键集分批读取预约记录，每批是一个短读事务，两批之间不持有锁
+
+        开始读取之后新增的记录 id 更大，不会出现在结果中；期间被删除的记录可能已经读出。
+        """
+        seek = None
+        while True:
+            conn = self._get_connection()
+            sql, params, decode = self._select_reservations(conn, filters, seek)
+            rows = conn.execute(sql + " ORDER BY id DESC LIMIT ?", params + [batch_size]).fetchall()
+            if decode:
+                rows = decode(rows)
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            seek = ("id < ?", [rows[-1][0]])
+
+    def _iter_rows(self, conn, filters, batch_size):
+        """在指定连接上逐批读取预约记录"""
+        sql, params, decode = self._select_reservations(conn, filters)
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql + " ORDER BY id DESC", params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from (decode(rows) if decode else rows)
+        finally:
+            # 提前停止迭代时也要释放语句，避免一直持有读锁
+            cursor.close()
+
+    # 汇总维度 -> SQL 表达式（原始表 / 按日汇总表）
+    _GROUP_COLUMNS = {
+        "campus": "hospital_campus",
+        "product_type": "blood_product_type",
+        "subtype": "COALESCE(blood_product_subtype, '')",
+        "blood_type": "blood_type",
+        "day": "substr(reservation_time, 1, 10)",
+        "month": "substr(reservation_time, 1, 7)",
+        "hour": "(reservation_epoch % 86400) / 3600",
+        # 新鲜冰冻血浆以 ml 计量，其他血制品以“单位”计量
+        "unit": f"CASE WHEN blood_product_type = '{PLASMA_PRODUCT_TYPE}' THEN 'ml' ELSE '单位' END",
+    }
+    _ROLLUP_GROUP_COLUMNS = {
+        "campus": "campus",
+        "product_type": "product_type",
+        "subtype": "subtype",
+        "blood_type": "blood_type",
+        "day": "day",
+        "month": "substr(day, 1, 7)",
+        "unit": f"CASE WHEN product_type = '{PLASMA_PRODUCT_TYPE}' THEN 'ml' ELSE '单位' END",
+    }
+
+    # 直接在 reservation_records 上分组时：维度 -> (按编号分组的表达式, 分组后换成名称的表达式)
+    # 先按整数编号分组，再把少量分组结果换成名称，避免逐行关联字典表
+    _ENCODED_GROUP_COLUMNS = {
+        "campus": ("campus_id", "(SELECT name FROM campuses WHERE id = g_campus)"),
+        "product_type": ("product_type_id", "(SELECT name FROM product_types WHERE id = g_product_type)"),
+        "subtype": ("subtype_id",
+                    "COALESCE((SELECT name FROM product_subtypes WHERE id = g_subtype), '')"),
+        "blood_type": ("blood_type_id", "(SELECT name FROM blood_types WHERE id = g_blood_type)"),
+        "day": ("substr(reservation_time, 1, 10)", "g_day"),
+        "month": ("substr(reservation_time, 1, 7)", "g_month"),
+        "hour": ("(reservation_epoch % 86400) / 3600", "g_hour"),
+        "unit": ("CASE WHEN product_type_id = (SELECT id FROM product_types WHERE name = "
+                 f"'{PLASMA_PRODUCT_TYPE}') THEN 'ml' ELSE '单位' END", "g_unit"),
+    }
+
+    # 汇总指标 -> SQL 聚合表达式（原始表 / 按日汇总表）
+    _MEASURES = {
+        "count": "COUNT(*)",
+        "sum_quantity": "TOTAL(quantity)",
+    }
+    _ROLLUP_MEASURES = {
+        "count": "COALESCE(SUM(record_count), 0)",
+        "sum_quantity": "TOTAL(quantity_sum)",
+    }
+    # 按编号分组后再按名称合并（亚类 NULL 与 '' 显示相同，需要合并）
+    _REGROUP_MEASURES = {
+        "count": "COALESCE(SUM(m_count), 0)",
+        "sum_quantity": "TOTAL(m_sum_quantity)",
+    }
+
+    def _build_rollup_where(self, campus=None, start=None, end=None,
+                            product_type=None, blood_type=None):
+        """构造按日汇总表的 WHERE 子句；时间边界不是整天时返回 None（只能查原始表）"""
+        clauses = []
+        params = []
+
+        for column, value in (("campus", campus), ("product_type", product_type),
+                              ("blood_type", blood_type)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+
+        for op, value in ((">=", start), ("<=", end)):
+            if not value:
+                continue
+            if isinstance(value, datetime):
+                return None
+            if isinstance(value, date):
+                value = value.strftime("%Y-%m-%d")
+            value = str(value).strip()
+            if len(value) != 10:
+                return None
+            clauses.append(f"day {op} ?")
+            params.append(value)
+
+        where_sql = " WHERE " + " AND ".join(clauses) if clauses else ""
+        return where_sql, params
+
+    def aggregate(self, group_by=(), filters=None, measures=("count", "sum_quantity"),
+                  use_rollup=True):
+        """在数据库中按维度分组汇总预约记录
+
+        筛选条件只含整天的日期范围时直接读取按日汇总表（行数与天数成正比），
+        否则对原始记录执行 GROUP BY。
+
+        Args:
+            group_by: 分组维度列表，可选 campus/product_type/subtype/blood_type/day/month/hour/unit
+            filters: 筛选条件字典，键与 query_reservations 的筛选参数相同
+            measures: 汇总指标，可选 count（记录数）、sum_quantity（数量合计）
+            use_rollup: 是否允许使用按日汇总表
+
+        Returns:
+            list: 每组一个字典，包含分组维度和指标，按分组维度排序。
+                  汇总数量时自动按 unit 分组，ml 和“单位”不会相加。
+        """
+        group_by = list(group_by)
+        measures = list(measures)
+
+        for name in group_by:
+            if name not in self._GROUP_COLUMNS:
+                raise ValueError(f"不支持的分组维度: {name}")
+        for name in measures:
+            if name not in self._MEASURES:
+                raise ValueError(f"不支持的汇总指标: {name}")
+        if not measures:
+            raise ValueError("至少需要一个汇总指标")
+
+        # 数量单位不同，不能跨单位求和
+        if "sum_quantity" in measures and "unit" not in group_by:
+            group_by.append("unit")
+
+        conn = self._get_connection()
+        # 按日汇总表只覆盖主库中的记录，涉及归档年份时读取合并视图
+        source = self._reservation_source(conn, filters)
+
+        rollup_where = None
+        if use_rollup and source == "reservations" and all(
+                name in self._ROLLUP_GROUP_COLUMNS for name in group_by):
+            rollup_where = self._build_rollup_where(**(filters or {}))
+        if rollup_where is not None:
+            table = "reservation_daily_rollup"
+            group_columns, measure_columns = self._ROLLUP_GROUP_COLUMNS, self._ROLLUP_MEASURES
+            where_sql, params = rollup_where
+        elif source == "reservations":
+            # 内层在编码列上分组，外层把编号换成名称并合并
+            inner_where, params = self._build_where(**(filters or {}), encoded=True)
+            inner_parts = [f"{self._ENCODED_GROUP_COLUMNS[name][0]} AS g_{name}" for name in group_by]
+            inner_parts += [f"{self._MEASURES[name]} AS m_{name}" for name in measures]
+            table = f"(SELECT {', '.join(inner_parts)} FROM reservation_records{inner_where}"
+            if group_by:
+                table += " GROUP BY " + ", ".join(f"g_{name}" for name in group_by)
+            table += ")"
+            group_columns = {name: expr for name, (_, expr) in self._ENCODED_GROUP_COLUMNS.items()}
+            measure_columns = self._REGROUP_MEASURES
+            where_sql = ""
+        else:
+            table = source
+            group_columns, measure_columns = self._GROUP_COLUMNS, self._MEASURES
+            where_sql, params = self._build_where(**(filters or {}))
+
+        select_parts = [f"{group_columns[name]} AS {name}" for name in group_by]
+        select_parts += [f"{measure_columns[name]} AS {name}" for name in measures]
+
+        sql = f"SELECT {', '.join(select_parts)} FROM {table}{where_sql}"
+        if group_by:
+            group_sql = ", ".join(group_by)
+            sql += f" GROUP BY {group_sql} ORDER BY {group_sql}"
+
+        # 列顺序与 select_parts 一致
+        columns = group_by + measures
+        return [dict(zip(columns, row)) for row in self._cached_rows(conn, sql, params)]
+
+    # 分页排序方式 -> (排序键列, ORDER BY 子句)
+    _PAGE_ORDERS = {
+        "id": (("id",), "id DESC"),
+        "time": (("reservation_time", "id"), "reservation_time DESC, id DESC"),
+    }
+
+    @staticmethod
+    def _encode_page_token(order_by, key):
+        """将排序方式和最后一行的排序键编码为不透明的续页令牌"""
+        payload = json.dumps({"o": order_by, "k": list(key)}, ensure_ascii=False)
+        return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def _decode_page_token(token, order_by):
+        """解析续页令牌，返回排序键"""
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8"))
+            key = payload["k"]
+            token_order = payload["o"]
+        except (ValueError, TypeError, KeyError, AttributeError):
+            raise ValueError("无效的分页令牌")
+        if token_order != order_by:
+            raise ValueError(f"分页令牌的排序方式 ({token_order}) 与请求 ({order_by}) 不一致")
+        return key
+
+    def get_reservations_page(self, page_size=100, token=None, filters=None, order_by="id"):
+        """按键集（keyset）分页读取预约记录
+
+        按 id（或 reservation_time, id）定位下一页的起点，而不是 OFFSET，
+        因此无论翻到第几页，每页的代价都与第一页相同。
+
+        Args:
+            page_size: 每页记录数
+            token: 上一页返回的续页令牌，None 表示第一页
+            filters: 筛选条件字典，键与 query_reservations 的筛选参数相同
+            order_by: "id"（按ID倒序）或 "time"（按预约时间倒序，时间相同按ID倒序）
+
+        Returns:
+            tuple: (记录列表, 下一页令牌)；已是最后一页时令牌为 None
+        """
+        if order_by not in self._PAGE_ORDERS:
+            raise ValueError(f"不支持的排序方式: {order_by}")
+        if page_size < 1:
+            raise ValueError("page_size 必须大于0")
+
+        key_columns, order_sql = self._PAGE_ORDERS[order_by]
+
+        seek = None
+        if token is not None:
+            key = self._decode_page_token(token, order_by)
+            if len(key) != len(key_columns):
+                raise ValueError("无效的分页令牌")
+            # 行值比较可以直接利用 (reservation_time, rowid) 索引顺序定位
+            seek = ("({}) < ({})".format(", ".join(key_columns), ", ".join("?" * len(key_columns))),
+                    key)
+
+        conn = self._get_connection()
+        sql, params, decode = self._select_reservations(conn, filters, seek)
+        sql += f" ORDER BY {order_sql} LIMIT ?"
+        params.append(int(page_size) + 1)
+
+        rows = self._cached_rows(conn, sql, params, decode)
+
+        next_token = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = rows[-1]
+            key = (last[0],) if order_by == "id" else (last[6], last[0])
+            next_token = self._encode_page_token(order_by, key)
+
+        return rows, next_token
+
+    def get_distinct_dates(self, campus=None):
+        """获取有预约记录的日期列表（升序），用于日期筛选下拉菜单
+
+        主库的日期从按日汇总表读取（其主键以日期开头），已归档的日期从 reservation_archive_days
+        读取，不需要附加归档库。结果通过 _cached_rows 缓存，本进程或其他工作站提交后失效。
+
+        Args:
+            campus: 院区，None 表示全部院区
+
+        Returns:
+            list: 'yyyy-MM-dd' 字符串列表
+        """
+        if campus:
+            sql = ("SELECT day FROM reservation_daily_rollup WHERE campus = ? "
+                   "UNION SELECT day FROM reservation_archive_days WHERE campus = ? ORDER BY day")
+            params = (campus, campus)
+        else:
+            sql = ("SELECT day FROM reservation_daily_rollup "
+                   "UNION SELECT day FROM reservation_archive_days ORDER BY day")
+            params = ()
+        return [row[0] for row in self._cached_rows(self._get_connection(), sql, params)]
+
+    def get_change_seq(self):
+        """返回变更日志的最新序号
+
+        列表窗口全量加载之前读取，之后用 get_changes_since 只取增量。
+        """
+        row = self._get_connection().execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'reservation_changes'"
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_changes_since(self, seq, limit=None):
+        """读取序号 seq 之后的记录变更，刷新代价与变更条数成正比
+
+        Args:
+            seq: 上次读取到的序号（get_change_seq 或上一次调用的返回值）
+            limit: 变更超过该条数时不返回明细（此时全量重新加载更快）
+
+        Returns:
+            tuple: (变更列表, 最新序号)。变更按发生顺序排列，每项为 (操作, 记录ID, 记录)：
+                   操作为 'insert'、'update'、'delete' 或 'clear'；insert/update 的记录为
+                   与 get_all_reservations 相同格式的当前内容（之后已被删除时为 None），
+                   delete/clear 的记录为 None。seq 之后的日志已被清理或变更超过 limit 时
+                   变更列表为 None，调用方需要全量重新加载（之后从返回的序号继续；
+                   重新加载期间发生的变更可能再次出现，应按记录ID幂等处理）。
+        """
+        sql = '''
+            SELECT c.seq, c.op, c.reservation_id,
+                   r.id, r.campus_id, r.product_type_id, r.subtype_id, r.blood_type_id,
+                   r.quantity, r.reservation_time
+            FROM reservation_changes c
+            LEFT JOIN reservation_records r
+                   ON r.id = c.reservation_id AND c.op IN ('insert', 'update')
+            WHERE c.seq > ?
+            ORDER BY c.seq'''
+        params = [seq]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit) + 1)
+
+        conn = self._get_connection()
+        rows = conn.execute(sql, params).fetchall()
+        if not rows:
+            return [], seq
+        # 日志只会从头部清理（或 clear 后整体重建），序号不连续说明中间的变更已丢失
+        if rows[0][0] != seq + 1 or (limit is not None and len(rows) > limit):
+            return None, self.get_change_seq()
+
+        records = self._decoder(conn)([row[3:] for row in rows if row[3] is not None])
+        records = {record[0]: record for record in records}
+        changes = [(op, res_id, records.get(res_id) if op in ("insert", "update") else None)
+                   for _, op, res_id, *_ in rows]
+        return changes, rows[-1][0]
 
     def get_reservation_by_id(self, res_id):
-        """根据ID获取预约记录"""
-        conn = sqlite3.connect(self.db_path)
+        """根据ID获取预约记录（主库中没有时查找归档库）"""
+        conn = self._get_connection()
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -138,27 +2203,622 @@ class BloodReservationDB:
         ''', (res_id,))
 
         result = cursor.fetchone()
-        conn.close()
+        if result is None:
+            for _, schema in self._attach_archives(conn):
+                cursor.execute(f"SELECT {self._ARCHIVE_COLUMNS} FROM {schema}.reservations WHERE id = ?",
+                               (res_id,))
+                row = cursor.fetchone()
+                if row is not None:
+                    # 归档表多一列 reservation_epoch
+                    return row[:7]
         return result
 
     def delete_reservation(self, res_id):
-        """删除指定ID的预约记录"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """删除指定ID的预约记录（包括已移入归档库的记录）"""
+        return self.delete_reservations([res_id])
 
-        cursor.execute("DELETE FROM reservations WHERE id = ?", (res_id,))
-        affected_rows = cursor.rowcount
-        conn.commit()
-        conn.close()
+    def delete_reservations(self, ids, chunk_size=500):
+        """在一个事务中删除多条预约记录（包括已移入归档库的记录），返回删除的记录数
+
+        Args:
+            ids: 记录ID列表
+            chunk_size: 每条 DELETE 语句包含的ID数（受 SQL 参数个数限制）
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size 必须大于0")
+        ids = [int(res_id) for res_id in ids]
+        if not ids:
+            return 0
+        chunks = [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+        # ATTACH 不能在事务中执行
+        archives = self._attach_archives(self._get_connection())
+
+        def delete(conn):
+            cursor = conn.cursor()
+            affected_rows = 0
+            for chunk in chunks:
+                where_sql = f" WHERE id IN ({', '.join('?' * len(chunk))})"
+                cursor.execute("DELETE FROM reservation_records" + where_sql, chunk)
+                affected_rows += cursor.rowcount
+                affected_rows += self._delete_archived(cursor, archives, where_sql, chunk)
+            return affected_rows
+
+        return self._retry_write(delete)
+
+    def delete_range(self, filters):
+        """在一个事务中删除符合筛选条件的全部预约记录（包括已移入归档库的记录），返回删除的记录数
+
+        filters 与 query_reservations 的筛选参数相同（campus/start/end/product_type/blood_type），
+        至少指定一项；清空全部记录用 clear_all_reservations。
+        """
+        filters = {key: value for key, value in (filters or {}).items() if value}
+        if not filters:
+            raise ValueError("delete_range 至少需要一个筛选条件")
+        where_sql, params = self._build_where(**filters, encoded=True)
+        conn = self._get_connection()
+        archives = self._attach_archives(conn, self._archived_years(conn, filters.get("start"), filters.get("end")))
+        archive_where, archive_params = self._build_where(**filters)
+
+        def delete(conn):
+            cursor = conn.cursor()
+            cursor.execute(f"DELETE FROM reservation_records{where_sql}", params)
+            return cursor.rowcount + self._delete_archived(cursor, archives, archive_where, archive_params)
+
+        return self._retry_write(delete)
+
+    def _delete_archived(self, cursor, archives, where_sql, params):
+        """在写事务中删除已附加归档库中符合条件的记录，返回删除的记录数
+
+        同时更新归档登记表的记录数、移除不再有记录的归档日期，并为删除的记录写入变更日志。
+        """
+        affected_rows = 0
+        for year, schema in archives:
+            cursor.execute(f"SELECT id, reservation_time, hospital_campus FROM {schema}.reservations{where_sql}",
+                           params)
+            rows = cursor.fetchall()
+            if not rows:
+                continue
+            cursor.execute(f"DELETE FROM {schema}.reservations{where_sql}", params)
+            affected_rows += cursor.rowcount
+            cursor.executemany("INSERT INTO reservation_changes (op, reservation_id) VALUES ('delete', ?)",
+                               [(row[0],) for row in rows])
+            for day, campus in {(row[1][:10], row[2]) for row in rows}:
+                cursor.execute(f'''
+                    DELETE FROM reservation_archive_days WHERE day = ? AND campus = ? AND NOT EXISTS (
+                        SELECT 1 FROM {schema}.reservations
+                        WHERE reservation_time >= ? AND reservation_time <= ? AND hospital_campus = ?
+                    )
+                ''', (day, campus, day, day + " 23:59:59", campus))
+            cursor.execute(f"UPDATE reservation_archives SET row_count = (SELECT COUNT(*) FROM {schema}.reservations) "
+                           f"WHERE year = ?", (year,))
         return affected_rows
 
-    def clear_all_reservations(self):
-        """清空所有预约记录"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def clear_all_reservations(self, truncate=False):
+        """清空所有预约记录（包括归档库中的记录），返回删除的记录数
 
-        cursor.execute("DELETE FROM reservations")
-        affected_rows = cursor.rowcount
-        conn.commit()
-        conn.close()
+        归档库在同一个事务中清空并注销，提交后删除归档库文件。
+        truncate 为 True 时随后用 reclaim_space 把空出的页归还给文件系统，数据库文件随之缩小。
+        """
+        conn = self._get_connection()
+        years = self._archived_years(conn)
+        archives = self._attach_archives(conn, years)
+
+        def clear(conn):
+            cursor = conn.cursor()
+            archived_rows = 0
+            for _, schema in archives:
+                cursor.execute(f"DELETE FROM {schema}.reservations")
+                archived_rows += cursor.rowcount
+            cursor.execute("DELETE FROM reservation_archive_days")
+            cursor.execute("DELETE FROM reservation_archives")
+            seq = self._read_sequence(cursor, "reservation_changes") or 0
+            # 逐行执行汇总、变更日志、检索索引触发器很慢：在事务中暂时删除触发器，
+            # 不带条件的 DELETE 直接清空整张表，派生的表随后一并清空，提交前恢复触发器
+            cursor.execute("SELECT name, sql FROM sqlite_master "
+                           "WHERE type = 'trigger' AND tbl_name = 'reservation_records'")
+            triggers = cursor.fetchall()
+            for name, _ in triggers:
+                cursor.execute(f"DROP TRIGGER {name}")
+            cursor.execute("DELETE FROM reservation_records")
+            affected_rows = cursor.rowcount
+            cursor.execute("DELETE FROM reservation_daily_rollup")
+            cursor.execute("INSERT INTO reservation_search (reservation_search) VALUES ('delete-all')")
+            for _, sql in triggers:
+                cursor.execute(sql)
+            # 读取方只需要知道全部清空：日志换成紧接原序号的一条 clear，序号仍然连续
+            cursor.execute("DELETE FROM reservation_changes")
+            cursor.execute("INSERT INTO reservation_changes (seq, op) VALUES (?, 'clear')", (seq + 1,))
+            cursor.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'reservation_changes'", (seq + 1,))
+            return affected_rows + archived_rows
+
+        try:
+            affected_rows = self._retry_write(clear)
+        finally:
+            for _, schema in archives:
+                conn.execute(f"DETACH DATABASE {schema}")
+        for _, file_name in years:
+            try:
+                self._remove_database_files(self._archive_path(file_name))
+            except OSError:
+                # 其他工作站正在读取时无法删除（Windows）；归档库已清空并注销，不影响使用
+                pass
+        if truncate:
+            if not self.incremental_vacuum_enabled():
+                # 旧数据库：清空后文件中几乎只剩空闲页，这时转换的 VACUUM 很快
+                try:
+                    self.enable_incremental_vacuum()
+                except sqlite3.OperationalError:
+                    # 其他连接正在使用数据库时无法 VACUUM，记录已清空，之后再回收
+                    pass
+            else:
+                self.reclaim_space()
         return affected_rows
+
+    # ---------- 回收空间 ----------
+
+    def incremental_vacuum_enabled(self):
+        """数据库是否已启用增量 auto_vacuum（PRAGMA auto_vacuum = INCREMENTAL）"""
+        return self._get_connection().execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+    def enable_incremental_vacuum(self):
+        """为旧数据库启用增量 auto_vacuum（新建的数据库已默认启用）
+
+        切换需要执行一次完整的 VACUUM：重写整个文件，期间其他连接无法写入，
+        只在维护时执行（或在清空记录后，见 clear_all_reservations）。
+        """
+        conn = self._get_connection()
+        conn.commit()
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        if self.journal_mode == "wal":
+            self.checkpoint("TRUNCATE")
+
+    def reclaim_space(self, max_pages=None, pages_per_step=1024, sleep=0.01):
+        """把空闲页分步归还给文件系统（增量 VACUUM），返回归还的页数
+
+        删除记录后空出的页留在文件中供之后的写入复用，文件不会变小。启用增量
+        auto_vacuum 时，每步在一个短事务中释放 pages_per_step 页，两步之间等待 sleep 秒，
+        其他连接的提交可以穿插进行，不需要阻塞写入的完整 VACUUM。未启用时返回 0。
+
+        Args:
+            max_pages: 最多归还的页数，默认全部空闲页
+            pages_per_step: 每个事务释放的页数
+            sleep: 两步之间等待的秒数
+        """
+        if pages_per_step < 1:
+            raise ValueError("pages_per_step 必须大于0")
+        if not self.incremental_vacuum_enabled():
+            return 0
+
+        def step(conn):
+            cursor = conn.cursor()
+            cursor.execute("PRAGMA freelist_count")
+            count = min(cursor.fetchone()[0], pages_per_step)
+            if max_pages is not None:
+                count = min(count, max_pages - freed)
+            # sqlite3 模块对不返回列的语句只执行一步，incremental_vacuum 每步只释放一页
+            for _ in range(count):
+                cursor.execute("PRAGMA incremental_vacuum")
+            return count
+
+        freed = 0
+        while True:
+            count = self._retry_write(step)
+            freed += count
+            if count < pages_per_step or (max_pages is not None and freed >= max_pages):
+                break
+            if sleep > 0:
+                time.sleep(sleep)
+        if freed and self.journal_mode == "wal":
+            # WAL 模式下检查点把提交写回数据库文件时才截断文件
+            self.checkpoint()
+        return freed
+
+    # ---------- 按年份归档 ----------
+
+    # 归档库与合并视图中的列（与 reservations 表一致）
+    _ARCHIVE_COLUMNS = (
+        "id, hospital_campus, blood_product_type, blood_product_subtype, "
+        "blood_type, quantity, reservation_time, reservation_epoch"
+    )
+
+    # 默认把一年前的记录移入归档库
+    ARCHIVE_HORIZON_DAYS = 365
+
+    def _archive_path(self, file_name):
+        """归档库文件与主数据库放在同一目录"""
+        return os.path.join(os.path.dirname(os.path.abspath(self.db_path)), file_name)
+
+    def _attach_archive(self, conn, year, file_name):
+        """把某年的归档库附加到连接上（已附加时跳过），返回其 schema 名"""
+        if not str(year).isdigit():
+            raise ValueError(f"无效的归档年份: {year!r}")
+        schema = f"archive_{year}"
+        attached = {row[1] for row in conn.execute("PRAGMA database_list")}
+        if schema not in attached:
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (self._archive_path(file_name),))
+        return schema
+
+    @staticmethod
+    def _bound_text(value):
+        """把筛选边界转换为与 reservation_time 可比较的文本"""
+        if isinstance(value, datetime):
+            return value.strftime("%Y-%m-%d %H:%M:%S")
+        if isinstance(value, date):
+            return value.isoformat()
+        return str(value).strip()
+
+    def _archived_years(self, conn, start=None, end=None):
+        """返回与时间范围有交集的归档 [(年份, 文件名)]"""
+        archives = conn.execute(
+            "SELECT year, file_name, archived_before FROM reservation_archives ORDER BY year"
+        ).fetchall()
+        if not archives:
+            return []
+
+        start_text = self._bound_text(start) if start else None
+        end_year = self._bound_text(end)[:4] if end else None
+        return [
+            (year, file_name) for year, file_name, archived_before in archives
+            if (start_text is None or (year >= start_text[:4] and start_text < archived_before))
+            and (end_year is None or year <= end_year)
+        ]
+
+    def _reservation_source(self, conn, filters=None):
+        """返回查询应读取的表名
+
+        时间范围不涉及已归档年份时直接读取 reservations；否则按需附加对应年份的
+        归档库，返回主表与这些归档表 UNION ALL 的临时视图（主库中仍有的记录不重复列出）。
+        """
+        filters = filters or {}
+        years = self._archived_years(conn, filters.get("start"), filters.get("end"))
+        if not years:
+            return "reservations"
+
+        schemas = [self._attach_archive(conn, year, file_name) for year, file_name in years]
+        view = "reservations_with_" + "_".join(year for year, _ in years)
+        selects = [f"SELECT {self._ARCHIVE_COLUMNS} FROM main.reservations"]
+        # 跨库事务在 WAL 模式下不保证原子性：归档中断时同一记录可能仍留在主库，以主库为准
+        selects += [f"SELECT {self._ARCHIVE_COLUMNS} FROM {schema}.reservations AS archived "
+                    "WHERE NOT EXISTS (SELECT 1 FROM main.reservation_records AS current "
+                    "WHERE current.id = archived.id)" for schema in schemas]
+        conn.execute(f"CREATE TEMP VIEW IF NOT EXISTS {view} AS " + " UNION ALL ".join(selects))
+        return view
+
+    def _attach_archives(self, conn, years=None):
+        """附加归档库（years 为 [(年份, 文件名)]，默认全部），返回 [(年份, schema)]
+
+        文件已不存在的归档跳过（ATTACH 不存在的文件会新建一个空库）。ATTACH 不能在事务中执行。
+        """
+        if years is None:
+            years = self._archived_years(conn)
+        return [(year, self._attach_archive(conn, year, file_name)) for year, file_name in years
+                if os.path.exists(self._archive_path(file_name))]
+
+    def _create_archive_table(self, conn, schema):
+        """在归档库中创建与主表相同的表和索引（id 沿用主库分配的值）"""
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {schema}.reservations (
+                id INTEGER PRIMARY KEY,
+                hospital_campus TEXT NOT NULL,
+                blood_product_type TEXT NOT NULL,
+                blood_product_subtype TEXT,
+                blood_type TEXT NOT NULL,
+                quantity REAL NOT NULL DEFAULT 1.0,
+                reservation_time TEXT NOT NULL,
+                reservation_epoch INTEGER
+            )
+        ''')
+        for name, columns in (("time", "reservation_time"),
+                              ("campus_time", "hospital_campus, reservation_time"),
+                              ("product_time", "blood_product_type, reservation_time"),
+                              ("epoch", "reservation_epoch")):
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_reservations_{name} "
+                         f"ON reservations ({columns})")
+
+    def archive_reservations(self, horizon_days=None, before=None):
+        """把早于保留期限的记录按年份移入归档库（如 records_archive_2023.db）
+
+        归档后主库只保留近期记录；查询的时间范围涉及已归档年份时才会附加归档库。
+        每个年份在一个事务中完成复制和删除；WAL 模式下跨文件提交不是原子的，
+        中途中断时重新执行即可（归档按 id 覆盖写入，不会重复）。
+
+        Args:
+            horizon_days: 保留最近多少天的记录，默认 ARCHIVE_HORIZON_DAYS
+            before: 直接指定归档截止日期（不含当天），优先于 horizon_days
+
+        Returns:
+            dict: 年份 -> 本次移入归档库的记录数
+        """
+        if before is None:
+            days = self.ARCHIVE_HORIZON_DAYS if horizon_days is None else int(horizon_days)
+            before = date.today() - timedelta(days=days)
+        cutoff = self._bound_text(before)[:10]
+
+        conn = self._get_connection()
+        years = [row[0] for row in conn.execute(
+            "SELECT DISTINCT substr(reservation_time, 1, 4) FROM reservations WHERE reservation_time < ?",
+            (cutoff,)
+        )]
+
+        base_name = os.path.splitext(os.path.basename(self.db_path))[0]
+        moved = {}
+        for year in years:
+            file_name = f"{base_name}_archive_{year}.db"
+            # ATTACH/DETACH 不能在事务中执行
+            schema = self._attach_archive(conn, year, file_name)
+            try:
+                moved[year] = self._archive_year(conn, schema, year, file_name, cutoff)
+            finally:
+                # 归档完成后分离，之后的查询按需重新附加
+                conn.execute(f"DETACH DATABASE {schema}")
+
+        return moved
+
+    def _archive_year(self, conn, schema, year, file_name, cutoff):
+        """把某一年早于 cutoff 的记录移入已附加的归档库，返回移动的记录数"""
+        self._create_archive_table(conn, schema)
+        conn.commit()
+
+        upper = min(f"{int(year) + 1:04d}-01-01", cutoff)
+
+        def move(conn):
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                INSERT OR REPLACE INTO {schema}.reservations ({self._ARCHIVE_COLUMNS})
+                SELECT {self._ARCHIVE_COLUMNS} FROM main.reservations
+                WHERE reservation_time >= ? AND reservation_time < ?
+            ''', (f"{year}-01-01", upper))
+            count = cursor.rowcount
+            self._record_archive_days(cursor, schema, f"{year}-01-01", upper)
+            seq = self._read_sequence(cursor, "reservation_changes") or 0
+            cursor.execute(
+                "DELETE FROM main.reservation_records WHERE reservation_time >= ? AND reservation_time < ?",
+                (f"{year}-01-01", upper)
+            )
+            # 移入归档库的记录仍是“全部记录”的一部分，不记为删除（否则列表增量刷新时会移除它们）
+            # 序号退回原值，读取方看到的日志仍然连续
+            cursor.execute("DELETE FROM reservation_changes WHERE seq > ?", (seq,))
+            cursor.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'reservation_changes'", (seq,))
+            cursor.execute(f'''
+                INSERT INTO reservation_archives (year, file_name, archived_before, row_count)
+                VALUES (?, ?, ?, (SELECT COUNT(*) FROM {schema}.reservations))
+                ON CONFLICT (year) DO UPDATE SET
+                    archived_before = MAX(archived_before, excluded.archived_before),
+                    row_count = excluded.row_count
+            ''', (year, file_name, upper))
+            return count
+
+        return self._retry_write(move)
+
+    @staticmethod
+    def _record_archive_days(cursor, schema, lower, upper):
+        """登记归档库 schema 中 lower <= 预约时间 < upper 的记录所在的日期及院区"""
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO reservation_archive_days (day, campus)
+            SELECT DISTINCT substr(reservation_time, 1, 10), hospital_campus FROM {schema}.reservations
+            WHERE reservation_time >= ? AND reservation_time < ?
+        ''', (lower, upper))
+
+    def get_archives(self):
+        """返回归档库列表 [(年份, 文件路径, 归档截止时间, 记录数)]"""
+        rows = self._get_connection().execute(
+            "SELECT year, file_name, archived_before, row_count FROM reservation_archives ORDER BY year"
+        ).fetchall()
+        return [(year, self._archive_path(file_name), archived_before, count)
+                for year, file_name, archived_before, count in rows]
+
+    # ---------- 在线备份 ----------
+
+    # 轮换备份的文件名：{数据库名}_backup_{时间}.db（按文件名排序即按时间排序）
+    BACKUP_TIME_FORMAT = "%Y%m%d_%H%M%S_%f"
+
+    # 分步备份因其他连接写入而重新开始的次数上限，超过后改为一步复制完
+    BACKUP_MAX_RESTARTS = 3
+
+    @staticmethod
+    def _remove_database_files(path):
+        """删除数据库文件及其日志文件（不存在时跳过）"""
+        for suffix in ("", "-journal", "-wal", "-shm"):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+
+    def backup(self, dest, pages_per_step=256, sleep=0.05, progress=None):
+        """在线备份到 dest（sqlite3 备份 API），返回备份文件的绝对路径
+
+        每复制 pages_per_step 页释放一次锁并等待 sleep 秒，备份期间本进程其他线程和
+        其他工作站可以继续提交。复制期间源库被其他连接修改时，SQLite 从头重新复制；
+        重新开始超过 BACKUP_MAX_RESTARTS 次时改为一步复制完（WAL 模式下不阻塞提交），
+        得到的都是某一时刻的一致副本。先写入临时文件，quick_check 通过后才替换 dest，
+        不会留下不完整的备份。只备份主库，归档库（见 archive_reservations）不在其中。
+
+        Args:
+            dest: 备份文件路径
+            pages_per_step: 每步复制的页数
+            sleep: 两步之间等待的秒数
+            progress: progress(剩余页数, 总页数) 回调
+
+        Raises:
+            sqlite3.DatabaseError: 备份副本未通过 quick_check
+        """
+        if pages_per_step < 1:
+            raise ValueError("pages_per_step 必须大于0")
+        if self._closed:
+            raise sqlite3.ProgrammingError("数据库已关闭")
+
+        dest = os.path.abspath(dest)
+        partial = dest + ".partial"
+        self._remove_database_files(partial)
+        state = {"pages": 0, "copied": 0, "restarts": 0}
+
+        def on_progress(status, remaining, total):
+            state["pages"] = total
+            copied = total - remaining
+            # 成功的一步之后已复制页数没有增加，说明这一步从头重新开始了
+            if status == sqlite3.SQLITE_OK and 0 < copied <= state["copied"]:
+                state["restarts"] += 1
+                if state["restarts"] > self.BACKUP_MAX_RESTARTS:
+                    raise _BackupRestarted()
+            state["copied"] = copied
+            if progress is not None:
+                progress(remaining, total)
+            if remaining and sleep > 0:
+                # 两步之间不持有锁，其他连接的提交在这段时间完成
+                time.sleep(sleep)
+
+        start = time.perf_counter()
+        # 单独的源连接：不占用各线程的长连接，也不受它们未结束事务的影响
+        source = self._connect()
+        try:
+            target = sqlite3.connect(partial)
+            try:
+                try:
+                    source.backup(target, pages=pages_per_step, progress=on_progress)
+                except _BackupRestarted:
+                    source.backup(target)
+                # 副本改用回滚日志，单个文件即是完整的数据库
+                target.execute("PRAGMA journal_mode = DELETE")
+                result = [row[0] for row in target.execute("PRAGMA quick_check")]
+            finally:
+                target.close()
+        except BaseException:
+            self._remove_database_files(partial)
+            raise
+        finally:
+            source.close()
+
+        if result != ["ok"]:
+            self._remove_database_files(partial)
+            raise sqlite3.DatabaseError(f"备份校验失败: {'; '.join(map(str, result[:5]))}")
+        os.replace(partial, dest)
+
+        with self._stats_lock:
+            self.backup_stats.update(backups=self.backup_stats["backups"] + 1, last_path=dest,
+                                     last_pages=state["pages"], last_restarts=state["restarts"],
+                                     last_seconds=time.perf_counter() - start)
+        return dest
+
+    def list_backups(self, directory):
+        """返回 directory 中本数据库的轮换备份文件路径（新的在前）"""
+        base_name = os.path.splitext(os.path.basename(self.db_path))[0]
+        pattern = re.compile(re.escape(base_name) + r"_backup_\d{8}_\d{6}_\d{6}\.db$")
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(directory, name) for name in sorted(names, reverse=True) if pattern.match(name)]
+
+    def backup_rotating(self, directory, keep=7, pages_per_step=256, sleep=0.05):
+        """在 directory 中生成一份带时间的备份，只保留最近 keep 份，返回新备份的路径"""
+        if keep < 1:
+            raise ValueError("keep 必须大于0")
+        os.makedirs(directory, exist_ok=True)
+        base_name = os.path.splitext(os.path.basename(self.db_path))[0]
+        stamp = datetime.now().strftime(self.BACKUP_TIME_FORMAT)
+        path = self.backup(os.path.join(directory, f"{base_name}_backup_{stamp}.db"), pages_per_step, sleep)
+        # 新备份校验通过后才删除最旧的几份
+        for old_path in self.list_backups(directory)[keep:]:
+            self._remove_database_files(old_path)
+        return path
+
+    def start_backup_schedule(self, directory, interval=24 * 3600, keep=7, pages_per_step=256, sleep=0.05):
+        """启动定时备份线程：每隔 interval 秒执行一次 backup_rotating
+
+        备份失败（如磁盘已满）时记录在 backup_stats 中，下个周期再试。
+        """
+        if self._closed:
+            raise sqlite3.ProgrammingError("数据库已关闭")
+        if self._backup_thread is not None:
+            return
+        self._backup_stop.clear()
+        self._backup_thread = threading.Thread(
+            target=self._backup_loop, args=(directory, interval, keep, pages_per_step, sleep),
+            name="db-backup", daemon=True
+        )
+        self._backup_thread.start()
+
+    def _backup_loop(self, directory, interval, keep, pages_per_step, sleep):
+        """定时备份线程"""
+        while not self._backup_stop.wait(interval):
+            try:
+                self.backup_rotating(directory, keep, pages_per_step, sleep)
+            except (sqlite3.Error, OSError) as e:
+                with self._stats_lock:
+                    self.backup_stats["failures"] += 1
+                    self.backup_stats["last_error"] = str(e)
+
+    def stop_backup_schedule(self):
+        """停止定时备份线程（正在进行的备份会先完成）"""
+        thread = self._backup_thread
+        if thread is None:
+            return
+        self._backup_stop.set()
+        if thread is not threading.current_thread():
+            thread.join()
+        self._backup_thread = None
+
+
+def main(argv=None):
+    """数据库维护命令行入口
+
+    用法:
+        python -m database.db_manager rebuild-rollup [records.db]
+        python -m database.db_manager archive [records.db] [--days 365]
+        python -m database.db_manager backup [records.db] [--dir backups] [--keep 7]
+        python -m database.db_manager reclaim [records.db] [--convert]
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="血制品预约数据库维护工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rollup_parser = subparsers.add_parser("rebuild-rollup", help="重建按日汇总表")
+    rollup_parser.add_argument("db_path", nargs="?", default="records.db", help="数据库文件路径")
+
+    archive_parser = subparsers.add_parser("archive", help="把早于保留期限的记录按年份移入归档库")
+    archive_parser.add_argument("db_path", nargs="?", default="records.db", help="数据库文件路径")
+    archive_parser.add_argument("--days", type=int, default=BloodReservationDB.ARCHIVE_HORIZON_DAYS,
+                                help="保留最近多少天的记录（默认 %(default)s）")
+
+    backup_parser = subparsers.add_parser("backup", help="在线备份数据库并轮换保留最近几份")
+    backup_parser.add_argument("db_path", nargs="?", default="records.db", help="数据库文件路径")
+    backup_parser.add_argument("--dir", default="backups", help="备份目录（默认 %(default)s）")
+    backup_parser.add_argument("--keep", type=int, default=7, help="保留的备份份数（默认 %(default)s）")
+
+    reclaim_parser = subparsers.add_parser("reclaim", help="把删除记录后空出的页归还给文件系统")
+    reclaim_parser.add_argument("db_path", nargs="?", default="records.db", help="数据库文件路径")
+    reclaim_parser.add_argument("--convert", action="store_true",
+                                help="旧数据库先启用增量 auto_vacuum（执行一次完整 VACUUM）")
+
+    args = parser.parse_args(argv)
+
+    with BloodReservationDB(args.db_path) as db:
+        if args.command == "rebuild-rollup":
+            count = db.rebuild_daily_rollup()
+            print(f"[OK] 按日汇总表已重建，共 {count} 个分组")
+        elif args.command == "archive":
+            moved = db.archive_reservations(horizon_days=args.days)
+            for year, count in moved.items():
+                print(f"  {year} 年: 归档 {count} 条")
+            print(f"[OK] 归档完成，共 {sum(moved.values())} 条")
+        elif args.command == "backup":
+            path = db.backup_rotating(args.dir, keep=args.keep)
+            stats = db.backup_stats
+            print(f"[OK] 已备份到 {path}（{stats['last_pages']} 页，{stats['last_seconds']:.2f} 秒，校验通过）")
+        elif args.command == "reclaim":
+            before = os.path.getsize(args.db_path)
+            if db.incremental_vacuum_enabled():
+                db.reclaim_space()
+            elif args.convert:
+                db.enable_incremental_vacuum()
+            else:
+                print("[提示] 数据库未启用增量 auto_vacuum，请加 --convert 转换（执行一次完整 VACUUM）")
+                return
+            after = os.path.getsize(args.db_path)
+            print(f"[OK] 数据库文件 {before / 1024 / 1024:.1f} MB -> {after / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -173,6 +173,7 @@ def demo_filtering_ui():
 
     # 清理
     print("\n[7] 清理演示文件...")
+    db.close()
     if os.path.exists("demo_filtering.db"):
         os.remove("demo_filtering.db")
         print("      ✓ 演示文件已清理")
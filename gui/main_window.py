@@ -3,18 +3,29 @@ from PySide6.QtWidgets import (
     QRadioButton, QLabel, QPushButton, QMessageBox, QFormLayout,
     QButtonGroup, QGroupBox, QDateTimeEdit, QFrame, QDoubleSpinBox
 )
-from PySide6.QtCore import Qt, QDateTime, QSize
+from PySide6.QtCore import Qt, QDateTime, QSize, QObject, Signal
 from PySide6.QtGui import QFont
-from database.db_manager import BloodReservationDB
+from database.db_manager import BloodReservationDB, DatabaseBusyError, configured_profile
 from utils.printer import BloodReservationPrinter
 import os
 
+
+class SubmitNotifier(QObject):
+    """把写入线程完成的提交结果转交到界面线程"""
+    finished = Signal(object, object)  # (Future, 预约信息)
+
+
 class MainWindow(QMainWindow):
     """血制品预约系统主窗口"""
 
     def __init__(self):
         super().__init__()
-        self.db = BloodReservationDB()
+        # 性能配置由环境变量 BLOOD_DB_PROFILE 指定，默认回滚日志（共享文件不切换为 WAL）
+        self.db = BloodReservationDB(profile=configured_profile())
+        # 多人同时提交时由写入线程组提交，界面线程不等待 fsync
+        self.db.start_writer()
+        self.submit_notifier = SubmitNotifier()
+        self.submit_notifier.finished.connect(self.on_submit_finished)
         self.init_ui()
 
     def init_ui(self):
@@ -328,28 +339,47 @@ class MainWindow(QMainWindow):
         quantity = self.quantity_spinbox.value()  # 获取数量
         reservation_time = self.reservation_time_edit.dateTime().toString("yyyy-MM-dd hh:mm:ss")
 
-        # 保存到数据库
+        # 交给写入线程保存；写入并落盘后才提示“提交成功”
+        details = (campus, product_type, product_subtype, blood_type, quantity, reservation_time)
         try:
-            self.db.add_reservation(campus, product_type, product_subtype, blood_type, quantity, reservation_time)
-
-            # 显示单位
-            unit = "ml" if product_type == "新鲜冰冻血浆" else "单位"
-            QMessageBox.information(
-                self,
-                "提交成功",
-                f"预约信息已成功保存！\n\n"
-                f"院区：{campus}\n"
-                f"血制品：{product_type}\n"
-                f"亚类：{product_subtype if product_subtype else '无'}\n"
-                f"血型：{blood_type}\n"
-                f"数量：{quantity} {unit}\n"
-                f"预约时间：{reservation_time}"
-            )
-
-            self.statusBar().showMessage("预约已提交", 5000)
-
+            future = self.db.submit_reservation(*details)
         except Exception as e:
             QMessageBox.critical(self, "提交失败", f"保存预约信息时出错：{str(e)}")
+            return
+
+        self.statusBar().showMessage("正在保存预约...")
+        # 回调在写入线程中执行，通过信号回到界面线程
+        future.add_done_callback(lambda f: self.submit_notifier.finished.emit(f, details))
+
+    def on_submit_finished(self, future, details):
+        """预约写入完成（界面线程）"""
+        campus, product_type, product_subtype, blood_type, quantity, reservation_time = details
+
+        error = future.exception()
+        if error is not None:
+            self.statusBar().clearMessage()
+            if isinstance(error, DatabaseBusyError):
+                # 其他工作站长时间占用数据库，稍后重新提交即可
+                QMessageBox.warning(self, "数据库繁忙", f"{str(error)}\n\n本条预约未保存，请稍后重新提交。")
+            else:
+                QMessageBox.critical(self, "提交失败", f"保存预约信息时出错：{str(error)}")
+            return
+
+        # 显示单位
+        unit = "ml" if product_type == "新鲜冰冻血浆" else "单位"
+        QMessageBox.information(
+            self,
+            "提交成功",
+            f"预约信息已成功保存！\n\n"
+            f"院区：{campus}\n"
+            f"血制品：{product_type}\n"
+            f"亚类：{product_subtype if product_subtype else '无'}\n"
+            f"血型：{blood_type}\n"
+            f"数量：{quantity} {unit}\n"
+            f"预约时间：{reservation_time}"
+        )
+
+        self.statusBar().showMessage("预约已提交", 5000)
 
     def view_all_reservations(self):
         """查看所有预约记录"""
@@ -362,3 +392,8 @@ class MainWindow(QMainWindow):
 
         except Exception as e:
             QMessageBox.critical(self, "错误", f"打开预约记录窗口时出错：{str(e)}")
+
+    def closeEvent(self, event):
+        """主窗口关闭事件：释放数据库连接"""
+        self.db.close()
+        event.accept()
@@ -14,7 +14,7 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 try:
-    from database.db_manager import BloodReservationDB
+    from database.db_manager import BloodReservationDB, configured_profile
     HAS_DB = True
 except ImportError:
     HAS_DB = False
@@ -41,14 +41,20 @@ class ReservationListWindow:
 
         # 初始化数据库
         # 如果提供了db实例，使用它；否则创建新的
+        # 自己创建的db实例在窗口关闭时负责关闭
+        self._owns_db = False
         if HAS_DB:
             if db_instance:
                 self.db = db_instance
             else:
-                self.db = BloodReservationDB()
+                self.db = BloodReservationDB(profile=configured_profile())
+                self._owns_db = True
         else:
             self.db = None
 
+        # 增量刷新：上次加载到的变更序号（列表项以记录ID作为 iid）
+        self.change_seq = None
+
         # 创建界面
         self.setup_ui()
 
@@ -130,7 +136,7 @@ class ReservationListWindow:
             toolbar_frame,
             text="🔄 刷新",
             font=('Microsoft YaHei', 10),
-            command=self.load_data,
+            command=self.refresh_data,
             bg='#3498db',
             fg='white',
             cursor='hand2'
@@ -250,21 +256,12 @@ class ReservationListWindow:
     def update_date_filter_options(self):
         """更新日期筛选下拉菜单选项"""
         try:
-            dates = set()
-
             if HAS_DB and self.db:
-                # 从数据库获取所有日期
-                all_data = self.db.get_all_reservations()
-                for record in all_data:
-                    # 提取日期部分 (YYYY-MM-DD)
-                    date = record[6][:10]
-                    dates.add(date)
+                # 从数据库获取所有日期（已排序，带缓存）
+                sorted_dates = self.db.get_distinct_dates()
             else:
                 # 演示模式：添加示例日期
-                dates.add("2024-11-11")
-
-            # 转换为排序后的列表
-            sorted_dates = sorted(list(dates))
+                sorted_dates = ["2024-11-11"]
 
             # 更新下拉菜单选项
             self.filter_date_combo['values'] = ("全部",) + tuple(sorted_dates)
@@ -296,9 +293,10 @@ class ReservationListWindow:
             # 提取日期部分 (YYYY-MM-DD)
             filter_date = filter_text[:10]
 
-            # 清空现有数据
+            # 清空现有数据（筛选结果不参与增量刷新）
             for item in self.tree.get_children():
                 self.tree.delete(item)
+            self.change_seq = None
 
             if not HAS_DB or not self.db:
                 # 演示模式：显示所有记录
@@ -309,10 +307,8 @@ class ReservationListWindow:
                 ]
                 data = demo_data
             else:
-                # 从数据库获取数据
-                all_data = self.db.get_all_reservations()
-                # 按日期筛选
-                data = [record for record in all_data if record[6][:10] == filter_date]
+                # 按日期筛选（由数据库完成）
+                data = self.db.query_reservations(start=filter_date, end=filter_date)
 
             # 插入数据
             total_quantity = 0
@@ -369,9 +365,12 @@ class ReservationListWindow:
                     ('3', '军山院区', '新鲜冰冻血浆', '无', 'O型', '3', '2024-11-11 14:30:00'),
                 ]
                 data = demo_data
+                self.change_seq = None
             else:
-                # 从数据库获取数据
-                data = self.db.get_all_reservations()
+                # 先记下变更序号，之后的刷新只读取增量
+                self.change_seq = self.db.get_change_seq()
+                # 从只读快照逐批读取数据（不阻塞提交）
+                data = self.db.iter_reservations(snapshot=True)
 
             # 插入数据
             total_quantity = 0
@@ -381,32 +380,24 @@ class ReservationListWindow:
                 # 统一处理：解包7个字段
                 res_id, campus, product_type, subtype, blood_type, quantity, reservation_time = record
 
-                # 处理亚类
-                if not subtype or subtype == '':
-                    subtype = '无'
-
-                # 根据血制品类型显示不同的单位
-                if product_type == "新鲜冰冻血浆":
-                    quantity_display = f"{quantity} ml"
-                else:
-                    quantity_display = f"{quantity} 单位"
-
-                # 插入到树形视图
-                item_id = self.tree.insert('', tk.END, values=(
-                    res_id, campus, product_type, subtype, blood_type,
-                    quantity_display, reservation_time
-                ))
+                # 插入到树形视图（以记录ID作为 iid，增量刷新时直接定位）
+                # iid 重复时 insert 会抛出 TclError：同一记录只显示一次
+                iid = str(res_id)
+                if self.tree.exists(iid):
+                    continue
+                item_id = self.tree.insert('', tk.END, iid=iid, values=self.record_values(record))
 
                 # 统计
                 total_quantity += int(quantity) if isinstance(quantity, int) else 1
                 campus_counts[campus] = campus_counts.get(campus, 0) + 1
 
             # 更新统计信息（只显示记录数）
-            stats_text = f"总记录数: {len(data)}"
+            count = len(self.tree.get_children())
+            stats_text = f"总记录数: {count}"
             self.stats_label.config(text=stats_text)
 
             # 更新状态栏
-            self.status_label.config(text=f"已加载 {len(data)} 条记录")
+            self.status_label.config(text=f"已加载 {count} 条记录")
 
             # 更新日期筛选下拉菜单选项
             self.update_date_filter_options()
@@ -423,6 +414,69 @@ class ReservationListWindow:
             # 更新状态栏显示错误
             self.status_label.config(text=f"加载数据失败: {str(e)[:50]}...", fg='#e74c3c')
 
+    @staticmethod
+    def record_values(record):
+        """把一条记录转换为列表各列的显示值"""
+        res_id, campus, product_type, subtype, blood_type, quantity, reservation_time = record
+
+        # 处理亚类
+        if not subtype or subtype == '':
+            subtype = '无'
+
+        # 根据血制品类型显示不同的单位
+        if product_type == "新鲜冰冻血浆":
+            quantity_display = f"{quantity} ml"
+        else:
+            quantity_display = f"{quantity} 单位"
+
+        return (res_id, campus, product_type, subtype, blood_type,
+                quantity_display, reservation_time)
+
+    def refresh_data(self):
+        """刷新：只应用上次加载之后的变更，代价与变更条数成正比
+
+        日期筛选状态下重新执行筛选；变更日志已被清理或变更太多时全量加载。
+        """
+        filter_text = self.filter_date_var.get().strip()
+        if filter_text and filter_text.lower() != "全部":
+            self.filter_by_date()
+            return
+        if not HAS_DB or not self.db or self.change_seq is None:
+            self.load_data()
+            return
+
+        try:
+            changes, self.change_seq = self.db.get_changes_since(self.change_seq, limit=1000)
+            if changes is None:
+                self.load_data()
+                return
+
+            for op, res_id, record in changes:
+                if op == "clear":
+                    self.tree.delete(*self.tree.get_children())
+                    continue
+
+                iid = str(res_id)
+                if record is None:
+                    # 删除（或新增后又被删除）
+                    if self.tree.exists(iid):
+                        self.tree.delete(iid)
+                elif self.tree.exists(iid):
+                    # 修改：原位更新（重新加载期间的新增也可能已在列表中）
+                    self.tree.item(iid, values=self.record_values(record))
+                else:
+                    # 新增：按ID倒序显示，放在最前面
+                    self.tree.insert('', 0, iid=iid, values=self.record_values(record))
+
+            count = len(self.tree.get_children())
+            self.stats_label.config(text=f"总记录数: {count}")
+            self.status_label.config(text=f"已刷新 {len(changes)} 条变更")
+            if changes:
+                self.update_date_filter_options()
+
+        except Exception as e:
+            messagebox.showerror("错误", f"刷新失败：{str(e)}")
+
     def sort_by_column(self, col):
         """按列排序"""
         # 获取所有数据
@@ -565,9 +619,8 @@ class ReservationListWindow:
         try:
             from utils.printer import BloodReservationPrinter
             printer = BloodReservationPrinter()
-            reservations = self.db.get_all_reservations()
-
-            if not reservations:
+            # 只查询一条记录判断是否有数据
+            if not self.db.query_reservations(limit=1):
                 messagebox.showwarning("警告", "没有预约记录可输出！")
                 return
 
@@ -579,7 +632,8 @@ class ReservationListWindow:
             )
 
             if output_file:
-                printer.print_all_reservations(reservations, output_file)
+                # 先从只读快照读出全部记录（读完即释放快照，排版期间不阻塞提交），再生成PDF
+                printer.print_all_reservations(self.db.iter_reservations(snapshot=True), output_file)
                 messagebox.showinfo("成功", f"汇总PDF已生成并保存到：\n{output_file}")
         except Exception as e:
             messagebox.showerror("错误", f"PDF输出失败：{str(e)}")
@@ -591,24 +645,34 @@ class ReservationListWindow:
             messagebox.showwarning("提示", "请先选择一条记录！")
             return
 
-        item = selection[0]
-        values = self.tree.item(item, 'values')
+        selected_values = [self.tree.item(item, 'values') for item in selection]
 
         # 确认删除
-        result = messagebox.askyesno(
-            "确认删除",
-            f"确定要删除这条预约记录吗？\n\n"
-            f"ID: {values[0]}\n"
-            f"院区: {values[1]}\n"
-            f"血制品: {values[2]}\n"
-            f"血型: {values[4]}"
-        )
+        if len(selected_values) == 1:
+            values = selected_values[0]
+            result = messagebox.askyesno(
+                "确认删除",
+                f"确定要删除这条预约记录吗？\n\n"
+                f"ID: {values[0]}\n"
+                f"院区: {values[1]}\n"
+                f"血制品: {values[2]}\n"
+                f"血型: {values[4]}"
+            )
+        else:
+            result = messagebox.askyesno(
+                "确认删除",
+                f"确定要删除选中的 {len(selected_values)} 条预约记录吗？\n\n此操作不可恢复！"
+            )
 
         if result:
             try:
-                affected_rows = self.db.delete_reservation(values[0])
-                self.load_data()
-                messagebox.showinfo("成功", f"记录 ID={values[0]} 已删除 (影响行数: {affected_rows})")
+                # 选中的记录在一个事务中删除
+                affected_rows = self.db.delete_reservations([values[0] for values in selected_values])
+                self.refresh_data()
+                if len(selected_values) == 1:
+                    messagebox.showinfo("成功", f"记录 ID={selected_values[0][0]} 已删除 (影响行数: {affected_rows})")
+                else:
+                    messagebox.showinfo("成功", f"已删除 {affected_rows} 条记录")
             except Exception as e:
                 import traceback
                 error_detail = traceback.format_exc()
@@ -629,7 +693,7 @@ class ReservationListWindow:
             try:
                 # 使用数据库类的方法来清空
                 affected_rows = self.db.clear_all_reservations()
-                self.load_data()
+                self.refresh_data()
                 messagebox.showinfo("成功", f"所有记录已清空 (共删除 {affected_rows} 条)")
             except Exception as e:
                 import traceback
@@ -702,6 +766,8 @@ class ReservationListWindow:
 
     def on_closing(self):
         """窗口关闭事件"""
+        if self._owns_db:
+            self.db.close()
         self.window.destroy()
         if self.parent:
             self.parent.deiconify()  # 恢复父窗口
@@ -25,6 +25,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 try:
     from database.db_manager import BloodReservationDB
+    from database.column_store import ReservationColumnStore
     HAS_DB = True
 except ImportError:
     HAS_DB = False
@@ -44,6 +45,12 @@ class ReservationListWindow(QMainWindow):
         self.parent = parent
         self.db = db_instance
 
+        # 增量刷新：上次加载到的变更序号，以及 记录ID -> ID列单元格
+        self.change_seq = None
+        self.id_items = {}
+        # 日期筛选用的列式内存快照（第一次筛选时建立，之后按变更日志增量更新）
+        self.column_store = None
+
         # 设置窗口
         self.setWindowTitle("预约记录汇总 - 血制品预约登记系统")
         self.setMinimumSize(1000, 600)
@@ -107,7 +114,7 @@ class ReservationListWindow(QMainWindow):
 
         # 操作按钮
         self.refresh_btn = QPushButton("刷新")
-        self.refresh_btn.clicked.connect(self.load_data)
+        self.refresh_btn.clicked.connect(self.refresh_data)
         toolbar_layout.addWidget(self.refresh_btn)
 
         self.export_btn = QPushButton("导出数据")
@@ -180,18 +187,8 @@ class ReservationListWindow(QMainWindow):
         """更新日期筛选选项"""
         try:
             if HAS_DB and self.db:
-                # 从数据库获取所有日期
-                all_data = self.db.get_all_reservations()
-                dates = set()
-
-                for record in all_data:
-                    # 提取日期部分 (YYYY-MM-DD)
-                    if len(record) >= 7:
-                        date = record[6][:10]  # reservation_time
-                        dates.add(date)
-
-                # 转换为排序后的列表
-                sorted_dates = sorted(list(dates))
+                # 从数据库获取所有日期（已排序，带缓存）
+                sorted_dates = self.db.get_distinct_dates()
 
                 # 更新下拉菜单
                 current = self.filter_date_combo.currentText()
@@ -217,6 +214,7 @@ class ReservationListWindow(QMainWindow):
         try:
             # 清空表格
             self.table.setRowCount(0)
+            self.id_items.clear()
 
             if not HAS_DB or not self.db:
                 # 演示模式
@@ -226,46 +224,20 @@ class ReservationListWindow(QMainWindow):
                     ('3', '军山院区', '新鲜冰冻血浆', '', 'O型', '3.0', '2024-11-11 14:30:00'),
                 ]
                 data = demo_data
+                self.change_seq = None
             else:
-                # 从数据库获取数据
-                data = self.db.get_all_reservations()
+                # 先记下变更序号，之后的刷新只读取增量
+                self.change_seq = self.db.get_change_seq()
+                # 从只读快照逐批读取数据（不阻塞提交）
+                data = self.db.iter_reservations(snapshot=True)
 
-            # 插入数据
+            # 插入数据（插入期间关闭排序，行号才不会变化）
+            self.table.setSortingEnabled(False)
             for record in data:
-                # 解包记录
-                if len(record) == 7:
-                    res_id, campus, product_type, subtype, blood_type, quantity, reservation_time = record
-                else:
-                    continue
-
-                # 处理亚类
-                if not subtype or subtype == '':
-                    subtype = '无'
-
-                # 根据血制品类型显示不同的单位
-                if product_type == "新鲜冰冻血浆":
-                    quantity_display = f"{quantity} ml"
-                else:
-                    quantity_display = f"{quantity} 单位"
-
-                # 插入行
-                row_position = self.table.rowCount()
-                self.table.insertRow(row_position)
-
-                # 添加数据
-                items = [
-                    QTableWidgetItem(str(res_id)),
-                    QTableWidgetItem(campus),
-                    QTableWidgetItem(product_type),
-                    QTableWidgetItem(subtype),
-                    QTableWidgetItem(blood_type),
-                    QTableWidgetItem(quantity_display),
-                    QTableWidgetItem(reservation_time)
-                ]
-
-                for col, item in enumerate(items):
-                    item.setTextAlignment(Qt.AlignCenter)
-                    self.table.setItem(row_position, col, item)
+                # 跳过字段数不符的记录；同一记录只显示一次（增量刷新按ID定位行）
+                if len(record) == 7 and str(record[0]) not in self.id_items:
+                    self.insert_record(self.table.rowCount(), record)
+            self.table.setSortingEnabled(True)
 
             # 更新统计信息
             self.stats_label.setText(f"总记录数: {self.table.rowCount()}")
@@ -277,6 +249,7 @@ class ReservationListWindow(QMainWindow):
             self.update_date_filter_options()
 
         except Exception as e:
+            self.table.setSortingEnabled(True)
             QMessageBox.critical(
                 self,
                 "错误",
@@ -284,6 +257,94 @@ class ReservationListWindow(QMainWindow):
             )
             self.statusBar().showMessage(f"加载数据失败: {str(e)[:50]}...", Qt.red)
 
+    def record_items(self, record):
+        """把一条记录转换为各列的表格单元格"""
+        res_id, campus, product_type, subtype, blood_type, quantity, reservation_time = record
+
+        # 处理亚类
+        if not subtype or subtype == '':
+            subtype = '无'
+
+        # 根据血制品类型显示不同的单位
+        if product_type == "新鲜冰冻血浆":
+            quantity_display = f"{quantity} ml"
+        else:
+            quantity_display = f"{quantity} 单位"
+
+        items = [
+            QTableWidgetItem(str(res_id)),
+            QTableWidgetItem(campus),
+            QTableWidgetItem(product_type),
+            QTableWidgetItem(subtype),
+            QTableWidgetItem(blood_type),
+            QTableWidgetItem(quantity_display),
+            QTableWidgetItem(reservation_time)
+        ]
+        for item in items:
+            item.setTextAlignment(Qt.AlignCenter)
+        return items
+
+    def insert_record(self, row_position, record):
+        """在指定行插入一条记录（调用方负责关闭排序）"""
+        self.table.insertRow(row_position)
+        items = self.record_items(record)
+        for col, item in enumerate(items):
+            self.table.setItem(row_position, col, item)
+        self.id_items[str(record[0])] = items[0]
+
+    def refresh_data(self):
+        """刷新：只应用上次加载之后的变更，代价与变更条数成正比
+
+        日期筛选状态下重新执行筛选；变更日志已被清理或变更太多时全量加载。
+        """
+        current = self.filter_date_combo.currentText().strip()
+        if current not in ("", "全部"):
+            self.filter_by_date(current)
+            return
+        if not HAS_DB or not self.db or self.change_seq is None:
+            self.load_data()
+            return
+
+        try:
+            changes, self.change_seq = self.db.get_changes_since(self.change_seq, limit=1000)
+            if changes is None:
+                self.load_data()
+                return
+
+            self.table.setSortingEnabled(False)
+            for op, res_id, record in changes:
+                if op == "clear":
+                    self.table.setRowCount(0)
+                    self.id_items.clear()
+                    continue
+
+                id_item = self.id_items.get(str(res_id))
+                if record is None:
+                    # 删除（或新增后又被删除）
+                    if id_item is not None:
+                        self.table.removeRow(self.table.row(id_item))
+                        del self.id_items[str(res_id)]
+                elif id_item is not None:
+                    # 修改：原位更新（重新加载期间的新增也可能已在表中）
+                    row = self.table.row(id_item)
+                    items = self.record_items(record)
+                    for col, item in enumerate(items):
+                        self.table.setItem(row, col, item)
+                    self.id_items[str(res_id)] = items[0]
+                else:
+                    # 新增：按ID倒序显示，放在最前面
+                    self.insert_record(0, record)
+            self.table.setSortingEnabled(True)
+
+            self.stats_label.setText(f"总记录数: {self.table.rowCount()}")
+            self.statusBar().showMessage(f"已刷新 {len(changes)} 条变更")
+            if changes:
+                self.update_date_filter_options()
+
+        except Exception as e:
+            self.table.setSortingEnabled(True)
+            QMessageBox.critical(self, "错误", f"刷新失败：{str(e)}")
+
     def filter_by_date(self, filter_text):
         """按日期筛选数据"""
         filter_text = filter_text.strip()
@@ -299,24 +360,24 @@ class ReservationListWindow(QMainWindow):
                 QMessageBox.warning(self, "警告", "请选择有效的日期")
                 return
 
-            # 清空表格
+            # 清空表格（筛选结果不参与增量刷新）
             self.table.setRowCount(0)
+            self.id_items.clear()
+            self.change_seq = None
 
             if not HAS_DB or not self.db:
                 # 演示模式：显示所有记录
                 self.load_data()
                 return
 
-            # 从数据库获取数据
-            all_data = self.db.get_all_reservations()
-
-            # 按日期筛选
-            filtered_data = []
-            for record in all_data:
-                if len(record) >= 7:
-                    date = record[6][:10]  # reservation_time
-                    if date == filter_text:
-                        filtered_data.append(record)
+            # 按日期筛选（在列式快照中完成，不再查询数据库；包括已归档的记录）
+            store = self.get_column_store()
+            positions = store.filter(start=filter_text, end=filter_text)
+            filtered_data = store.rows(store.sort(positions, by="id", descending=True))
+            # 汇总结果按院区和单位分组，这里只需要各院区的记录数
+            campus_counts = {}
+            for row in store.aggregate(["campus"], positions):
+                campus_counts[row["campus"]] = campus_counts.get(row["campus"], 0) + row["count"]
 
             # 插入筛选后的数据
             for record in filtered_data:
@@ -347,14 +408,24 @@ class ReservationListWindow(QMainWindow):
                     item.setTextAlignment(Qt.AlignCenter)
                     self.table.setItem(row_position, col, item)
 
-            # 更新统计信息
-            self.stats_label.setText(f"筛选日期: {filter_text} | 记录数: {len(filtered_data)}")
+            # 更新统计信息（附各院区记录数）
+            summary = "，".join(f"{campus} {count}" for campus, count in campus_counts.items())
+            self.stats_label.setText(f"筛选日期: {filter_text} | 记录数: {len(filtered_data)}"
+                                     + (f"（{summary}）" if summary else ""))
             self.statusBar().showMessage(f"已加载 {len(filtered_data)} 条记录 (日期筛选: {filter_text})")
 
         except Exception as e:
             QMessageBox.critical(self, "错误", f"筛选失败：{str(e)}")
             self.statusBar().showMessage(f"筛选失败: {str(e)[:50]}...", Qt.red)
 
+    def get_column_store(self):
+        """返回与数据库一致的列式快照：首次调用时建立，之后只应用新的变更"""
+        if self.column_store is None or self.column_store.db is not self.db:
+            self.column_store = ReservationColumnStore(self.db)
+        else:
+            self.column_store.refresh()
+        return self.column_store
+
     def view_details(self):
         """双击查看详情"""
         current_row = self.table.currentRow()
@@ -430,9 +501,8 @@ class ReservationListWindow(QMainWindow):
         try:
             from utils.printer import BloodReservationPrinter
             printer = BloodReservationPrinter()
-            reservations = self.db.get_all_reservations()
-
-            if not reservations:
+            # 只查询一条记录判断是否有数据
+            if not self.db.query_reservations(limit=1):
                 QMessageBox.warning(self, "警告", "没有预约记录可输出！")
                 return
 
@@ -448,7 +518,8 @@ class ReservationListWindow(QMainWindow):
             )
 
             if output_file:
-                printer.print_all_reservations(reservations, output_file)
+                # 先从只读快照读出全部记录（读完即释放快照，排版期间不阻塞提交），再生成PDF
+                printer.print_all_reservations(self.db.iter_reservations(snapshot=True), output_file)
                 QMessageBox.information(self, "成功", f"汇总PDF已生成并保存到：\n{output_file}")
         except Exception as e:
             QMessageBox.critical(self, "错误", f"PDF输出失败：{str(e)}")
@@ -522,7 +593,7 @@ class ReservationListWindow(QMainWindow):
         if reply == QMessageBox.Yes:
             try:
                 affected_rows = self.db.clear_all_reservations()
-                self.load_data()
+                self.refresh_data()
                 QMessageBox.information(self, "成功", f"所有记录已清空 (共删除 {affected_rows} 条)")
             except Exception as e:
                 QMessageBox.critical(self, "错误", f"清空失败：{str(e)}")
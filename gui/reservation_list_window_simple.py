@@ -13,9 +13,9 @@ from PySide6.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout,
     QTableWidget, QTableWidgetItem,
     QPushButton, QLabel, QMessageBox,
-    QComboBox, QTextEdit, QWidget, QDateEdit
+    QComboBox, QTextEdit, QWidget, QDateEdit, QLineEdit
 )
-from PySide6.QtCore import Qt, QDate
+from PySide6.QtCore import Qt, QDate, QTimer
 
 # 添加路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -30,6 +30,11 @@ except ImportError:
 class ReservationListWindow(QDialog):
     """预约记录列表窗口 (极简版本)"""
 
+    # 关键词检索最多显示的记录数
+    SEARCH_LIMIT = 1000
+    # 输入关键词后停顿多久自动检索（毫秒）
+    SEARCH_DELAY_MS = 300
+
     def __init__(self, parent=None, db_instance=None):
         super().__init__(parent)
         self.parent = parent
@@ -171,6 +176,17 @@ class ReservationListWindow(QDialog):
                 font-size: 12px;
                 min-width: 120px;
             }
+            QLineEdit {
+                background-color: white;
+                border: 1px solid #d0d0d0;
+                border-radius: 4px;
+                padding: 6px 10px;
+                font-size: 12px;
+                min-width: 160px;
+            }
+            QLineEdit:focus {
+                border-color: #2196F3;
+            }
             QDateEdit:hover {
                 border-color: #2196F3;
             }
@@ -300,6 +316,34 @@ class ReservationListWindow(QDialog):
         date_group_layout.addLayout(date_input_layout)
         toolbar_layout.addLayout(date_group_layout)
 
+        # 分隔线
+        separator = QLabel(" | ")
+        separator.setObjectName("separator_label")
+        toolbar_layout.addWidget(separator)
+
+        # 关键词检索区域
+        search_group_layout = QVBoxLayout()
+        search_group_layout.setSpacing(5)
+
+        search_label = QLabel("关键词检索")
+        search_label.setStyleSheet("font-weight: bold; color: #1976D2;")
+        search_group_layout.addWidget(search_label)
+
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("如：辐照 AB 光谷")
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_edit.returnPressed.connect(self.apply_filters)
+        search_group_layout.addWidget(self.search_edit)
+
+        # 输入停顿后自动检索（与院区、日期筛选组合）
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(self.SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.apply_filters)
+        self.search_edit.textChanged.connect(self.search_timer.start)
+
+        toolbar_layout.addLayout(search_group_layout)
+
         toolbar_layout.addStretch()
 
         # 操作按钮区域
@@ -452,8 +496,8 @@ class ReservationListWindow(QDialog):
                 ]
                 all_data = demo_data
             else:
-                # 从数据库获取数据
-                all_data = self.db.get_all_reservations()
+                # 从只读快照逐批读取数据（不阻塞提交）
+                all_data = self.db.iter_reservations(snapshot=True)
 
             # 插入数据到表格
             row = 0
@@ -490,7 +534,7 @@ class ReservationListWindow(QDialog):
             # 更新统计信息
             count = self.table_widget.rowCount()
             self.stats_label.setText(f"总记录数: {count}")
-            self.status_label.setText(f"已加载 {count} 条记录")
+            self.status_label.setText(f"已加载 {count} 条记录{self.quantity_summary()}")
 
         except Exception as e:
             QMessageBox.critical(
@@ -499,6 +543,17 @@ class ReservationListWindow(QDialog):
                 f"加载数据失败：\n{str(e)}\n\n请检查数据库文件或联系管理员"
             )
 
+    def quantity_summary(self, filters=None):
+        """按单位汇总数量（由数据库 GROUP BY 计算），返回状态栏后缀文本"""
+        if not HAS_DB or not self.db:
+            return ""
+
+        totals = self.db.aggregate(filters=filters, measures=["sum_quantity"])
+        if not totals:
+            return ""
+        parts = [f"{row['sum_quantity']:g} {row['unit']}" for row in totals]
+        return " | 数量合计: " + " / ".join(parts)
+
     def view_details(self, row, column):
         """查看记录详情 (表格双击事件)"""
         try:
@@ -542,23 +597,11 @@ class ReservationListWindow(QDialog):
             from PySide6.QtWidgets import QFileDialog
             from utils.exporter_pyside6 import DataExporter
 
-            # 获取数据库数据
-            all_data = self.db.get_all_reservations()
-
-            if not all_data:
+            # 只查询一条记录判断是否有数据
+            if not self.db.query_reservations(limit=1):
                 QMessageBox.warning(self, "警告", "没有数据可导出！")
                 return
 
-            # 转换数据格式
-            formatted_data = []
-            for record in all_data:
-                if len(record) >= 7:
-                    formatted_data.append(record)
-
-            if not formatted_data:
-                QMessageBox.warning(self, "警告", "没有有效数据可导出！")
-                return
-
             # 询问导出格式
             reply = QMessageBox.question(
                 self,
@@ -573,7 +616,8 @@ class ReservationListWindow(QDialog):
 
             # 导出数据
             exporter = DataExporter(self)
-            success = exporter.export_data(formatted_data, file_format)
+            # 导出时从只读快照逐批读取，不在内存中复制整表，也不阻塞提交
+            success = exporter.export_data(self.db.iter_reservations(snapshot=True), file_format)
 
             if success:
                 self.status_label.setText(f"数据已导出为 {file_format.upper()} 格式")
@@ -607,10 +651,13 @@ class ReservationListWindow(QDialog):
                 QMessageBox.critical(self, "错误", f"清空失败：{str(e)}")
 
     def apply_filters(self):
-        """应用筛选（院区+日期）"""
+        """应用筛选（院区+日期，有关键词时在筛选范围内全文检索）"""
         try:
+            self.search_timer.stop()
+
             # 获取院区筛选
             selected_campus = self.campus_combo.currentText()
+            keyword = self.search_edit.text().strip()
 
             # 获取日期范围
             start_date = self.start_date_edit.date().toString("yyyy-MM-dd")
@@ -629,48 +676,47 @@ class ReservationListWindow(QDialog):
                 self.load_data()
                 return
 
-            # 从数据库获取数据
-            all_data = self.db.get_all_reservations()
+            # 院区和日期筛选由数据库完成
+            filters = {
+                "campus": None if selected_campus == "全部院区" else selected_campus,
+                "start": start_date,
+                "end": end_date
+            }
+            if keyword:
+                filtered_data = self.db.search(keyword, filters, limit=self.SEARCH_LIMIT)
+            else:
+                filtered_data = self.db.query_reservations(**filters)
             row = 0
 
-            for record in all_data:
+            for record in filtered_data:
                 if len(record) >= 7:
                     res_id, campus, product_type, subtype, blood_type, quantity, reservation_time = record
 
-                    # 检查院区筛选
-                    if selected_campus != "全部院区" and campus != selected_campus:
-                        continue
-
-                    # 提取记录的日期部分 (YYYY-MM-DD)
-                    record_date = reservation_time[:10]
-
-                    # 检查是否在日期范围内
-                    if start_date <= record_date <= end_date:
-                        if not subtype or subtype == '':
-                            subtype = '无'
+                    if not subtype or subtype == '':
+                        subtype = '无'
 
-                        # 根据血制品类型显示不同的单位
-                        if product_type == "新鲜冰冻血浆":
-                            quantity_display = f"{quantity} ml"
-                        else:
-                            quantity_display = f"{quantity} 单位"
+                    # 根据血制品类型显示不同的单位
+                    if product_type == "新鲜冰冻血浆":
+                        quantity_display = f"{quantity} ml"
+                    else:
+                        quantity_display = f"{quantity} 单位"
 
-                        # 插入行
-                        self.table_widget.insertRow(row)
+                    # 插入行
+                    self.table_widget.insertRow(row)
 
-                        # 设置单元格数据
-                        self.table_widget.setItem(row, 0, QTableWidgetItem(str(res_id)))
-                        self.table_widget.setItem(row, 1, QTableWidgetItem(campus))
-                        self.table_widget.setItem(row, 2, QTableWidgetItem(product_type))
-                        self.table_widget.setItem(row, 3, QTableWidgetItem(subtype))
-                        self.table_widget.setItem(row, 4, QTableWidgetItem(blood_type))
-                        self.table_widget.setItem(row, 5, QTableWidgetItem(quantity_display))
-                        self.table_widget.setItem(row, 6, QTableWidgetItem(reservation_time))
+                    # 设置单元格数据
+                    self.table_widget.setItem(row, 0, QTableWidgetItem(str(res_id)))
+                    self.table_widget.setItem(row, 1, QTableWidgetItem(campus))
+                    self.table_widget.setItem(row, 2, QTableWidgetItem(product_type))
+                    self.table_widget.setItem(row, 3, QTableWidgetItem(subtype))
+                    self.table_widget.setItem(row, 4, QTableWidgetItem(blood_type))
+                    self.table_widget.setItem(row, 5, QTableWidgetItem(quantity_display))
+                    self.table_widget.setItem(row, 6, QTableWidgetItem(reservation_time))
 
-                        # 设置行高
-                        self.table_widget.setRowHeight(row, 30)
+                    # 设置行高
+                    self.table_widget.setRowHeight(row, 30)
 
-                        row += 1
+                    row += 1
 
             # 更新统计信息
             count = self.table_widget.rowCount()
@@ -678,10 +724,17 @@ class ReservationListWindow(QDialog):
             if selected_campus != "全部院区":
                 filter_info.append(f"院区: {selected_campus}")
             filter_info.append(f"日期: {start_date} 至 {end_date}")
+            if keyword:
+                filter_info.append(f"关键词: {keyword}")
 
             filter_str = " | ".join(filter_info)
             self.stats_label.setText(f"筛选结果: {count} 条记录 ({filter_str})")
-            self.status_label.setText(f"已筛选，显示 {count} 条记录")
+            if keyword:
+                # 数量合计按院区+日期汇总，与检索结果不对应，检索时不显示
+                limit_note = f"（最多显示 {self.SEARCH_LIMIT} 条）" if count >= self.SEARCH_LIMIT else ""
+                self.status_label.setText(f"已检索，显示 {count} 条记录{limit_note}")
+            else:
+                self.status_label.setText(f"已筛选，显示 {count} 条记录{self.quantity_summary(filters)}")
 
         except Exception as e:
             QMessageBox.critical(self, "错误", f"筛选失败：{str(e)}")
@@ -696,6 +749,10 @@ class ReservationListWindow(QDialog):
             self.start_date_edit.setDate(QDate.currentDate().addDays(-1))
             self.end_date_edit.setDate(QDate.currentDate())
 
+            # 清空关键词（清空时触发的自动检索一并取消）
+            self.search_edit.clear()
+            self.search_timer.stop()
+
             # 重新加载所有数据
             self.load_data()
 
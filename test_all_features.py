@@ -44,36 +44,38 @@ def test_database():
         with tempfile.TemporaryDirectory() as tmpdir:
             db_path = os.path.join(tmpdir, "test.db")
             db = BloodReservationDB(db_path)
-
-            # 添加预约记录
-            campus = "光谷院区"
-            product_type = "红细胞"
-            product_subtype = "悬浮红细胞"
-            blood_type = "A型"
-            quantity = 2
-            reservation_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-            db.add_reservation(campus, product_type, product_subtype,
-                             blood_type, quantity, reservation_time)
-
-            # 查询记录
-            all_records = db.get_all_reservations()
-
-            if len(all_records) > 0:
-                record = all_records[0]
-                print(f"[PASS] Record added: ID={record[0]}, Campus={record[1]}, Product={record[2]}")
-
-                # 测试按ID查询
-                record_by_id = db.get_reservation_by_id(record[0])
-                if record_by_id:
-                    print(f"[PASS] Query by ID successful")
-                    return True
+            try:
+                # 添加预约记录
+                campus = "光谷院区"
+                product_type = "红细胞"
+                product_subtype = "悬浮红细胞"
+                blood_type = "A型"
+                quantity = 2
+                reservation_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+                db.add_reservation(campus, product_type, product_subtype,
+                                 blood_type, quantity, reservation_time)
+
+                # 查询记录
+                all_records = db.get_all_reservations()
+
+                if len(all_records) > 0:
+                    record = all_records[0]
+                    print(f"[PASS] Record added: ID={record[0]}, Campus={record[1]}, Product={record[2]}")
+
+                    # 测试按ID查询
+                    record_by_id = db.get_reservation_by_id(record[0])
+                    if record_by_id:
+                        print(f"[PASS] Query by ID successful")
+                        return True
+                    else:
+                        print(f"[FAIL] Query by ID failed")
+                        return False
                 else:
-                    print(f"[FAIL] Query by ID failed")
+                    print(f"[FAIL] No records found")
                     return False
-            else:
-                print(f"[FAIL] No records found")
-                return False
+            finally:
+                db.close()
 
     except Exception as e:
         print(f"[FAIL] Database test failed: {e}")
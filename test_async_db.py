@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+asyncio 数据库接口测试
+覆盖各异步操作、组提交、背压，以及大量并发提交时事件循环的延迟
+"""
+
+import sys
+import os
+import asyncio
+import sqlite3
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database.async_db import AsyncBloodReservationDB
+from database.db_manager import BloodReservationDB, DatabaseBusyError, PERFORMANCE_PROFILES
+
+
+TEST_ROWS = [
+    ("光谷院区", "红细胞", "悬浮红细胞", "A型", 2.0, "2024-11-10 09:00:00"),
+    ("中法院区", "血小板", "单采血小板", "B型", 1.0, "2024-11-10 15:30:00"),
+    ("光谷院区", "新鲜冰冻血浆", "", "O型", 200.0, "2024-11-11 08:15:00"),
+]
+
+
+def make_row(i):
+    return ("光谷院区", "红细胞", "悬浮红细胞", "A型", 1.0, f"2024-11-{10 + i % 20:02d} {i % 24:02d}:00:00")
+
+
+async def measure_lag(stop, lags, interval=0.001):
+    """定时器协程：记录每次 sleep 比预期晚醒来的时间（事件循环被阻塞的程度）"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+
+
+def test_async_operations():
+    """异步的增、查、汇总、删、批量操作"""
+    async def scenario(db_path):
+        async with AsyncBloodReservationDB(db_path) as db:
+            ids = await db.add_reservations(TEST_ROWS)
+            assert ids == [1, 2, 3]
+            new_id = await db.add_reservation("军山院区", "红细胞", "洗涤红细胞", "AB型", 1.5, "2024-11-12 10:00:00")
+            assert new_id == 4
+
+            # 同一调用方先提交后查询，查询能看到提交
+            assert len(await db.query_reservations()) == 4
+            assert [row[0] for row in await db.query_reservations(campus="光谷院区")] == [3, 1]
+            assert (await db.get_reservation_by_id(4))[1] == "军山院区"
+            assert [row[0] for row in await db.search("军山 AB")] == [4]
+            rows, token = await db.get_reservations_page(page_size=3)
+            assert len(rows) == 3 and token is not None
+            counts = await db.aggregate(["campus"], measures=["count"])
+            assert {row["campus"]: row["count"] for row in counts} == {"光谷院区": 2, "中法院区": 1, "军山院区": 1}
+
+            # 校验失败只影响自己的提交
+            results = await asyncio.gather(
+                db.add_reservation("光谷院区", "红细胞", "悬浮红细胞", "A型", 1.0, "2024-11-12 11:00:00"),
+                db.add_reservation("光谷院区", "红细胞", "悬浮红细胞", "A型", 1.0, "不是时间"),
+                return_exceptions=True,
+            )
+            assert results[0] == 5 and isinstance(results[1], ValueError)
+
+            assert await db.delete_reservation(1) == 1
+            assert await db.delete_reservations([2, 99]) == 1
+            assert await db.delete_range({"campus": "中法院区"}) == 0
+            assert await db.clear_all_reservations(truncate=True) == 3
+            assert await db.query_reservations() == []
+
+        try:
+            await db.query_reservations()
+            assert False, "关闭后应拒绝请求"
+        except RuntimeError:
+            pass
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        asyncio.run(scenario(os.path.join(tmpdir, "async.db")))
+    print("[OK] 异步增删查与汇总")
+
+
+def test_backpressure_and_group_commit():
+    """排队的请求数不超过 max_pending，并发提交合并为少量事务"""
+    async def scenario(db_path):
+        async with AsyncBloodReservationDB(db_path, max_pending=5) as db:
+            ids = await asyncio.gather(*(db.add_reservation(*make_row(i)) for i in range(200)))
+            assert sorted(ids) == list(range(1, 201))
+            assert db.stats["requests"] == 200
+            assert db.stats["max_queued"] <= 5, db.stats
+            assert db.db.writer_stats["rows"] == 200
+            assert db.db.writer_stats["groups"] < 200
+            assert len(await db.query_reservations()) == 200
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        asyncio.run(scenario(os.path.join(tmpdir, "async.db")))
+    print("[OK] 背压与组提交")
+
+
+def test_loop_latency_under_load():
+    """1000 个并发提交期间，事件循环仍然及时响应：延迟远小于在事件循环中同步提交时"""
+    async def scenario(db_path):
+        async with AsyncBloodReservationDB(db_path) as db:
+            stop = asyncio.Event()
+            lags = []
+            ticker = asyncio.create_task(measure_lag(stop, lags))
+            ids = await asyncio.gather(*(db.add_reservation(*make_row(i)) for i in range(1000)))
+            stop.set()
+            await ticker
+            assert len(set(ids)) == 1000
+            return max(lags)
+
+    async def blocking(db_path, group=100):
+        """对照：在事件循环中直接调用同步接口，每提交 group 条让出一次"""
+        with BloodReservationDB(db_path) as db:
+            stop = asyncio.Event()
+            lags = []
+            ticker = asyncio.create_task(measure_lag(stop, lags))
+            await asyncio.sleep(0.01)
+            for i in range(1000):
+                db.add_reservation(*make_row(i))
+                if i % group == group - 1:
+                    await asyncio.sleep(0)
+            stop.set()
+            await ticker
+            return max(lags)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        max_lag = asyncio.run(scenario(os.path.join(tmpdir, "async.db")))
+        baseline = asyncio.run(blocking(os.path.join(tmpdir, "blocking.db")))
+    # 与本机同步提交的耗时比较（数据库线程一组最多合并 100 条），不依赖磁盘速度
+    assert max_lag < baseline / 3, (max_lag, baseline)
+    print(f"[OK] 并发提交时事件循环最大延迟 {max_lag * 1000:.1f} ms（同步提交时 {baseline * 1000:.1f} ms）")
+
+
+def test_group_commit_errors():
+    """组提交出错时这一组等待中的请求得到异常，之后的请求照常执行"""
+    profile = dict(PERFORMANCE_PROFILES["compat"], busy_timeout=50, write_retries=0)
+
+    async def scenario(db_path):
+        async with AsyncBloodReservationDB(db_path, profile=profile) as db:
+            # 院区误传为列表：只有这条提交失败
+            results = await asyncio.gather(
+                db.add_reservation(*TEST_ROWS[0]),
+                db.add_reservation(["光谷院区"], *TEST_ROWS[1][1:]),
+                return_exceptions=True,
+            )
+            assert results[0] == 1 and isinstance(results[1], TypeError)
+
+            # 整组写入失败（其他连接持有写锁）：这一组的请求都得到异常，数据库线程不退出
+            blocker = sqlite3.connect(db_path, isolation_level=None)
+            blocker.execute("BEGIN EXCLUSIVE")
+            results = await asyncio.wait_for(asyncio.gather(
+                *(db.add_reservation(*row) for row in TEST_ROWS), return_exceptions=True), timeout=5)
+            assert all(isinstance(result, DatabaseBusyError) for result in results), results
+            blocker.rollback()
+            blocker.close()
+
+            assert await asyncio.wait_for(db.add_reservation(*TEST_ROWS[2]), timeout=5) == 2
+            assert db._thread.is_alive()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        asyncio.run(scenario(os.path.join(tmpdir, "async.db")))
+    print("[OK] 组提交异常不影响数据库线程")
+
+
+if __name__ == "__main__":
+    test_async_operations()
+    test_backpressure_and_group_commit()
+    test_loop_latency_under_load()
+    test_group_commit_errors()
+    print("\n[SUCCESS] asyncio 数据库接口测试通过")
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+列式内存快照测试
+验证筛选、排序、汇总结果与数据库查询一致，并通过变更日志增量更新
+"""
+
+import sys
+import os
+import tempfile
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import column_store
+from database.db_manager import BloodReservationDB
+from database.column_store import ReservationColumnStore
+
+
+TEST_ROWS = [
+    ("光谷院区", "红细胞", "悬浮红细胞", "A型", 2.0, "2024-11-10 09:00:00"),
+    ("中法院区", "血小板", "单采血小板", "B型", 1.0, "2024-11-10 15:30:00"),
+    ("光谷院区", "新鲜冰冻血浆", "", "O型", 200.0, "2024-11-11 08:15:00"),
+    ("军山院区", "红细胞", "洗涤红细胞", "AB型", 1.5, "2024-11-11 10:45:00"),
+    ("光谷院区", "血小板", "辐照血小板", "A型", 1.0, "2024-11-12 14:00:00"),
+    ("中法院区", "新鲜冰冻血浆", None, "A型", 100.0, "2024-11-12 16:00:00"),
+]
+
+FILTERS = [
+    {},
+    {"campus": "光谷院区"},
+    {"product_type": "红细胞"},
+    {"blood_type": "A型", "campus": "中法院区"},
+    {"start": "2024-11-11", "end": "2024-11-11"},
+    {"start": "2024-11-10 12:00:00", "end": "2024-11-12 14:00:00"},
+    {"start": date(2024, 11, 11), "end": date(2024, 11, 12)},
+    {"start": datetime(2024, 11, 11, 9), "campus": "光谷院区"},
+    {"campus": "不存在的院区"},
+]
+
+
+def store_paths():
+    """依次切换到纯 Python 路径和向量化路径（安装了 NumPy 时），产出是否使用 NumPy"""
+    original = column_store.HAS_NUMPY
+    try:
+        for use_numpy in ((False, True) if original else (False,)):
+            column_store.HAS_NUMPY = use_numpy
+            yield use_numpy
+    finally:
+        column_store.HAS_NUMPY = original
+
+
+def path_names(paths):
+    return "、".join("NumPy" if use_numpy else "纯 Python" for use_numpy in paths)
+
+
+def assert_matches_db(db, store):
+    """快照的筛选/取出结果与 query_reservations 一致（各计算路径）"""
+    for _ in store_paths():
+        for filters in FILTERS:
+            expected = db.query_reservations(**filters)
+            positions = store.sort(store.filter(**filters), by="id", descending=True)
+            assert store.rows(positions) == expected, filters
+            assert store.aggregate(positions=positions) == db.aggregate(filters=filters), filters
+    assert len(store) == len(db.get_all_reservations())
+
+
+def test_filter_and_aggregate_match_database():
+    """筛选、汇总结果与数据库相同"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with BloodReservationDB(os.path.join(tmpdir, "store.db")) as db:
+            db.add_reservations(TEST_ROWS)
+            store = ReservationColumnStore(db)
+            paths = []
+            for use_numpy in store_paths():
+                paths.append(use_numpy)
+                assert_matches_db(db, store)
+                for group_by in (["campus"], ["product_type", "subtype"], ["blood_type", "unit"]):
+                    assert store.aggregate(group_by) == db.aggregate(group_by, use_rollup=False), group_by
+            # 每条记录的列存储远小于一个 Python 元组
+            assert store.nbytes() <= 41 * len(store)
+            print(f"[OK] 列式快照筛选与汇总（{path_names(paths)}）")
+
+
+def test_sort():
+    """按数值列和名称排序，相同键按 id 同方向排列"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with BloodReservationDB(os.path.join(tmpdir, "store.db")) as db:
+            db.add_reservations(TEST_ROWS)
+            store = ReservationColumnStore(db)
+            paths = []
+            for use_numpy in store_paths():
+                paths.append(use_numpy)
+                everything = store.filter()
+
+                ids = [row[0] for row in store.rows(store.sort(everything, by="quantity", descending=False))]
+                assert ids == [2, 5, 4, 1, 6, 3]
+                ids = [row[0] for row in store.rows(store.sort(everything, by="campus"))]
+                expected = sorted(db.get_all_reservations(), key=lambda row: (row[1], row[0]), reverse=True)
+                assert ids == [row[0] for row in expected]
+                ids = [row[0] for row in store.rows(store.sort(everything, by="time", descending=False))]
+                assert ids == [1, 2, 3, 4, 5, 6]
+                try:
+                    store.sort(everything, by="hospital")
+                    assert False, "应拒绝不支持的排序方式"
+                except ValueError:
+                    pass
+            print(f"[OK] 列式快照排序（{path_names(paths)}）")
+
+
+def test_incremental_refresh():
+    """通过变更日志增量更新，删除较多时压缩"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with BloodReservationDB(os.path.join(tmpdir, "store.db")) as db:
+            db.add_reservations(TEST_ROWS)
+            store = ReservationColumnStore(db)
+
+            db.add_reservation("东院区", "红细胞", "悬浮红细胞", "B型", 3.0, "2024-11-13 09:00:00")
+            db.delete_reservation(2)
+            conn = db._get_connection()
+            with conn:
+                conn.execute("UPDATE reservations SET quantity = 5, blood_type = 'O型' WHERE id = 1")
+            assert store.refresh() == 3
+            assert store.deleted == 1
+            assert_matches_db(db, store)
+
+            for res_id in (3, 4):
+                db.delete_reservation(res_id)
+            assert store.refresh() == 2
+            assert store.deleted == 0 and len(store.ids) == len(store) == 4
+            assert_matches_db(db, store)
+
+            # 变更太多时重新建立快照
+            db.add_reservations(TEST_ROWS * 3)
+            assert store.refresh(limit=5) == -1
+            assert_matches_db(db, store)
+
+            db.clear_all_reservations()
+            db.add_reservations(TEST_ROWS[:2])
+            assert store.refresh() == 3
+            assert_matches_db(db, store)
+            assert store.refresh() == 0
+            print("[OK] 列式快照增量更新")
+
+
+def test_archived_records():
+    """快照包括已归档的记录，与数据库的汇总一致；归档中断时不重复计入"""
+    old_rows = [
+        ("光谷院区", "红细胞", "悬浮红细胞", "A型", 2.0, "2023-03-01 10:00:00"),
+        ("中法院区", "新鲜冰冻血浆", None, "B型", 100.0, "2023-12-31 23:00:00"),
+        ("军山院区", "血小板", "", "O型", 1.0, "2022-06-01 08:00:00"),
+    ]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with BloodReservationDB(os.path.join(tmpdir, "store.db")) as db:
+            db.add_reservations(old_rows + TEST_ROWS)
+            db.add_reservation("东院区", "红细胞", None, "A型", 1.0, "2022-01-05 09:00:00")
+            db.archive_reservations(before="2024-01-01")
+            store = ReservationColumnStore(db)
+            assert len(store) == len(old_rows) + len(TEST_ROWS) + 1
+            assert list(store.ids) == sorted(store.ids)
+            paths = []
+            for use_numpy in store_paths():
+                paths.append(use_numpy)
+                assert store.rows(store.sort(store.filter())) == db.get_all_reservations()
+                assert store.aggregate(["campus", "subtype"]) == db.aggregate(["campus", "subtype"])
+                assert store.rows(store.filter(end="2023-12-31")) == \
+                    sorted(db.query_reservations(end="2023-12-31"))
+
+            # 删除归档记录经变更日志同步
+            db.delete_reservations([1])
+            assert store.refresh() == 1
+            assert store.rows(store.sort(store.filter())) == db.get_all_reservations()
+
+            # 归档中断：主库中仍有的记录只计一次
+            conn = db._get_connection()
+            with conn:
+                conn.execute(f"INSERT INTO reservations ({db._ARCHIVE_COLUMNS}) "
+                             "SELECT 2, '中法院区', '新鲜冰冻血浆', NULL, 'B型', 100.0, "
+                             "'2023-12-31 23:00:00', CAST(strftime('%s', '2023-12-31 23:00:00') AS INTEGER)")
+            store.build()
+            assert store.rows(store.sort(store.filter())) == db.get_all_reservations()
+            print(f"[OK] 列式快照包括归档记录（{path_names(paths)}）")
+
+
+if __name__ == "__main__":
+    test_filter_and_aggregate_match_database()
+    test_sort()
+    test_incremental_refresh()
+    test_archived_records()
+    print("\n[SUCCESS] 列式快照测试通过")
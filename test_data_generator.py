@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试数据生成器测试
+验证生成的记录符合目录与分布设置，并能通过 bulk_load 写入可正常查询的数据库
+"""
+
+import sys
+import os
+import tempfile
+from collections import Counter
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database.db_manager import BloodReservationDB
+from database import data_generator
+from database.data_generator import (
+    CAMPUS_WEIGHTS, PRODUCT_CATALOG, BLOOD_TYPE_WEIGHTS, build_catalog, generate_rows, fill_database,
+)
+
+
+def test_rows_follow_catalog():
+    """记录数准确、按时间排序、只使用目录中的选项，同一种子生成相同的数据"""
+    rows = list(generate_rows(5000, start=date(2024, 1, 1), days=30, seed=7))
+    assert len(rows) == 5000
+    assert rows == list(generate_rows(5000, start=date(2024, 1, 1), days=30, seed=7))
+    assert rows != list(generate_rows(5000, start=date(2024, 1, 1), days=30, seed=8))
+
+    times = [row[5] for row in rows]
+    assert times == sorted(times)
+    assert times[0] >= "2024-01-01" and times[-1] < "2024-01-31"
+    for row in rows:
+        campus, product_type, subtype, blood_type, quantity, _ = row
+        assert campus in CAMPUS_WEIGHTS and blood_type in BLOOD_TYPE_WEIGHTS
+        _, subtypes, quantities = PRODUCT_CATALOG[product_type]
+        assert subtype in subtypes and quantity in quantities
+        # 能通过 add_reservations 的校验
+        assert BloodReservationDB._validate_row(0, row) == row
+
+    combos, cum_weights = build_catalog()
+    assert len(combos) == len(cum_weights) == len(set(combos))
+    print("[OK] 生成的记录符合目录")
+
+
+def test_distributions():
+    """偏斜程度与时段权重生效"""
+    def campus_share(skew):
+        rows = generate_rows(20000, start=date(2024, 1, 1), days=10, skew=skew, seed=1)
+        counts = Counter(row[0] for row in rows)
+        return counts["光谷院区"] / 20000
+
+    assert 0.30 < campus_share(0) < 0.37
+    assert 0.46 < campus_share(1) < 0.54
+    assert campus_share(3) > 0.7
+
+    # 只在 9 点和 15 点生成，15 点的量是 9 点的 3 倍
+    hour_weights = [0] * 24
+    hour_weights[9], hour_weights[15] = 1, 3
+    rows = list(generate_rows(8000, start=date(2024, 1, 1), days=7, hour_weights=hour_weights,
+                              weekday_weights=[1] * 7, seed=1))
+    hours = Counter(row[5][11:13] for row in rows)
+    assert set(hours) == {"09", "15"}
+    assert 2.7 < hours["15"] / hours["09"] < 3.3
+
+    # 工作日多于周末
+    rows = generate_rows(14000, start=date(2024, 1, 1), days=14, growth=0, seed=1)
+    weekdays = Counter(date.fromisoformat(row[5][:10]).weekday() for row in rows)
+    assert weekdays[0] > 1.5 * weekdays[6]
+
+    for bad in ({"count": -1}, {"count": 1, "days": 0}, {"count": 1, "hour_weights": [1] * 23},
+                {"count": 1, "hour_weights": [0] * 24}):
+        try:
+            list(generate_rows(**bad))
+            assert False, f"应拒绝无效的参数: {bad}"
+        except ValueError:
+            pass
+    print("[OK] 分布设置")
+
+
+def test_fill_database():
+    """生成数据写入数据库后，查询、汇总、检索结果一致"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "generated.db")
+        done = []
+        options = {"start": date(2024, 1, 1), "days": 20, "seed": 3}
+        assert fill_database(db_path, 3000, chunk_size=1000, progress=done.append, **options) == 3000
+        assert done == [1000, 2000, 3000]
+        # 再次写入时追加
+        assert fill_database(db_path, 500, **options) == 500
+
+        rows = list(generate_rows(3000, **options)) + list(generate_rows(500, **options))
+        with BloodReservationDB(db_path) as db:
+            # 生成数据时默认推迟建立检索索引
+            assert not db.search_index_ready()
+            records = db.get_all_reservations()
+            assert [record[1:] for record in reversed(records)] == rows
+
+            # 汇总同时按单位（单位/ml）分组
+            counts = Counter()
+            for row in db.aggregate(["campus"], use_rollup=True):
+                counts[row["campus"]] += row["count"]
+            assert counts == Counter(row[0] for row in rows)
+            assert db.aggregate(["product_type", "blood_type"], use_rollup=True) == \
+                db.aggregate(["product_type", "blood_type"], use_rollup=False)
+
+            found = db.search("军山 洗涤 AB", limit=10000)
+            assert [row[0] for row in found] == [
+                record[0] for record in records
+                if record[1] == "军山院区" and record[3] == "洗涤红细胞" and record[4] == "AB型"
+            ]
+
+        data_generator.main([db_path, "--rows", "200", "--days", "5", "--seed", "1", "--skew", "0"])
+        with BloodReservationDB(db_path) as db:
+            assert len(db.get_all_reservations()) == 3700
+            assert not db.search_index_ready()
+
+        # --search-index 在写入后立即建好索引
+        data_generator.main([db_path, "--rows", "100", "--days", "5", "--seed", "2", "--search-index"])
+        with BloodReservationDB(db_path) as db:
+            assert db.search_index_ready()
+            assert len(db.search("院区", limit=10000)) == 3800
+        print("[OK] 生成数据写入数据库")
+
+
+if __name__ == "__main__":
+    test_rows_follow_catalog()
+    test_distributions()
+    test_fill_database()
+    print("\n[SUCCESS] 测试数据生成器测试通过")
@@ -67,6 +67,7 @@ def test_database():
 
     # 清理测试文件
     print("\n5. 清理测试文件...")
+    db.close()
     if os.path.exists("test_records.db"):
         os.remove("test_records.db")
         print("  [OK] 测试文件已清理")
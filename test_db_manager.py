@@ -0,0 +1,1476 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+数据库管理类专项测试
+覆盖连接管理及各查询/写入接口
+"""
+
+import sys
+import os
+import sqlite3
+import time
+import tempfile
+import threading
+from concurrent.futures import Future
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import db_manager
+from database.db_manager import BloodReservationDB, DatabaseBusyError, PERFORMANCE_PROFILES
+from database.data_generator import generate_rows
+
+
+TEST_ROWS = [
+    ("光谷院区", "红细胞", "悬浮红细胞", "A型", 2.0, "2024-11-10 09:00:00"),
+    ("中法院区", "血小板", "单采血小板", "B型", 1.0, "2024-11-10 15:30:00"),
+    ("光谷院区", "新鲜冰冻血浆", "", "O型", 200.0, "2024-11-11 08:15:00"),
+    ("军山院区", "红细胞", "洗涤红细胞", "AB型", 1.5, "2024-11-11 10:45:00"),
+    ("光谷院区", "血小板", "辐照血小板", "A型", 1.0, "2024-11-12 14:00:00"),
+]
+
+
+def make_db(tmpdir, rows=TEST_ROWS, **options):
+    """创建带测试数据的数据库"""
+    db = BloodReservationDB(os.path.join(tmpdir, "test.db"), **options)
+    for row in rows:
+        db.add_reservation(*row)
+    return db
+
+
+def test_connection_reuse():
+    """同一线程复用同一个连接"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir) as db:
+            conn = db._get_connection()
+            db.get_all_reservations()
+            db.add_reservation(*TEST_ROWS[0])
+            assert db._get_connection() is conn
+            assert len(db.get_all_reservations()) == len(TEST_ROWS) + 1
+            print("[OK] 同一线程复用长连接")
+
+
+def test_thread_local_connections():
+    """不同线程各自持有连接，且写入彼此可见"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir) as db:
+            seen = {}
+
+            def worker():
+                seen['conn'] = db._get_connection()
+                db.add_reservation(*TEST_ROWS[1])
+
+            thread = threading.Thread(target=worker)
+            thread.start()
+            thread.join()
+
+            assert seen['conn'] is not db._get_connection()
+            assert len(db.get_all_reservations()) == len(TEST_ROWS) + 1
+
+            # 线程结束后其连接随即关闭，不会累积到 close()
+            threads = [threading.Thread(target=db.get_distinct_dates) for _ in range(50)]
+            for thread in threads:
+                thread.start()
+                thread.join()
+            assert db._connections == [db._get_connection()]
+            try:
+                seen['conn'].execute("SELECT 1")
+                assert False, "已结束线程的连接应已关闭"
+            except sqlite3.ProgrammingError:
+                pass
+            print("[OK] 工作线程使用独立连接，线程结束后关闭")
+
+
+def test_close():
+    """close() 后不可再使用，且可重复调用"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db = make_db(tmpdir)
+        db.close()
+        db.close()
+        try:
+            db.get_all_reservations()
+        except sqlite3.ProgrammingError:
+            print("[OK] 关闭后访问抛出 ProgrammingError")
+        else:
+            raise AssertionError("关闭后仍可访问数据库")
+
+
+def test_failed_write_rolls_back():
+    """写入失败时回滚，不残留未提交事务"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir) as db:
+            try:
+                db.add_reservation("光谷院区", None, "", "A型", 1.0, "2024-11-11 10:00:00")
+            except sqlite3.IntegrityError:
+                pass
+            assert not db._get_connection().in_transaction
+            assert len(db.get_all_reservations()) == len(TEST_ROWS)
+            print("[OK] 写入失败已回滚")
+
+
+def test_query_reservations():
+    """院区/日期/大类/血型筛选在SQL中完成"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir) as db:
+            assert len(db.query_reservations()) == len(TEST_ROWS)
+
+            guanggu = db.query_reservations(campus="光谷院区")
+            assert [r[0] for r in guanggu] == [5, 3, 1]
+
+            # 结束日期包含当天全部记录
+            day = db.query_reservations(start="2024-11-11", end="2024-11-11")
+            assert [r[0] for r in day] == [4, 3]
+
+            combined = db.query_reservations(campus="光谷院区", start="2024-11-10", end="2024-11-11")
+            assert [r[0] for r in combined] == [3, 1]
+
+            assert [r[0] for r in db.query_reservations(product_type="红细胞")] == [4, 1]
+            assert [r[0] for r in db.query_reservations(blood_type="A型")] == [5, 1]
+
+            # 精确到秒的时间边界
+            assert [r[0] for r in db.query_reservations(end="2024-11-10 15:30:00")] == [2, 1]
+
+            # 分页
+            assert [r[0] for r in db.query_reservations(limit=2)] == [5, 4]
+            assert [r[0] for r in db.query_reservations(limit=2, offset=2)] == [3, 2]
+            assert [r[0] for r in db.query_reservations(offset=3)] == [2, 1]
+            print("[OK] query_reservations 筛选与分页正确")
+
+
+def test_add_reservations():
+    """批量写入返回连续ID，且分块不影响结果"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir) as db:
+            ids = db.add_reservations(TEST_ROWS * 3, chunk_size=4)
+            assert ids == list(range(len(TEST_ROWS) + 1, len(TEST_ROWS) * 4 + 1))
+
+            record = db.get_reservation_by_id(ids[2])
+            assert record[1:] == TEST_ROWS[2]
+            assert len(db.get_all_reservations()) == len(TEST_ROWS) * 4
+            assert db.add_reservations([]) == []
+            print("[OK] add_reservations 批量写入成功")
+
+
+def test_subtype_stored_consistently():
+    """各写入路径对亚类 None / '' 的保存方式相同（按原值保存）"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir, rows=[]) as db:
+            for subtype in (None, ""):
+                row = ("光谷院区", "新鲜冰冻血浆", subtype, "O型", 200.0, "2024-11-11 08:15:00")
+                db.add_reservation(*row)
+                db.add_reservations([row])
+                db.submit_reservation(*row).result(timeout=5)
+                db.bulk_load([row])
+                db.start_writer()
+                db.submit_reservation(*row).result(timeout=5)
+                db._stop_writer()
+            stored = [record[3] for record in reversed(db.get_all_reservations())]
+            assert stored == [None] * 5 + [""] * 5
+            assert rollup_rows(db) == [("2024-11-11", "光谷院区", "新鲜冰冻血浆", "", "O型", 10, 2000.0)]
+        print("[OK] 亚类在各写入路径中保存一致")
+
+
+def test_add_reservations_rejects_invalid_batch():
+    """任一行无效时整批回滚"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir) as db:
+            bad_rows = [
+                ("光谷院区", "红细胞", "悬浮红细胞", "A型", 0, "2024-11-11 10:00:00"),
+                ("", "红细胞", "悬浮红细胞", "A型", 1, "2024-11-11 10:00:00"),
+                ("光谷院区", "红细胞", "悬浮红细胞", "A型", 1, "2024/11/11"),
+                ("光谷院区", "红细胞", "悬浮红细胞", "A型", 1),
+            ]
+            for bad_row in bad_rows:
+                try:
+                    db.add_reservations(TEST_ROWS + [bad_row], chunk_size=2)
+                except ValueError as e:
+                    print(f"  [OK] 拒绝无效行: {e}")
+                else:
+                    raise AssertionError(f"未拒绝无效行: {bad_row}")
+
+            assert len(db.get_all_reservations()) == len(TEST_ROWS)
+            print("[OK] 无效批次未写入任何记录")
+
+
+def test_iter_reservations():
+    """流式读取与一次性读取结果一致，并支持筛选"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir) as db:
+            assert list(db.iter_reservations(batch_size=2)) == db.get_all_reservations()
+
+            filters = {"campus": "光谷院区", "start": "2024-11-11", "end": "2024-11-12"}
+            assert list(db.iter_reservations(filters)) == db.query_reservations(**filters)
+
+            # 提前停止迭代后仍可正常写入
+            rows = db.iter_reservations(batch_size=1)
+            next(rows)
+            rows.close()
+            db.add_reservation(*TEST_ROWS[0])
+            assert len(db.get_all_reservations()) == len(TEST_ROWS) + 1
+            print("[OK] iter_reservations 流式读取正确")
+
+
+def collect_pages(db, page_size, **kwargs):
+    """依次读取所有页，返回记录ID列表"""
+    ids = []
+    token = None
+    while True:
+        rows, token = db.get_reservations_page(page_size, token, **kwargs)
+        ids.extend(row[0] for row in rows)
+        if token is None:
+            return ids
+
+
+def test_keyset_pagination():
+    """键集分页遍历结果与一次性查询一致"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir) as db:
+            # 时间相同的记录按ID倒序，保证翻页不重不漏
+            db.add_reservations([TEST_ROWS[2], TEST_ROWS[2]])
+
+            all_ids = [row[0] for row in db.get_all_reservations()]
+            assert collect_pages(db, 2) == all_ids
+            assert collect_pages(db, 100) == all_ids
+
+            by_time = [row[0] for row in sorted(db.get_all_reservations(),
+                                                key=lambda r: (r[6], r[0]), reverse=True)]
+            assert collect_pages(db, 2, order_by="time") == by_time
+
+            filters = {"campus": "光谷院区"}
+            expected = [row[0] for row in db.query_reservations(**filters)]
+            assert collect_pages(db, 2, filters=filters) == expected
+
+            rows, token = db.get_reservations_page(3)
+            try:
+                db.get_reservations_page(3, token, order_by="time")
+            except ValueError:
+                pass
+            else:
+                raise AssertionError("排序方式不一致的令牌未被拒绝")
+            try:
+                db.get_reservations_page(3, "not-a-token")
+            except ValueError:
+                print("[OK] 键集分页遍历正确，无效令牌被拒绝")
+            else:
+                raise AssertionError("无效令牌未被拒绝")
+
+
+def test_aggregate():
+    """分组汇总在SQL中完成，ml 与“单位”分开合计"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir) as db:
+            assert db.aggregate(measures=["count"]) == [{"count": len(TEST_ROWS)}]
+
+            totals = db.aggregate()
+            assert totals == [
+                {"unit": "ml", "count": 1, "sum_quantity": 200.0},
+                {"unit": "单位", "count": 4, "sum_quantity": 5.5},
+            ]
+
+            by_campus = db.aggregate(["campus"], measures=["count"])
+            assert {row["campus"]: row["count"] for row in by_campus} == {
+                "光谷院区": 3, "中法院区": 1, "军山院区": 1
+            }
+
+            by_day = db.aggregate(["day", "product_type"], filters={"campus": "光谷院区"})
+            assert by_day == [
+                {"day": "2024-11-10", "product_type": "红细胞", "unit": "单位", "count": 1, "sum_quantity": 2.0},
+                {"day": "2024-11-11", "product_type": "新鲜冰冻血浆", "unit": "ml", "count": 1, "sum_quantity": 200.0},
+                {"day": "2024-11-12", "product_type": "血小板", "unit": "单位", "count": 1, "sum_quantity": 1.0},
+            ]
+
+            try:
+                db.aggregate(["hospital_campus; DROP TABLE reservations"])
+            except ValueError:
+                print("[OK] aggregate 分组汇总正确，非法维度被拒绝")
+            else:
+                raise AssertionError("非法分组维度未被拒绝")
+
+
+def rollup_rows(db):
+    return db._get_connection().execute(
+        "SELECT * FROM reservation_daily_rollup ORDER BY day, campus, product_type, subtype, blood_type"
+    ).fetchall()
+
+
+def test_daily_rollup_triggers():
+    """按日汇总表由触发器精确维护，与全量重建结果一致"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir) as db:
+            db.add_reservations(TEST_ROWS)
+            db.delete_reservation(1)
+            db.delete_reservation(3)
+            db._get_connection().execute("UPDATE reservations SET hospital_campus = '中法院区' WHERE id = 2")
+            db._get_connection().commit()
+
+            maintained = rollup_rows(db)
+            db.rebuild_daily_rollup()
+            assert rollup_rows(db) == maintained
+
+            # 汇总表与原始表统计结果一致
+            for group_by in (["day"], ["campus", "product_type"], ["subtype", "blood_type"], ["month"]):
+                filters = {"start": "2024-11-11", "end": "2024-11-12", "campus": "光谷院区"}
+                assert db.aggregate(group_by) == db.aggregate(group_by, use_rollup=False)
+                assert db.aggregate(group_by, filters) == db.aggregate(group_by, filters, use_rollup=False)
+
+            db.clear_all_reservations()
+            assert rollup_rows(db) == []
+            print("[OK] 按日汇总表随增删改保持一致")
+
+
+def test_rollup_delete_cost():
+    """删除记录时只清理刚扣减的汇总分组：删除同样的记录，汇总表大 50 倍以上时执行的指令数基本不变；
+    旧版本数据库升级时重建触发器"""
+    class V7DB(BloodReservationDB):
+        """只执行到 v7 迁移（汇总触发器会扫描整个汇总表）"""
+        MIGRATIONS = BloodReservationDB.MIGRATIONS[:7]
+        SCHEMA_VERSION = 7
+
+    def delete_steps(db, ids):
+        """删除 ids 执行的 SQLite 虚拟机指令数（以千条计）"""
+        steps = [0]
+
+        def count():
+            steps[0] += 1
+            return 0
+
+        conn = db._get_connection()
+        conn.set_progress_handler(count, 1000)
+        try:
+            assert db.delete_reservations(ids) == len(ids)
+        finally:
+            conn.set_progress_handler(None, 0)
+        return steps[0]
+
+    rows = list(generate_rows(200, start=date(2024, 1, 1), days=3, seed=1))
+    other_rows = list(generate_rows(20000, start=date(2022, 1, 1), days=700, seed=2))
+    ids = list(range(1, 201))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with BloodReservationDB(os.path.join(tmpdir, "small.db")) as small:
+            small.bulk_load(rows)
+            small_rollup = len(rollup_rows(small))
+            small_steps = delete_steps(small, ids)
+
+        db_path = os.path.join(tmpdir, "large.db")
+        with V7DB(db_path) as db:
+            db.bulk_load(rows + other_rows)
+        with BloodReservationDB(db_path, progress_callback=lambda *args: None) as large:
+            assert len(rollup_rows(large)) > 50 * small_rollup
+            large_steps = delete_steps(large, ids)
+            assert large_steps < 2 * small_steps, (small_steps, large_steps)
+
+            maintained = rollup_rows(large)
+            large.rebuild_daily_rollup()
+            assert rollup_rows(large) == maintained
+    print("[OK] 删除记录的汇总维护开销与汇总表大小无关")
+
+
+def test_aggregate_uses_rollup_for_whole_days():
+    """整天范围走汇总表，带时分秒的范围回退到原始表"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir) as db:
+            assert db._build_rollup_where(start="2024-11-10", end="2024-11-11") is not None
+            assert db._build_rollup_where(start="2024-11-10 08:00:00") is None
+
+            # 汇总表被篡改后，只有走汇总表的查询会受影响
+            db._get_connection().execute("UPDATE reservation_daily_rollup SET record_count = 100")
+            db._get_connection().commit()
+            assert db.aggregate(measures=["count"], filters={"start": "2024-11-10"}) != [{"count": 5}]
+            assert db.aggregate(measures=["count"], filters={"start": "2024-11-10 00:00:00"}) == [{"count": 5}]
+
+            db.rebuild_daily_rollup()
+            assert db.aggregate(measures=["count"], filters={"start": "2024-11-10"}) == [{"count": 5}]
+            print("[OK] 整天范围的统计读取按日汇总表")
+
+
+def test_epoch_column():
+    """整数时间戳在写入时生成、旧记录回填，并可按 datetime 范围查询"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir) as db:
+            conn = db._get_connection()
+            db.add_reservations(TEST_ROWS[:1])
+            # 模拟其他程序直接写入（不带时间戳）
+            conn.execute(
+                "INSERT INTO reservations (hospital_campus, blood_product_type, blood_product_subtype, "
+                "blood_type, quantity, reservation_time) VALUES ('军山院区', '红细胞', '', 'A型', 1, '2024-11-13 23:59:59')"
+            )
+            conn.commit()
+
+            rows = conn.execute("SELECT reservation_time, reservation_epoch FROM reservations").fetchall()
+            for reservation_time, epoch in rows:
+                expected = BloodReservationDB._to_epoch(datetime.strptime(reservation_time, "%Y-%m-%d %H:%M:%S"))
+                assert epoch == expected, (reservation_time, epoch)
+
+            by_datetime = db.query_reservations(start=datetime(2024, 11, 10, 15, 30), end=datetime(2024, 11, 11, 8, 15))
+            assert [r[0] for r in by_datetime] == [3, 2]
+            by_date = db.query_reservations(start=date(2024, 11, 11), end=date(2024, 11, 13))
+            assert [r[0] for r in by_date] == [7, 5, 4, 3]
+
+            by_hour = db.aggregate(["hour"], measures=["count"])
+            assert by_hour == [
+                {"hour": 8, "count": 1}, {"hour": 9, "count": 2}, {"hour": 10, "count": 1},
+                {"hour": 14, "count": 1}, {"hour": 15, "count": 1}, {"hour": 23, "count": 1},
+            ]
+            print("[OK] 整数时间戳列写入与查询正确")
+
+
+def test_epoch_backfill_on_upgrade():
+    """升级前的数据库打开后自动回填时间戳"""
+
+    class V2DB(BloodReservationDB):
+        """只执行到 v2 迁移（增加时间戳列之前）"""
+        MIGRATIONS = BloodReservationDB.MIGRATIONS[:2]
+        SCHEMA_VERSION = 2
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "v2.db")
+        V2DB(db_path).close()
+        conn = sqlite3.connect(db_path)
+        conn.executemany(
+            "INSERT INTO reservations (hospital_campus, blood_product_type, blood_product_subtype, "
+            "blood_type, quantity, reservation_time) VALUES (?, ?, ?, ?, ?, ?)",
+            TEST_ROWS
+        )
+        conn.commit()
+        conn.close()
+
+        with BloodReservationDB(db_path) as db:
+            epochs = db._get_connection().execute("SELECT reservation_epoch FROM reservations").fetchall()
+            assert len(epochs) == len(TEST_ROWS) and all(row[0] is not None for row in epochs)
+            assert len(db.query_reservations(start=date(2024, 11, 11))) == 3
+            print("[OK] 旧记录时间戳已回填")
+
+
+def test_get_distinct_dates():
+    """日期列表来自汇总表并被缓存，本实例、其他实例（其他工作站）增删记录后失效"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir) as db:
+            assert db.get_distinct_dates() == ["2024-11-10", "2024-11-11", "2024-11-12"]
+            assert db.get_distinct_dates("军山院区") == ["2024-11-11"]
+
+            # 没有写入时命中缓存
+            hits = db.result_cache_stats["hits"]
+            assert db.get_distinct_dates() == ["2024-11-10", "2024-11-11", "2024-11-12"]
+            assert db.result_cache_stats["hits"] == hits + 1
+
+            assert db.get_distinct_dates("中法院区") == ["2024-11-10"]
+            with BloodReservationDB(db.db_path) as other:
+                other.add_reservation("中法院区", "血小板", "单采血小板", "A型", 1, "2024-11-13 09:00:00")
+                assert db.get_distinct_dates("中法院区") == ["2024-11-10", "2024-11-13"]
+                assert db.get_distinct_dates() == ["2024-11-10", "2024-11-11", "2024-11-12", "2024-11-13"]
+                other.delete_reservation(6)
+                assert db.get_distinct_dates() == ["2024-11-10", "2024-11-11", "2024-11-12"]
+
+            db.add_reservation("军山院区", "红细胞", "洗涤红细胞", "O型", 1, "2024-11-15 09:00:00")
+            assert db.get_distinct_dates("军山院区") == ["2024-11-11", "2024-11-15"]
+
+            db.delete_reservation(4)
+            assert db.get_distinct_dates("军山院区") == ["2024-11-15"]
+            assert db.get_distinct_dates() == ["2024-11-10", "2024-11-11", "2024-11-12", "2024-11-15"]
+            print("[OK] get_distinct_dates 缓存与失效正确")
+
+
+def make_legacy_db(db_path, count):
+    """创建 v1.0 旧版数据库（quantity 为 INTEGER、带 created_at，user_version=0）"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+        CREATE TABLE reservations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hospital_campus TEXT NOT NULL,
+            blood_product_type TEXT NOT NULL,
+            blood_product_subtype TEXT,
+            blood_type TEXT NOT NULL,
+            quantity INTEGER NOT NULL DEFAULT 1,
+            reservation_time TEXT NOT NULL,
+            created_at TEXT
+        )
+    ''')
+    rows = []
+    for i in range(count):
+        campus, product_type, subtype, blood_type = TEST_ROWS[i % len(TEST_ROWS)][:4]
+        rows.append((campus, product_type, subtype, blood_type, 2, f"2024-11-{10 + i % 3} 10:{i:02d}:00"))
+    conn.executemany(
+        "INSERT INTO reservations (hospital_campus, blood_product_type, blood_product_subtype, "
+        "blood_type, quantity, reservation_time) VALUES (?, ?, ?, ?, ?, ?)",
+        rows
+    )
+    # 末尾的记录被删除过，升级后自增序号不能回退
+    conn.execute("DELETE FROM reservations WHERE id = ?", (count,))
+    conn.commit()
+    conn.close()
+
+
+class SmallBatchDB(BloodReservationDB):
+    """每批只迁移少量记录，便于测试分批与断点续传"""
+    MIGRATION_BATCH_ROWS = 3
+
+
+def test_legacy_table_rebuilt_in_batches():
+    """旧版表结构分批重建，并报告进度"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "legacy.db")
+        make_legacy_db(db_path, 11)
+
+        progress = []
+        with SmallBatchDB(db_path, progress_callback=lambda *args: progress.append(args)) as db:
+            conn = db._get_connection()
+            columns = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(reservations)")}
+            assert "created_at" not in columns and columns["quantity"] == "REAL"
+            assert conn.execute("PRAGMA user_version").fetchone()[0] == BloodReservationDB.SCHEMA_VERSION
+            assert [row[0] for row in db.query_reservations()] == list(range(10, 0, -1))
+            assert db.aggregate(measures=["count"]) == [{"count": 10}]
+
+            rebuild = [done for description, done, total in progress if description == "升级旧版表结构并创建查询索引"]
+            assert rebuild == [0, 3, 6, 9, 10], progress
+
+            # 被删除的 id 11 不会被重新使用
+            assert db.add_reservations([TEST_ROWS[0]]) == [12]
+            print("[OK] 旧版表结构分批重建")
+
+
+def test_migration_resumes_after_crash():
+    """迁移中途中断后数据库保持一致，再次打开时从断点继续"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "legacy.db")
+        make_legacy_db(db_path, 11)
+
+        def crash_after_first_batch(description, done, total):
+            if done:
+                raise KeyboardInterrupt("模拟中断")
+
+        try:
+            SmallBatchDB(db_path, progress_callback=crash_after_first_batch)
+            assert False, "迁移应被中断"
+        except KeyboardInterrupt:
+            pass
+
+        # 已提交的批次只存在于新表中，记录不丢失也不重复
+        conn = sqlite3.connect(db_path)
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+        old_ids = [row[0] for row in conn.execute("SELECT id FROM reservations")]
+        new_ids = [row[0] for row in conn.execute("SELECT id FROM reservations_new")]
+        assert new_ids == [1, 2, 3] and sorted(old_ids + new_ids) == list(range(1, 11))
+        conn.close()
+
+        with BloodReservationDB(db_path, progress_callback=lambda *args: None) as db:
+            assert [row[0] for row in db.query_reservations()] == list(range(10, 0, -1))
+            tables = {row[0] for row in db._get_connection().execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'")}
+            assert "reservations_new" not in tables
+            print("[OK] 迁移中断后可继续完成")
+
+
+def test_startup_skips_migrations_when_current():
+    """已是最新版本时启动不执行任何迁移"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir) as db:
+            db_path = db.db_path
+
+        calls = []
+
+        class TracingDB(BloodReservationDB):
+            def _apply_migrations(self, conn, version):
+                calls.append(version)
+                super()._apply_migrations(conn, version)
+
+        with TracingDB(db_path) as db:
+            assert calls == []
+            assert len(db.get_all_reservations()) == len(TEST_ROWS)
+        print("[OK] 最新版本数据库启动时不执行迁移")
+
+
+def test_performance_profiles():
+    """性能配置：默认回滚日志（共享文件不会被切换为 WAL），balanced 为 WAL + synchronous=NORMAL，
+    网络共享上的文件不切换为 WAL"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir) as db:
+            assert db.journal_mode == "delete"
+            assert db._get_connection().execute("PRAGMA synchronous").fetchone()[0] == 2
+            assert db._checkpoint_thread is None
+
+        with BloodReservationDB(os.path.join(tmpdir, "balanced.db"), profile="balanced") as db:
+            conn = db._get_connection()
+            assert db.journal_mode == "wal"
+            assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+            assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2
+            assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+            assert db._checkpoint_thread.is_alive()
+            assert db.checkpoint()[0] == 0
+            checkpoint_thread = db._checkpoint_thread
+        assert not checkpoint_thread.is_alive()
+
+        # 默认配置打开已是 WAL 的文件时恢复为回滚日志
+        with BloodReservationDB(os.path.join(tmpdir, "balanced.db")) as db:
+            assert db.journal_mode == "delete"
+
+        assert db_manager.is_network_path("//server/share/records.db")
+        assert db_manager.is_network_path("\\\\server\\share\\records.db") == (os.name == "nt")
+        assert not db_manager.is_network_path(os.path.join(tmpdir, "records.db"))
+        is_network_path = db_manager.is_network_path
+        db_manager.is_network_path = lambda path: True
+        try:
+            with BloodReservationDB(os.path.join(tmpdir, "share.db"), profile="balanced") as db:
+                assert db.journal_mode == "delete"
+                assert db._checkpoint_thread is None
+        finally:
+            db_manager.is_network_path = is_network_path
+
+        for bad_profile in ("fast", {"synchronous": "OFF; DROP TABLE reservations"}):
+            try:
+                BloodReservationDB(os.path.join(tmpdir, "bad.db"), profile=bad_profile)
+                assert False, "应拒绝无效的性能配置"
+            except ValueError:
+                pass
+        print("[OK] 性能配置生效")
+
+
+def test_configured_profile():
+    """工作站通过环境变量 BLOOD_DB_PROFILE 选择性能配置，未设置时为默认配置"""
+    saved = os.environ.pop(db_manager.PROFILE_ENV_VAR, None)
+    try:
+        assert db_manager.configured_profile() == db_manager.DEFAULT_PROFILE == "compat"
+        os.environ[db_manager.PROFILE_ENV_VAR] = " Balanced "
+        assert db_manager.configured_profile() == "balanced"
+        os.environ[db_manager.PROFILE_ENV_VAR] = "fast"
+        try:
+            db_manager.configured_profile()
+            assert False, "应拒绝未知的性能配置"
+        except ValueError:
+            pass
+    finally:
+        os.environ.pop(db_manager.PROFILE_ENV_VAR, None)
+        if saved is not None:
+            os.environ[db_manager.PROFILE_ENV_VAR] = saved
+    print("[OK] 环境变量选择性能配置")
+
+
+def test_wal_reader_does_not_block_writer():
+    """WAL 模式下未结束的读语句不阻塞其他线程提交；回滚日志模式下会阻塞
+    （因此该模式下 iter_reservations 分批读取，见 test_snapshot_reads_rollback_journal）"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for profile, blocked in (("balanced", False), ("compat", True)):
+            settings = dict(PERFORMANCE_PROFILES[profile], busy_timeout=100)
+            with make_db(tmpdir) as setup:
+                db_path = setup.db_path
+
+            with BloodReservationDB(db_path, profile=settings) as db:
+                # 读取一行后暂停，读语句保持打开
+                reader = db._get_connection().execute("SELECT id FROM reservation_records")
+                reader.fetchone()
+
+                errors = []
+
+                def write():
+                    try:
+                        db.add_reservation("光谷院区", "红细胞", "悬浮红细胞", "A型", 1, "2024-11-13 08:00:00")
+                    except sqlite3.OperationalError as e:
+                        errors.append(e)
+
+                writer = threading.Thread(target=write)
+                writer.start()
+                writer.join()
+                reader.close()
+                assert bool(errors) == blocked, (profile, errors)
+            os.remove(db_path)
+        print("[OK] WAL 模式读写互不阻塞")
+
+
+def test_group_commit_writer():
+    """组提交：多个线程并发提交，按组写入，每条提交都得到自己的记录ID"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir, rows=[]) as db:
+            db.start_writer(window=0.02)
+            futures = []
+            futures_lock = threading.Lock()
+
+            def submit_many():
+                for row in TEST_ROWS * 4:
+                    future = db.submit_reservation(*row)
+                    with futures_lock:
+                        futures.append(future)
+
+            threads = [threading.Thread(target=submit_many) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            ids = [future.result(timeout=5) for future in futures]
+            assert sorted(ids) == list(range(1, 101))
+            assert db.writer_stats["rows"] == 100
+            assert db.writer_stats["groups"] < 100
+            assert db.aggregate(measures=["count"]) == [{"count": 100}]
+
+            # 校验失败只影响对应的提交
+            bad = db.submit_reservation("光谷院区", "红细胞", "", "A型", 0, "2024-11-13 08:00:00")
+            good = db.submit_reservation("光谷院区", "红细胞", "", "A型", 1, "2024-11-13 08:00:00")
+            assert good.result(timeout=5) == 101
+            assert isinstance(bad.exception(timeout=5), ValueError)
+
+            # 关闭前已排队的提交会写完
+            pending = [db.submit_reservation(*row) for row in TEST_ROWS]
+            db_path = db.db_path
+        assert all(future.result(timeout=0) for future in pending)
+
+        with BloodReservationDB(db_path) as db:
+            assert len(db.get_all_reservations()) == 101 + len(TEST_ROWS)
+            # 未启动写入线程时直接写入
+            assert db.submit_reservation(*TEST_ROWS[0]).result(timeout=0) == 102 + len(TEST_ROWS)
+        print("[OK] 组提交写入线程")
+
+
+def test_writer_survives_unexpected_errors():
+    """写入时出现非数据库异常（如院区误传为列表）：只有出错的提交失败，同组的其他提交照常写入，
+    写入线程继续处理后续提交"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir, rows=[]) as db:
+            db.start_writer(window=0.05)
+            first = db.submit_reservation(*TEST_ROWS[0])
+            bad = db.submit_reservation(["光谷院区"], "红细胞", "", "A型", 1, "2024-11-13 08:00:00")
+            second = db.submit_reservation(*TEST_ROWS[1])
+            assert isinstance(bad.exception(timeout=5), TypeError)
+            assert sorted([first.result(timeout=5), second.result(timeout=5)]) == [1, 2]
+
+            # 单独一组的异常同样不会让写入线程退出
+            assert isinstance(db.submit_reservation(["光谷院区"], *TEST_ROWS[0][1:]).exception(timeout=5),
+                              TypeError)
+            assert db.submit_reservation(*TEST_ROWS[2]).result(timeout=5) == 3
+            assert db._writer_thread.is_alive()
+            assert [row[1] for row in db.get_all_reservations()] == ["光谷院区", "中法院区", "光谷院区"]
+        print("[OK] 写入线程在意外异常后继续运行")
+
+
+def test_commit_group():
+    """commit_group：一个事务写入一组提交，取消的跳过，校验失败的只影响自己"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir, rows=[]) as db:
+            items = [(row, Future()) for row in TEST_ROWS[:3]]
+            items[1][1].cancel()
+            items.append((TEST_ROWS[0][:5] + ("不是时间",), Future()))
+            seq = db.get_change_seq()
+            db.commit_group(items)
+            assert items[0][1].result() == 1 and items[2][1].result() == 2
+            assert items[1][1].cancelled()
+            assert isinstance(items[3][1].exception(), ValueError)
+            assert db.writer_stats["groups"] == 1 and db.writer_stats["rows"] == 2
+            assert [row[1:] for row in db.get_all_reservations()] == [TEST_ROWS[2], TEST_ROWS[0]]
+            assert db.get_change_seq() == seq + 2
+        print("[OK] 组提交")
+
+
+def test_snapshot_reads():
+    """只读快照（WAL 模式）：导出期间的写入不阻塞，也不出现在导出结果中"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir, profile="balanced") as db:
+            export = db.iter_reservations(batch_size=1, snapshot=True)
+            exported = [next(export)]
+
+            # 导出进行中，同一线程和其他线程的写入都不受影响
+            db.add_reservation("光谷院区", "红细胞", "悬浮红细胞", "A型", 1, "2024-11-13 08:00:00")
+            writer = threading.Thread(target=db.add_reservations, args=([TEST_ROWS[0]],))
+            writer.start()
+            writer.join()
+
+            exported.extend(export)
+            assert [row[0] for row in exported] == list(range(len(TEST_ROWS), 0, -1))
+            assert len(db.get_all_reservations()) == len(TEST_ROWS) + 2
+
+            with db.snapshot() as conn:
+                try:
+                    conn.execute("DELETE FROM reservations")
+                    assert False, "快照连接应为只读"
+                except sqlite3.OperationalError:
+                    pass
+            print("[OK] 只读快照读取")
+
+
+def test_snapshot_reads_rollback_journal():
+    """回滚日志（默认配置）：导出、加载列表期间其他线程的提交不会因读锁失败"""
+    profile = dict(PERFORMANCE_PROFILES["compat"], busy_timeout=50, write_retries=0)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir, rows=TEST_ROWS * 3, profile=profile) as db:
+            assert db.journal_mode == "delete"
+            errors = []
+
+            def write():
+                try:
+                    db.add_reservation("光谷院区", "红细胞", "悬浮红细胞", "A型", 1, "2024-11-13 08:00:00")
+                except Exception as e:
+                    errors.append(e)
+
+            for snapshot in (True, False):
+                export = db.iter_reservations(batch_size=4, snapshot=snapshot)
+                exported = [next(export)]
+                writer = threading.Thread(target=write)
+                writer.start()
+                writer.join()
+                assert errors == []
+                exported.extend(export)
+                # 开始读取之后新增的记录不在结果中
+                count = len(db.get_all_reservations())
+                assert [row[0] for row in exported] == list(range(count - 1, 0, -1))
+
+            with db.snapshot() as conn:
+                assert conn.execute("SELECT COUNT(*) FROM reservations").fetchone()[0] == count
+                write()
+                assert errors == []
+            print("[OK] 回滚日志模式下长时间读取不阻塞提交")
+
+
+def attached_databases(db):
+    return {row[1] for row in db._get_connection().execute("PRAGMA database_list")}
+
+
+def test_archive_reservations():
+    """按年份归档：旧记录移入归档库，只有涉及归档年份的查询才附加归档库；
+    “全部记录”和日期下拉菜单包括归档记录，升级时补登已有归档库的日期"""
+
+    old_rows = [
+        ("光谷院区", "红细胞", "悬浮红细胞", "A型", 2, "2022-05-01 09:00:00"),
+        ("中法院区", "血小板", "单采血小板", "B型", 1, "2023-03-01 10:00:00"),
+        ("军山院区", "新鲜冰冻血浆", "", "O型", 200, "2023-12-31 23:00:00"),
+    ]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir, rows=old_rows + TEST_ROWS) as db:
+            assert db.archive_reservations(before="2024-01-01") == {"2022": 1, "2023": 2}
+            assert os.path.exists(os.path.join(tmpdir, "test_archive_2023.db"))
+            assert [(year, count) for year, _, _, count in db.get_archives()] == [("2022", 1), ("2023", 2)]
+            assert len(db.query_reservations(start="2024-01-01")) == len(TEST_ROWS)
+
+            # 近期查询不附加归档库
+            assert len(db.query_reservations(start="2024-11-10", end="2024-11-12")) == len(TEST_ROWS)
+            assert attached_databases(db) == {"main"}
+
+            # 只附加时间范围涉及的年份
+            rows = db.query_reservations(start="2023-01-01", end="2023-12-31")
+            assert [row[0] for row in rows] == [3, 2]
+            assert "archive_2023" in attached_databases(db) and "archive_2022" not in attached_databases(db)
+
+            # 不限时间时包含全部归档记录
+            total = len(old_rows) + len(TEST_ROWS)
+            assert [row[0] for row in db.query_reservations()] == list(range(total, 0, -1))
+            assert db.get_all_reservations() == db.query_reservations()
+            assert db.get_all_reservations() == list(db.iter_reservations())
+            assert sum(1 for _ in db.iter_reservations(snapshot=True)) == total
+            assert db.aggregate(measures=["count"]) == [{"count": total}]
+            assert db.aggregate(["day"], filters={"start": "2023-12-31", "end": "2023-12-31"},
+                                measures=["count"]) == [{"day": "2023-12-31", "count": 1}]
+            rows, _ = db.get_reservations_page(page_size=100, filters={"end": "2022-12-31"})
+            assert [row[0] for row in rows] == [1]
+
+            # 重复归档不会产生重复记录
+            assert db.archive_reservations(before="2024-01-01") == {}
+            db_path = db.db_path
+
+        dates = ["2022-05-01", "2023-03-01", "2023-12-31", "2024-11-10", "2024-11-11", "2024-11-12"]
+        with BloodReservationDB(db_path) as db:
+            # 日期下拉菜单包括归档日期，但不附加归档库
+            assert db.get_distinct_dates() == dates
+            assert db.get_distinct_dates("中法院区") == ["2023-03-01", "2024-11-10"]
+            assert attached_databases(db) == {"main"}
+            assert len(db.query_reservations(end="2023-12-31")) == len(old_rows)
+
+        # v8 版本的数据库没有归档日期表，升级时从已有归档库补登
+        conn = sqlite3.connect(db_path)
+        conn.execute("DROP TABLE reservation_archive_days")
+        conn.execute("PRAGMA user_version = 8")
+        conn.close()
+        with BloodReservationDB(db_path, progress_callback=lambda *args: None) as db:
+            assert db.get_distinct_dates() == dates
+            assert db.get_distinct_dates("军山院区") == ["2023-12-31", "2024-11-11"]
+            assert attached_databases(db) == {"main"}
+        print("[OK] 按年份归档与合并查询")
+
+
+def test_archived_records_are_editable():
+    """列表中可见的归档记录同样可以查看、删除和清空；归档不记为删除"""
+    old_rows = [
+        ("光谷院区", "红细胞", "悬浮红细胞", "A型", 2.0, "2022-05-01 09:00:00"),
+        ("中法院区", "血小板", "单采血小板", "B型", 1.0, "2023-03-01 10:00:00"),
+        ("军山院区", "新鲜冰冻血浆", "", "O型", 200.0, "2023-12-31 23:00:00"),
+    ]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir, rows=old_rows + TEST_ROWS) as db:
+            seq = db.get_change_seq()
+            db.archive_reservations(before="2024-01-01")
+            assert db.get_changes_since(seq) == ([], seq)
+            assert db.get_reservation_by_id(1) == (1,) + old_rows[0]
+            assert db.get_reservation_by_id(4)[1:] == TEST_ROWS[0]
+
+            # 按ID删除：主库和归档库中的记录在同一个事务中删除
+            assert db.delete_reservations([1, 4]) == 2
+            assert db.get_reservation_by_id(1) is None
+            assert sorted(db.get_changes_since(seq)[0]) == [("delete", 1, None), ("delete", 4, None)]
+            assert [(year, count) for year, _, _, count in db.get_archives()] == [("2022", 0), ("2023", 2)]
+            assert "2022-05-01" not in db.get_distinct_dates()
+            assert db.delete_reservation(1) == 0
+
+            # 按条件删除同样作用于归档库
+            assert db.delete_range({"campus": "中法院区"}) == 2
+            assert [row[0] for row in db.get_all_reservations()] == [8, 7, 6, 3]
+            assert db.get_distinct_dates() == ["2023-12-31", "2024-11-11", "2024-11-12"]
+
+            # 清空时归档库一并清空、注销并删除文件
+            assert db.clear_all_reservations() == 4
+            assert db.get_all_reservations() == []
+            assert db.get_distinct_dates() == []
+            assert db.get_archives() == []
+            assert not os.path.exists(os.path.join(tmpdir, "test_archive_2023.db"))
+            assert db.get_reservation_by_id(3) is None
+        print("[OK] 归档记录可查看、删除、清空")
+
+
+def test_interrupted_archive_listed_once():
+    """归档中断（归档库已提交、主库删除未提交）时，同一记录在合并查询中只出现一次"""
+    old_rows = [
+        ("光谷院区", "红细胞", "悬浮红细胞", "A型", 2.0, "2023-03-01 10:00:00"),
+        ("中法院区", "血小板", "单采血小板", "B型", 1.0, "2023-12-31 23:00:00"),
+    ]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir, rows=old_rows + TEST_ROWS) as db:
+            expected = db.get_all_reservations()
+            db.archive_reservations(before="2024-01-01")
+            # WAL 模式下跨库事务不保证原子性：模拟主库中的记录仍在
+            conn = db._get_connection()
+            with conn:
+                conn.executemany(f"INSERT INTO reservations ({db._ARCHIVE_COLUMNS}) "
+                                 "VALUES (?, ?, ?, ?, ?, ?, ?, CAST(strftime('%s', ?) AS INTEGER))",
+                                 [row + (row[6],) for row in expected[-2:]])
+
+            assert db.get_all_reservations() == expected
+            assert list(db.iter_reservations(snapshot=True)) == expected
+            assert db.aggregate(measures=["count"]) == [{"count": len(expected)}]
+            assert db.query_reservations(end="2023-12-31") == expected[-2:]
+
+            # 重新归档后恢复正常
+            assert db.archive_reservations(before="2024-01-01") == {"2023": 2}
+            assert db.get_all_reservations() == expected
+            assert [(year, count) for year, _, _, count in db.get_archives()] == [("2023", 2)]
+        print("[OK] 中断的归档不产生重复记录")
+
+
+def test_dictionary_encoding():
+    """字典编码：记录只存整数编号，reservations 视图保持原有列，写入视图同样生效"""
+    class V4DB(BloodReservationDB):
+        """只执行到 v4 迁移（字典编码之前）"""
+        MIGRATIONS = BloodReservationDB.MIGRATIONS[:4]
+        SCHEMA_VERSION = 4
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "v4.db")
+        V4DB(db_path).close()
+        conn = sqlite3.connect(db_path)
+        conn.executemany(
+            "INSERT INTO reservations (hospital_campus, blood_product_type, blood_product_subtype, "
+            "blood_type, quantity, reservation_time) VALUES (?, ?, ?, ?, ?, ?)",
+            TEST_ROWS + [("光谷院区", "新鲜冰冻血浆", None, "O型", 100, "2024-11-11 09:00:00"),
+                         ("光谷院区", "血小板", None, "A型", 1, "2024-11-12 08:00:00")]
+        )
+        conn.execute("DELETE FROM reservations WHERE id = 7")
+        conn.commit()
+        expected = conn.execute(
+            "SELECT * FROM reservations ORDER BY id"
+        ).fetchall()
+        conn.close()
+
+        with SmallBatchDB(db_path, progress_callback=lambda *args: None) as db:
+            conn = db._get_connection()
+            assert conn.execute("SELECT type FROM sqlite_master WHERE name = 'reservations'").fetchone()[0] == "view"
+            assert conn.execute("SELECT * FROM reservations ORDER BY id").fetchall() == expected
+            assert conn.execute("SELECT COUNT(*) FROM campuses").fetchone()[0] == 3
+            assert {row[1] for row in conn.execute("PRAGMA table_info(reservation_records)")} >= {
+                "campus_id", "product_type_id", "subtype_id", "blood_type_id"}
+            rollup_before = rollup_rows(db)
+
+            # 在编码列上分组的结果与按日汇总表一致（亚类 NULL 与 '' 合并为同一组）
+            for group_by in (["campus"], ["product_type", "subtype"], ["blood_type", "day"], []):
+                assert db.aggregate(group_by, use_rollup=False) == db.aggregate(group_by), group_by
+            assert db.aggregate(["subtype"], filters={"product_type": "新鲜冰冻血浆"}, use_rollup=False) == [
+                {"subtype": "", "unit": "ml", "count": 2, "sum_quantity": 300.0}]
+
+            # 自增序号沿用旧表，被删除的 id 7 不会重新使用
+            assert db.add_reservations([TEST_ROWS[0]]) == [8]
+
+            # 通过视图写入（其他程序或手工SQL）由触发器转换为编码
+            conn.execute(
+                "INSERT INTO reservations (hospital_campus, blood_product_type, blood_product_subtype, "
+                "blood_type, quantity, reservation_time) VALUES ('新院区', '红细胞', '洗涤红细胞', 'O型', 3, "
+                "'2024-11-13 09:00:00')"
+            )
+            conn.execute("UPDATE reservations SET blood_type = 'B型' WHERE id = 9")
+            conn.commit()
+            assert db.get_reservation_by_id(9)[1:] == ("新院区", "红细胞", "洗涤红细胞", "B型", 3.0, "2024-11-13 09:00:00")
+            conn.execute("DELETE FROM reservations WHERE id IN (8, 9)")
+            conn.commit()
+            assert rollup_rows(db) == rollup_before
+
+            # 事务回滚时新登记的字典值也回滚，不会留在缓存中
+            new_row = ("东院区", "红细胞", "", "A型", 1, "2024-11-13 10:00:00")
+            try:
+                db.add_reservations([new_row, new_row, ("东院区",)])
+                assert False, "应拒绝无效的批量数据"
+            except ValueError:
+                pass
+            # 回滚释放的编号被另一个新院区复用，两者不能混淆
+            db.add_reservation("西院区", "红细胞", "", "A型", 1, "2024-11-13 11:00:00")
+            db.add_reservation(*new_row)
+            assert db.query_reservations(campus="东院区")[0][1] == "东院区"
+            assert db.query_reservations(campus="西院区")[0][1] == "西院区"
+
+            # 直接读取编码表并在 Python 中解码，结果与视图一致
+            conn = db._get_connection()
+            view_rows = conn.execute(
+                "SELECT id, hospital_campus, blood_product_type, blood_product_subtype, "
+                "blood_type, quantity, reservation_time FROM reservations ORDER BY id DESC"
+            ).fetchall()
+            assert db.get_all_reservations() == view_rows
+            assert list(db.iter_reservations(batch_size=2)) == view_rows
+            rows, _ = db.get_reservations_page(page_size=100, order_by="time")
+            assert sorted(rows) == sorted(view_rows)
+        print("[OK] 字典编码与兼容视图")
+
+
+def test_change_log():
+    """触发器维护的变更日志与 get_changes_since 增量读取"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir) as db:
+            seq = db.get_change_seq()
+            assert seq == len(TEST_ROWS)
+            assert db.get_changes_since(seq) == ([], seq)
+
+            db.add_reservation("中法院区", "红细胞", "悬浮红细胞", "B型", 1.0, "2024-11-13 09:00:00")
+            new_id = len(TEST_ROWS) + 1
+            db.delete_reservation(1)
+            conn = db._get_connection()
+            with conn:
+                conn.execute("UPDATE reservations SET quantity = 3 WHERE id = 2")
+            changes, latest = db.get_changes_since(seq)
+            assert latest == db.get_change_seq() == seq + 3
+            assert changes == [
+                ("insert", new_id, db.get_reservation_by_id(new_id)),
+                ("delete", 1, None),
+                ("update", 2, db.get_reservation_by_id(2)),
+            ], changes
+            assert changes[2][2][5] == 3
+
+            # 之后被删除的新增记录内容为 None；只修改时间戳不算变更
+            db.add_reservation("中法院区", "血小板", "单采血小板", "A型", 1.0, "2024-11-13 10:00:00")
+            other_id = new_id + 1
+            db.delete_reservation(other_id)
+            with conn:
+                conn.execute("UPDATE reservation_records SET reservation_epoch = 0 WHERE id = 2")
+            changes, latest = db.get_changes_since(seq + 3)
+            assert changes == [("insert", other_id, None), ("delete", other_id, None)], changes
+
+            # 变更超过 limit 时要求全量重新加载
+            assert db.get_changes_since(seq, limit=2) == (None, latest)
+
+            # 清空只留下一条 clear；更早的序号需要全量重新加载
+            db.clear_all_reservations()
+            assert db.get_changes_since(latest) == ([("clear", None, None)], latest + 1)
+            assert db.get_changes_since(seq) == (None, latest + 1)
+
+    # 日志只保留最近 CHANGE_LOG_KEEP 条
+    class SmallLogDB(BloodReservationDB):
+        CHANGE_LOG_KEEP = 50
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with SmallLogDB(os.path.join(tmpdir, "test.db")) as db:
+            db.add_reservations(TEST_ROWS * 50)
+            count = db._get_connection().execute("SELECT COUNT(*) FROM reservation_changes").fetchone()[0]
+            assert count <= 150, count
+            assert db.get_changes_since(0) == (None, 250)
+            changes, _ = db.get_changes_since(240)
+            assert [op for op, _, _ in changes] == ["insert"] * 10
+    print("[OK] 变更日志与增量读取")
+
+
+def test_result_cache():
+    """查询结果缓存：命中计数、本连接/其他线程/其他进程写入后失效、LRU 容量"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir) as db:
+            stats = db.result_cache_stats
+            first = db.query_reservations(campus="光谷院区")
+            assert stats == {"hits": 0, "misses": 1}
+            first.clear()  # 修改返回的列表不影响缓存
+            assert db.query_reservations(campus="光谷院区") == db.query_reservations(campus="光谷院区")
+            assert len(db.query_reservations(campus="光谷院区")) == 3
+            assert stats["misses"] == 1 and stats["hits"] == 3
+            db.aggregate(["campus"])
+            assert db.aggregate(["campus"]) == db.aggregate(["campus"], use_rollup=False)
+            assert stats["hits"] == 4
+
+            # 本连接写入
+            db.add_reservation("光谷院区", "红细胞", "悬浮红细胞", "B型", 1.0, "2024-11-13 09:00:00")
+            assert len(db.query_reservations(campus="光谷院区")) == 4
+
+            # 其他线程（各自的连接）写入
+            thread = threading.Thread(target=db.delete_reservation, args=(1,))
+            thread.start()
+            thread.join()
+            assert len(db.query_reservations(campus="光谷院区")) == 3
+
+            # 其他进程写入（独立连接）
+            other = sqlite3.connect(db.db_path)
+            with other:
+                other.execute("UPDATE reservations SET quantity = 9 WHERE id = 3")
+            other.close()
+            assert [row[5] for row in db.query_reservations(campus="光谷院区") if row[0] == 3] == [9]
+            counts = {row["campus"]: row["count"] for row in db.aggregate(["campus"], measures=["count"])}
+            assert counts["光谷院区"] == 3
+
+    class SmallCacheDB(BloodReservationDB):
+        RESULT_CACHE_SIZE = 2
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with SmallCacheDB(os.path.join(tmpdir, "test.db")) as db:
+            db.add_reservations(TEST_ROWS)
+            for campus in ("光谷院区", "中法院区", "军山院区", "光谷院区"):
+                db.query_reservations(campus=campus)
+            assert db.result_cache_stats == {"hits": 0, "misses": 4}
+            db.query_reservations(campus="军山院区")
+            assert db.result_cache_stats == {"hits": 1, "misses": 4}
+    print("[OK] 查询结果缓存")
+
+
+def test_search():
+    """全文检索：多词 AND、任意子串、与筛选条件组合，触发器同步增删改，升级时为已有记录建立索引"""
+    def ids(rows):
+        return [row[0] for row in rows]
+
+    def check_index(db):
+        with db._get_connection() as conn:
+            conn.execute("INSERT INTO reservation_search (reservation_search, rank) VALUES ('integrity-check', 1)")
+
+    class V6DB(BloodReservationDB):
+        """只执行到 v6 迁移（检索索引之前）"""
+        MIGRATIONS = BloodReservationDB.MIGRATIONS[:6]
+        SCHEMA_VERSION = 6
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir) as db:
+            assert ids(db.search("辐照 光谷")) == [5]
+            assert ids(db.search("辐照 AB 光谷")) == []
+            assert ids(db.search("ab 军山")) == [4]
+            assert ids(db.search("A")) == [5, 4, 1]
+            assert ids(db.search("红细胞")) == [4, 1]
+            assert ids(db.search("血浆、光谷")) == [3]
+            assert ids(db.search("2024-11-11")) == [4, 3]
+            assert ids(db.search("东院")) == []
+            assert ids(db.search("光谷", {"start": "2024-11-11"})) == [5, 3]
+            assert ids(db.search("院区", limit=2)) == [5, 4]
+            assert db.search("  ") == db.query_reservations(limit=100)
+            assert db.search("光谷") == [row for row in db.get_all_reservations() if row[1] == "光谷院区"]
+
+            conn = db._get_connection()
+            with conn:
+                conn.execute("UPDATE reservations SET blood_type = 'B型' WHERE id = 5")
+            assert ids(db.search("AB")) == [4]
+            assert ids(db.search("B型")) == [5, 4, 2]
+            db.delete_reservation(4)
+            assert ids(db.search("AB")) == []
+            check_index(db)
+            db.clear_all_reservations()
+            assert db.search("院区") == []
+            check_index(db)
+
+        db_path = os.path.join(tmpdir, "v6.db")
+        with V6DB(db_path) as db:
+            db.add_reservations(TEST_ROWS)
+        with BloodReservationDB(db_path, progress_callback=lambda *args: None) as db:
+            assert ids(db.search("辐照 光谷")) == [5]
+            check_index(db)
+            db.add_reservation("东院区", "血小板", "辐照血小板", "O型", 1.0, "2024-11-13 09:00:00")
+            assert ids(db.search("辐照")) == [6, 5]
+    print("[OK] 全文检索")
+
+
+def test_busy_retry():
+    """其他连接长时间持有写锁：超过 busy_timeout 后退避重试，仍失败时抛出 DatabaseBusyError"""
+    profile = dict(PERFORMANCE_PROFILES["compat"], busy_timeout=50, write_retries=2,
+                   retry_backoff=0.01, retry_backoff_max=0.05)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "busy.db")
+        with BloodReservationDB(db_path, profile=profile) as db:
+            other = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+            other.execute("BEGIN IMMEDIATE")
+            try:
+                db.add_reservation(*TEST_ROWS[0])
+                assert False, "写锁一直被占用时应失败"
+            except DatabaseBusyError as e:
+                # 仍是 OperationalError，原有的错误处理照常生效
+                assert isinstance(e, sqlite3.OperationalError)
+            stats = db.lock_stats
+            assert stats["retries"] == 2 and stats["failures"] == 1
+            assert stats["contended"] == 3 and stats["wait_max"] >= 0.04
+            # 事务没有残留，其他连接释放写锁后可以正常写入
+            other.execute("ROLLBACK")
+            assert db.add_reservations([TEST_ROWS[0]]) == [1]
+
+            # 锁在重试期间释放时写入成功
+            db.profile["write_retries"] = 20
+            other.execute("BEGIN IMMEDIATE")
+            releaser = threading.Timer(0.2, other.execute, ("ROLLBACK",))
+            releaser.start()
+            db.add_reservation(*TEST_ROWS[1])
+            releaser.join()
+            assert stats["retries"] > 2 and stats["failures"] == 1
+            assert len(db.query_reservations()) == 2
+            other.close()
+    print("[OK] 写锁等待与重试")
+
+
+def test_bulk_load():
+    """大批量导入：记录、按日汇总、检索索引、变更日志与逐条写入一致，触发器和索引恢复原样"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with BloodReservationDB(os.path.join(tmpdir, "bulk.db")) as db, \
+                BloodReservationDB(os.path.join(tmpdir, "expected.db")) as expected:
+            conn = db._get_connection()
+            schema_sql = "SELECT type, name, sql FROM sqlite_master ORDER BY name"
+            schema = conn.execute(schema_sql).fetchall()
+
+            # 空表（先删除索引再重建）与已有记录（保留索引）两种情况
+            for rows in (TEST_ROWS * 3, [("东院区", "红细胞", None, "B型", 3, "2024-11-13 09:00:00")] + TEST_ROWS):
+                assert db.bulk_load(rows, chunk_size=4) == len(rows)
+                expected.add_reservations(rows)
+                assert db.get_all_reservations() == expected.get_all_reservations()
+                assert rollup_rows(db) == rollup_rows(expected)
+                assert conn.execute(schema_sql).fetchall() == schema
+                assert db.search("光谷 辐照") == expected.search("光谷 辐照")
+                assert db.get_changes_since(0) == expected.get_changes_since(0)
+            with conn:
+                conn.execute("INSERT INTO reservation_search (reservation_search, rank) VALUES ('integrity-check', 1)")
+
+            # 导入后触发器照常维护派生的表
+            db.delete_reservation(1)
+            expected.delete_reservation(1)
+            assert rollup_rows(db) == rollup_rows(expected)
+            assert db.search("光谷") == expected.search("光谷")
+
+            # 校验失败整批回滚
+            seq = db.get_change_seq()
+            try:
+                db.bulk_load(TEST_ROWS + [("光谷院区", "红细胞", "", "A型", 1, "不是时间")])
+                assert False, "应拒绝无效的记录"
+            except ValueError:
+                pass
+            assert db.get_all_reservations() == expected.get_all_reservations()
+            assert conn.execute(schema_sql).fetchall() == schema
+            assert db.get_change_seq() == seq
+
+            # 超过 CHANGE_LOG_KEEP 条时只登记最后几条，落后的读取方全量重新加载
+            db.CHANGE_LOG_KEEP = 3
+            assert db.bulk_load(TEST_ROWS) == len(TEST_ROWS)
+            latest = db.get_change_seq()
+            assert latest == seq + len(TEST_ROWS)
+            assert db.get_changes_since(seq) == (None, latest)
+            changes, _ = db.get_changes_since(latest - 3)
+            assert [res_id for _, res_id, _ in changes] == [row[0] for row in db.get_all_reservations()[2::-1]]
+            print("[OK] 大批量导入")
+
+
+def test_bulk_load_deferred_search_index():
+    """导入时不建检索索引：其余派生表照常写入，首次检索或 rebuild_search_index 时一次补建"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with BloodReservationDB(os.path.join(tmpdir, "deferred.db")) as db, \
+                BloodReservationDB(os.path.join(tmpdir, "expected.db")) as expected:
+            conn = db._get_connection()
+            schema_sql = "SELECT type, name, sql FROM sqlite_master ORDER BY name"
+            schema = conn.execute(schema_sql).fetchall()
+            assert db.search_index_ready()
+
+            rows = TEST_ROWS * 3
+            assert db.bulk_load(rows, chunk_size=4, build_search_index=False) == len(rows)
+            expected.add_reservations(rows)
+            assert not db.search_index_ready()
+            assert conn.execute("SELECT COUNT(*) FROM reservation_search_docsize").fetchone()[0] == 0
+            assert db.get_all_reservations() == expected.get_all_reservations()
+            assert rollup_rows(db) == rollup_rows(expected)
+
+            # 索引未建时继续导入、删除不受影响
+            assert db.bulk_load(TEST_ROWS, build_search_index=False) == len(TEST_ROWS)
+            expected.add_reservations(TEST_ROWS)
+            db.delete_reservation(2)
+            expected.delete_reservation(2)
+
+            # 首次检索时补建索引并恢复触发器
+            assert db.search("光谷 辐照") == expected.search("光谷 辐照")
+            assert db.search_index_ready()
+            assert conn.execute(schema_sql).fetchall() == schema
+            with conn:
+                conn.execute("INSERT INTO reservation_search (reservation_search, rank) VALUES ('integrity-check', 1)")
+
+            # 之后照常由触发器维护
+            db.add_reservation("光谷院区", "血小板", "辐照", "O型", 1, "2024-11-14 09:00:00")
+            expected.add_reservation("光谷院区", "血小板", "辐照", "O型", 1, "2024-11-14 09:00:00")
+            assert db.search("血小板 辐照") == expected.search("血小板 辐照")
+
+            # 重建结果与逐条维护的索引一致
+            db.rebuild_search_index()
+            with conn:
+                conn.execute("INSERT INTO reservation_search (reservation_search, rank) VALUES ('integrity-check', 1)")
+            assert db.search("院区", limit=100) == expected.search("院区", limit=100)
+            print("[OK] 导入时推迟建立检索索引")
+
+
+def test_batch_delete_and_reclaim_space():
+    """批量删除、按条件删除在一个事务中完成；清空并回收空间后文件变小，触发器照常工作"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir) as db:
+            seq = db.get_change_seq()
+            assert db.delete_reservations(["1", 3, 99]) == 2
+            assert db.delete_reservations([]) == 0
+            assert [row[0] for row in db.get_all_reservations()] == [5, 4, 2]
+            changes, seq = db.get_changes_since(seq)
+            assert changes == [("delete", 1, None), ("delete", 3, None)]
+
+            try:
+                db.delete_range({"campus": None})
+                assert False, "应拒绝没有筛选条件的 delete_range"
+            except ValueError:
+                pass
+            assert db.delete_range({"campus": "光谷院区", "start": "2024-11-12"}) == 1
+            assert db.delete_range({"end": date(2024, 11, 10)}) == 1
+            assert [row[0] for row in db.get_all_reservations()] == [4]
+            expected = rollup_rows(db)
+            db.rebuild_daily_rollup()
+            assert rollup_rows(db) == expected
+
+            # 新建的数据库启用了增量 auto_vacuum
+            assert db.incremental_vacuum_enabled()
+            conn = db._get_connection()
+            db.add_reservations(TEST_ROWS * 4000)
+            db.checkpoint("TRUNCATE")
+            full_size = os.path.getsize(db.db_path)
+            db.delete_range({"product_type": "红细胞"})
+            assert conn.execute("PRAGMA freelist_count").fetchone()[0] > 10
+            assert db.reclaim_space(max_pages=10, pages_per_step=4) == 10
+            assert db.reclaim_space(pages_per_step=4) > 0
+            assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+            assert os.path.getsize(db.db_path) < full_size
+
+            seq = db.get_change_seq()
+            # 剩下非红细胞的 3 种记录各 4000 条
+            assert db.clear_all_reservations(truncate=True) == 3 * 4000
+            assert os.path.getsize(db.db_path) < full_size / 4
+            assert db.get_all_reservations() == [] and rollup_rows(db) == []
+            assert db.get_changes_since(seq) == ([("clear", None, None)], seq + 1)
+            # 清空时暂时删除的触发器已恢复
+            db.add_reservation(*TEST_ROWS[3])
+            res_id = db.get_all_reservations()[0][0]
+            assert [row[0] for row in db.search("军山")] == [res_id]
+            assert rollup_rows(db) == [("2024-11-11", "军山院区", "红细胞", "洗涤红细胞", "AB型", 1, 1.5)]
+            assert db.get_changes_since(seq + 1)[0] == [("insert", res_id, db.get_reservation_by_id(res_id))]
+
+            # 旧数据库（未启用 auto_vacuum）：不能分步回收，清空时顺便转换
+            conn.execute("PRAGMA auto_vacuum = NONE")
+            conn.execute("VACUUM")
+            assert not db.incremental_vacuum_enabled()
+            assert db.reclaim_space() == 0
+            db.clear_all_reservations(truncate=True)
+            assert db.incremental_vacuum_enabled()
+            assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+            print("[OK] 批量删除与回收空间")
+
+
+def test_online_backup():
+    """在线备份：备份期间可以继续提交，副本一致且通过校验，轮换保留最近几份，可定时执行"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with make_db(tmpdir) as db:
+            db.add_reservations(TEST_ROWS * 400)
+            dest = os.path.join(tmpdir, "copy.db")
+            assert db.backup(dest) == dest
+            assert not os.path.exists(dest + ".partial")
+            # 副本为回滚日志模式的单个文件
+            conn = sqlite3.connect(dest)
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+            conn.close()
+            with BloodReservationDB(dest) as copy:
+                assert copy.get_all_reservations() == db.get_all_reservations()
+
+            # 每步只复制1页：备份进行中，其他线程的提交照常完成
+            db.start_writer()
+            for commits in (2, db.BACKUP_MAX_RESTARTS + 2):
+                committed_during_backup = []
+
+                def on_progress(remaining, total):
+                    if remaining and len(committed_during_backup) < commits:
+                        db.submit_reservation(*TEST_ROWS[0]).result()
+                        committed_during_backup.append(remaining)
+
+                before = len(db.get_all_reservations())
+                db.backup(dest, pages_per_step=1, sleep=0, progress=on_progress)
+                assert db.backup_stats["last_pages"] > 5
+                with BloodReservationDB(dest) as copy:
+                    # 副本是备份期间某一时刻的完整快照
+                    count = len(copy.get_all_reservations())
+                    assert before <= count <= before + len(committed_during_backup)
+            # 每次提交都让分步备份从头开始：第一次提交2条，重新开始2次；
+            # 第二次重新开始次数超过上限后一步复制完（之后的提交不再打断备份）
+            assert db.backup_stats["backups"] == 3
+            assert db.backup_stats["last_restarts"] == db.BACKUP_MAX_RESTARTS + 1
+            assert len(committed_during_backup) == db.BACKUP_MAX_RESTARTS + 1
+
+            backup_dir = os.path.join(tmpdir, "backups")
+            paths = [db.backup_rotating(backup_dir, keep=2) for _ in range(4)]
+            assert db.list_backups(backup_dir) == paths[:1:-1]
+            assert sorted(os.listdir(backup_dir)) == sorted(os.path.basename(path) for path in paths[2:])
+
+            try:
+                db.backup(dest, pages_per_step=0)
+                assert False, "应拒绝无效的 pages_per_step"
+            except ValueError:
+                pass
+
+            db.start_backup_schedule(backup_dir, interval=0.05, keep=3)
+            deadline = time.monotonic() + 10
+            while db.backup_stats["backups"] < 8 and time.monotonic() < deadline:
+                time.sleep(0.02)
+            assert len(db.list_backups(backup_dir)) == 3
+            backup_thread = db._backup_thread
+        assert not backup_thread.is_alive()
+    print("[OK] 在线备份")
+
+
+if __name__ == "__main__":
+    test_connection_reuse()
+    test_thread_local_connections()
+    test_close()
+    test_failed_write_rolls_back()
+    test_query_reservations()
+    test_add_reservations()
+    test_subtype_stored_consistently()
+    test_add_reservations_rejects_invalid_batch()
+    test_iter_reservations()
+    test_keyset_pagination()
+    test_aggregate()
+    test_daily_rollup_triggers()
+    test_rollup_delete_cost()
+    test_aggregate_uses_rollup_for_whole_days()
+    test_epoch_column()
+    test_epoch_backfill_on_upgrade()
+    test_get_distinct_dates()
+    test_legacy_table_rebuilt_in_batches()
+    test_migration_resumes_after_crash()
+    test_startup_skips_migrations_when_current()
+    test_performance_profiles()
+    test_configured_profile()
+    test_wal_reader_does_not_block_writer()
+    test_group_commit_writer()
+    test_writer_survives_unexpected_errors()
+    test_commit_group()
+    test_snapshot_reads()
+    test_snapshot_reads_rollback_journal()
+    test_archive_reservations()
+    test_archived_records_are_editable()
+    test_interrupted_archive_listed_once()
+    test_dictionary_encoding()
+    test_change_log()
+    test_result_cache()
+    test_search()
+    test_busy_retry()
+    test_bulk_load()
+    test_bulk_load_deferred_search_index()
+    test_batch_delete_and_reclaim_space()
+    test_online_backup()
+    print("\n[SUCCESS] 数据库管理类测试通过")
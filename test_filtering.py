@@ -153,6 +153,7 @@ def test_filtering():
 
     # 清理测试文件
     print("\n10. 清理测试文件...")
+    db.close()
     if os.path.exists("test_filtering.db"):
         os.remove("test_filtering.db")
         print("  [OK] 测试文件已清理")
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+查询计划测试
+使用 EXPLAIN QUERY PLAN 验证筛选查询命中索引，并验证索引迁移只执行一次
+"""
+
+import sys
+import os
+import sqlite3
+import tempfile
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database.db_manager import BloodReservationDB
+
+
+def query_plan(db, **filters):
+    """返回 query_reservations 实际执行的SQL的查询计划文本"""
+    conn = db._get_connection()
+    sql, params, _ = db._select_reservations(conn, filters)
+    rows = conn.execute("EXPLAIN QUERY PLAN " + sql + " ORDER BY id DESC", params).fetchall()
+    return " | ".join(row[3] for row in rows)
+
+
+def assert_uses_index(db, index_name, **filters):
+    plan = query_plan(db, **filters)
+    assert f"USING INDEX {index_name}" in plan or f"USING COVERING INDEX {index_name}" in plan, plan
+    assert "SCAN reservation_records" not in plan, plan
+    print(f"[OK] {filters} -> {index_name}")
+
+
+def list_indexes(db):
+    rows = db._get_connection().execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' "
+        "AND tbl_name IN ('reservations', 'reservation_records')"
+    ).fetchall()
+    return {row[0] for row in rows}
+
+
+def test_date_filter_uses_time_index():
+    """日期范围筛选使用 reservation_time 索引"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with BloodReservationDB(os.path.join(tmpdir, "plan.db")) as db:
+            # 列表窗口总是同时给出开始和结束日期；只有单侧边界时
+            # SQLite 可能选择按 id 倒序扫描以省去排序，这里不做要求
+            assert_uses_index(db, "idx_reservations_time", start="2024-11-10", end="2024-11-11")
+            assert_uses_index(db, "idx_reservations_time",
+                              start="2024-11-10 08:00:00", end="2024-11-10 18:00:00")
+
+
+def test_datetime_filter_uses_epoch_index():
+    """datetime 范围筛选使用整数时间戳索引"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with BloodReservationDB(os.path.join(tmpdir, "plan.db")) as db:
+            assert_uses_index(db, "idx_reservations_epoch",
+                              start=datetime(2024, 11, 10, 8), end=datetime(2024, 11, 10, 18))
+            assert_uses_index(db, "idx_reservations_epoch", start=date(2024, 11, 10), end=date(2024, 11, 11))
+
+
+def test_campus_filter_uses_campus_index():
+    """院区筛选（可带日期）使用 (hospital_campus, reservation_time) 索引"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with BloodReservationDB(os.path.join(tmpdir, "plan.db")) as db:
+            assert_uses_index(db, "idx_reservations_campus_time", campus="光谷院区")
+            assert_uses_index(db, "idx_reservations_campus_time",
+                              campus="光谷院区", start="2024-11-10", end="2024-11-11")
+
+
+def test_product_filter_uses_product_index():
+    """血制品大类筛选（可带日期）使用 (blood_product_type, reservation_time) 索引"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with BloodReservationDB(os.path.join(tmpdir, "plan.db")) as db:
+            assert_uses_index(db, "idx_reservations_product_time", product_type="红细胞")
+            assert_uses_index(db, "idx_reservations_product_time",
+                              product_type="红细胞", start="2024-11-10", end="2024-11-11")
+
+
+def test_index_migration_runs_once():
+    """索引迁移通过 user_version 记录，只执行一次"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "plan.db")
+
+        with BloodReservationDB(db_path) as db:
+            version = db._get_connection().execute("PRAGMA user_version").fetchone()[0]
+            assert version == BloodReservationDB.SCHEMA_VERSION
+            assert {"idx_reservations_time", "idx_reservations_campus_time",
+                    "idx_reservations_product_time"} <= list_indexes(db)
+            db._get_connection().execute("DROP INDEX idx_reservations_time")
+
+        # 再次打开时迁移不会重复执行
+        with BloodReservationDB(db_path) as db:
+            assert "idx_reservations_time" not in list_indexes(db)
+        print("[OK] 索引迁移只执行一次")
+
+
+def test_legacy_database_gets_indexes():
+    """旧版本数据库（user_version=0）打开时自动补建索引"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "legacy.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute('''
+            CREATE TABLE reservations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                hospital_campus TEXT NOT NULL,
+                blood_product_type TEXT NOT NULL,
+                blood_product_subtype TEXT,
+                blood_type TEXT NOT NULL,
+                quantity INTEGER NOT NULL DEFAULT 1,
+                reservation_time TEXT NOT NULL,
+                created_at TEXT
+            )
+        ''')
+        conn.execute(
+            "INSERT INTO reservations (hospital_campus, blood_product_type, blood_product_subtype, "
+            "blood_type, quantity, reservation_time) VALUES ('光谷院区', '红细胞', '悬浮红细胞', 'A型', 2, '2024-11-11 10:00:00')"
+        )
+        conn.commit()
+        conn.close()
+
+        with BloodReservationDB(db_path) as db:
+            assert len(db.get_all_reservations()) == 1
+            assert "idx_reservations_campus_time" in list_indexes(db)
+            assert_uses_index(db, "idx_reservations_campus_time", campus="光谷院区")
+
+
+if __name__ == "__main__":
+    test_date_filter_uses_time_index()
+    test_datetime_filter_uses_epoch_index()
+    test_campus_filter_uses_campus_index()
+    test_product_filter_uses_product_index()
+    test_index_migration_runs_once()
+    test_legacy_database_gets_indexes()
+    print("\n[SUCCESS] 查询计划测试通过")
@@ -135,6 +135,7 @@ def test_ui_optimization():
 
     # 清理测试文件
     print("\n8. 清理测试文件...")
+    db.close()
     if os.path.exists("test_ui_optimization.db"):
         os.remove("test_ui_optimization.db")
         print("  [OK] 测试文件已清理")
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+多工作站写入争用测试
+多个进程（模拟共用同一 records.db 的多台电脑）同时逐条提交，同时有进程持续读取；
+验证没有丢失或重复的提交，且提交延迟的 P99 有上限
+"""
+
+import sys
+import os
+import time
+import sqlite3
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database.db_manager import BloodReservationDB, PERFORMANCE_PROFILES
+
+
+WRITERS = 8
+PER_WRITER = 25
+# 提交延迟 P99 的上限（秒）：远小于 busy_timeout，说明没有提交在长时间等锁
+P99_LIMIT = 2.0
+
+
+def quiet(*args):
+    pass
+
+
+def writer_row(index, i):
+    """第 index 个写入进程的第 i 条记录（预约时间唯一，用于核对）"""
+    return ("光谷院区", "红细胞", "悬浮红细胞", "A型", 1.0, f"2024-11-{index + 1:02d} 08:{i // 60:02d}:{i % 60:02d}")
+
+
+def writer(db_path, profile, index, count, barrier, results):
+    """写入进程：与其他进程同时开始，逐条提交并记录每次提交的耗时"""
+    try:
+        with BloodReservationDB(db_path, profile=profile, progress_callback=quiet) as db:
+            barrier.wait()
+            latencies = []
+            for i in range(count):
+                start = time.perf_counter()
+                db.add_reservation(*writer_row(index, i))
+                latencies.append(time.perf_counter() - start)
+            results.put((index, latencies, dict(db.lock_stats), None))
+    except Exception as e:
+        results.put((index, [], {}, repr(e)))
+
+
+def reader(db_path, profile, stop):
+    """读取进程：持续查询（回滚日志模式下读取会让提交等待）"""
+    with BloodReservationDB(db_path, profile=profile, progress_callback=quiet) as db:
+        while not stop.is_set():
+            try:
+                db.query_reservations(campus="光谷院区")
+            except sqlite3.OperationalError:
+                # busy_timeout 很短时读取也可能等锁超时，继续读取即可
+                pass
+
+
+def run_stress(profile, writers=WRITERS, per_writer=PER_WRITER):
+    """运行一轮争用测试，返回 (全部提交延迟（已排序）, 各进程 lock_stats 合计)"""
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "shared.db")
+        BloodReservationDB(db_path, profile=profile).close()
+
+        barrier = ctx.Barrier(writers)
+        results = ctx.Queue()
+        stop = ctx.Event()
+        reader_process = ctx.Process(target=reader, args=(db_path, profile, stop))
+        processes = [ctx.Process(target=writer, args=(db_path, profile, index, per_writer, barrier, results))
+                     for index in range(writers)]
+        reader_process.start()
+        for process in processes:
+            process.start()
+        try:
+            outcomes = [results.get(timeout=120) for _ in processes]
+        finally:
+            stop.set()
+            for process in processes + [reader_process]:
+                process.join(timeout=30)
+
+        errors = [error for _, _, _, error in outcomes if error]
+        assert not errors, errors
+
+        # 没有丢失或重复的提交
+        with BloodReservationDB(db_path, profile=profile) as db:
+            times = sorted(row[6] for row in db.get_all_reservations())
+        expected = sorted(writer_row(index, i)[5] for index in range(writers) for i in range(per_writer))
+        assert times == expected
+
+        latencies = sorted(latency for _, values, _, _ in outcomes for latency in values)
+        totals = {}
+        for _, _, stats, _ in outcomes:
+            for key, value in stats.items():
+                totals[key] = max(totals.get(key, 0), value) if key == "wait_max" else totals.get(key, 0) + value
+        return latencies, totals
+
+
+def report(name, latencies, stats):
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"[OK] {name}: {len(latencies)} 条提交无丢失，P50 {p50 * 1000:.1f} ms，P99 {p99 * 1000:.1f} ms，"
+          f"等锁 {stats['contended']} 次，重试 {stats['retries']} 次")
+    return p99
+
+
+def test_concurrent_writers_rollback_journal():
+    """回滚日志模式（共享文件夹上无法使用 WAL）：8 个进程同时提交"""
+    latencies, stats = run_stress("compat")
+    assert stats["failures"] == 0
+    assert report("回滚日志 8 进程并发提交", latencies, stats) < P99_LIMIT
+
+
+def test_concurrent_writers_wal():
+    """WAL 模式：8 个进程同时提交"""
+    latencies, stats = run_stress("durable")
+    assert stats["failures"] == 0
+    assert report("WAL 8 进程并发提交", latencies, stats) < P99_LIMIT
+
+
+def test_retry_after_busy_timeout():
+    """busy_timeout 很短时，超时的提交靠退避重试完成，仍然没有丢失"""
+    profile = dict(PERFORMANCE_PROFILES["compat"], busy_timeout=5, write_retries=100,
+                   retry_backoff=0.002, retry_backoff_max=0.05)
+    latencies, stats = run_stress(profile)
+    assert stats["retries"] > 0 and stats["failures"] == 0
+    assert report("busy_timeout=5ms 退避重试", latencies, stats) < P99_LIMIT
+
+
+if __name__ == "__main__":
+    test_concurrent_writers_rollback_journal()
+    test_concurrent_writers_wal()
+    test_retry_after_busy_timeout()
+    print("\n[SUCCESS] 多工作站写入争用测试通过")
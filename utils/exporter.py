@@ -8,12 +8,13 @@
 import csv
 import os
 from datetime import datetime
-from typing import List, Tuple, Optional
+from typing import Iterable, Tuple, Optional
 import tkinter as tk
 from tkinter import filedialog, messagebox
 
 try:
     from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
     from openpyxl.styles import Font, Alignment, PatternFill
     HAS_OPENPYXL = True
 except ImportError:
@@ -49,12 +50,12 @@ class DataExporter:
         """初始化导出器"""
         self.parent = parent_window
 
-    def export_to_excel(self, data: List[Tuple], output_file: str) -> bool:
+    def export_to_excel(self, data: Iterable[Tuple], output_file: str) -> bool:
         """
         导出数据到Excel文件
 
         Args:
-            data: 数据列表，每行是一个元组
+            data: 数据列表或逐行生成器，每行是一个元组
             output_file: 输出文件路径
 
         Returns:
@@ -65,29 +66,35 @@ class DataExporter:
             return False
 
         try:
-            # 创建工作簿
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "血制品预约记录"
+            # 创建只写模式工作簿（逐行写出，内存占用与行数无关）
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet("血制品预约记录")
 
-            # 写入表头
-            for col_num, header in enumerate(self.HEADERS, 1):
-                cell = ws.cell(row=1, column=col_num, value=header)
-                cell.font = Font(bold=True, size=11)
-                cell.alignment = Alignment(horizontal='center', vertical='center')
-                cell.fill = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
-                cell.font = Font(color='FFFFFF', bold=True)
-
-            # 设置列宽
+            # 设置列宽（只写模式下必须在写入任何行之前设置）
             for col_num, header in enumerate(self.HEADERS, 1):
                 col_letter = self._get_column_letter(col_num)
                 ws.column_dimensions[col_letter].width = self.COLUMN_WIDTHS.get(header, 12)
 
-            # 写入数据
-            for row_num, row_data in enumerate(data, 2):
+            # 写入表头
+            header_cells = []
+            for header in self.HEADERS:
+                cell = WriteOnlyCell(ws, value=header)
+                cell.font = Font(color='FFFFFF', bold=True)
+                cell.alignment = Alignment(horizontal='center', vertical='center')
+                cell.fill = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
+                header_cells.append(cell)
+            ws.append(header_cells)
+
+            # 写入数据（data 可以是列表，也可以是 iter_reservations 生成器）
+            center = Alignment(horizontal='center', vertical='center')
+            left = Alignment(horizontal='left', vertical='center')
+            for row_data in data:
+                row_cells = []
                 for col_num, cell_value in enumerate(row_data, 1):
-                    cell = ws.cell(row=row_num, column=col_num, value=cell_value)
-                    cell.alignment = Alignment(horizontal='center' if col_num != 2 else 'left', vertical='center')
+                    cell = WriteOnlyCell(ws, value=cell_value)
+                    cell.alignment = center if col_num != 2 else left
+                    row_cells.append(cell)
+                ws.append(row_cells)
 
             # 保存文件
             wb.save(output_file)
@@ -98,12 +105,12 @@ class DataExporter:
             self._show_error("导出失败", f"导出Excel时发生错误：\n{str(e)}")
             return False
 
-    def export_to_csv(self, data: List[Tuple], output_file: str) -> bool:
+    def export_to_csv(self, data: Iterable[Tuple], output_file: str) -> bool:
         """
         导出数据到CSV文件
 
         Args:
-            data: 数据列表，每行是一个元组
+            data: 数据列表或逐行生成器，每行是一个元组
             output_file: 输出文件路径
 
         Returns:
@@ -124,12 +131,12 @@ class DataExporter:
             self._show_error("导出失败", f"导出CSV时发生错误：\n{str(e)}")
             return False
 
-    def export_data(self, data: List[Tuple], file_format: str = "xlsx") -> bool:
+    def export_data(self, data: Iterable[Tuple], file_format: str = "xlsx") -> bool:
         """
         导出数据（根据格式自动选择）
 
         Args:
-            data: 数据列表
+            data: 数据列表或逐行生成器
             file_format: 文件格式，"xlsx" 或 "csv"
 
         Returns:
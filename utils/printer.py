@@ -11,6 +11,9 @@ from datetime import datetime
 class BloodReservationPrinter:
     """血制品预约打印类"""
 
+    # 汇总表每个表格块的最大行数（过大的单个表格会让reportlab分页非常慢）
+    SUMMARY_CHUNK_ROWS = 500
+
     def __init__(self):
         """初始化打印配置"""
         self.styles = getSampleStyleSheet()
@@ -158,11 +161,16 @@ class BloodReservationPrinter:
         """
         打印所有预约记录
 
+        reportlab 在 doc.build 时才排版，整个文档的表格都在内存中，内存随记录数线性增长。
+        传入生成器（如 iter_reservations(snapshot=True)）时先全部读出再排版，
+        读取结束即释放快照，排版期间不占用数据库的读锁。
+
         Args:
-            reservations_list: 预约记录列表
+            reservations_list: 预约记录列表，或 iter_reservations 返回的生成器
             output_file: 输出文件路径（可选）
         """
-        if not reservations_list:
+        reservations = list(reservations_list)
+        if not reservations:
             print("没有预约记录可打印")
             return None
 
@@ -190,12 +198,10 @@ class BloodReservationPrinter:
         title = Paragraph("血制品预约记录汇总", title_style)
         story.append(title)
 
-        # 表头
-        headers = ['预约编号', '院区', '血制品大类', '血制品亚类', '血型', '数量', '预约时间']
-        data = [[Paragraph(header, self.chinese_style) for header in headers]]
-
-        # 添加数据行
-        for res in reservations_list:
+        # 添加数据行（按块生成表格）
+        data = []
+        total_count = 0
+        for res in reservations:
             # 当前版本是7个字段（已删除created_at）
             # res: (id, hospital_campus, blood_product_type, blood_product_subtype, blood_type, quantity, reservation_time)
             if len(res) == 7:
@@ -217,29 +223,42 @@ class BloodReservationPrinter:
                 Paragraph(str(quantity), self.chinese_style),
                 Paragraph(reservation_time, self.chinese_style)
             ])
+            total_count += 1
 
-        # 创建表格
-        table = Table(data, colWidths=[1.5*cm, 2*cm, 2*cm, 2*cm, 1.5*cm, 1*cm, 2.5*cm])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
+            if len(data) >= self.SUMMARY_CHUNK_ROWS:
+                story.append(self._make_summary_table(data))
+                data = []
 
-        story.append(table)
+        if data:
+            story.append(self._make_summary_table(data))
 
         # 打印时间
         print_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         story.append(Spacer(1, 1*cm))
         story.append(Paragraph(f"打印时间: {print_time}", self.styles['Normal']))
-        story.append(Paragraph(f"总记录数: {len(reservations_list)}", self.styles['Normal']))
+        story.append(Paragraph(f"总记录数: {total_count}", self.styles['Normal']))
 
         # 生成PDF
         doc.build(story)
 
         return output_file
+
+    def _make_summary_table(self, rows):
+        """为一块数据行创建带表头的汇总表格"""
+        # 表头
+        headers = ['预约编号', '院区', '血制品大类', '血制品亚类', '血型', '数量', '预约时间']
+        data = [[Paragraph(header, self.chinese_style) for header in headers]] + rows
+
+        # 创建表格
+        table = Table(data, colWidths=[1.5*cm, 2*cm, 2*cm, 2*cm, 1.5*cm, 1*cm, 2.5*cm], repeatRows=1)
+        table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 8),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+        return table